@@ -11,6 +11,8 @@ from datetime import datetime
 from pathlib import Path
 import logging
 
+from utils.artifact_index import artifact_index
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,8 +32,14 @@ for folder in [UPLOAD_FOLDER, LABELED_FOLDER, MODELS_FOLDER, REPORTS_FOLDER]:
     Path(folder).mkdir(exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['LABELED_FOLDER'] = LABELED_FOLDER
+app.config['MODELS_FOLDER'] = MODELS_FOLDER
+app.config['REPORTS_FOLDER'] = REPORTS_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max
 
+# Index artifacts once; writers and mtime checks keep it current afterwards
+artifact_index.rebuild([UPLOAD_FOLDER, LABELED_FOLDER, MODELS_FOLDER, REPORTS_FOLDER])
+
 # Import routes
 from routes.predict import predict_bp
 from routes.relabel import relabel_bp
@@ -39,6 +47,9 @@ from routes.validate import validate_bp
 from routes.train import train_bp
 from routes.report import report_bp
 from routes.feedback import feedback_bp
+from routes.dashboard import dashboard_bp
+from routes.events import events_bp
+from routes.models import models_bp
 
 # Register blueprints
 app.register_blueprint(predict_bp)
@@ -47,6 +58,9 @@ app.register_blueprint(validate_bp)
 app.register_blueprint(train_bp)
 app.register_blueprint(report_bp)
 app.register_blueprint(feedback_bp)
+app.register_blueprint(dashboard_bp)
+app.register_blueprint(events_bp)
+app.register_blueprint(models_bp)
 
 # ============================================================================
 # HOME ROUTES
@@ -95,14 +109,20 @@ def serve_upload(filename):
 
 @app.route('/api/status', methods=['GET'])
 def get_status():
-    """Get system status"""
+    """Get system status (served from the artifact index, no directory listing)"""
     try:
+        if request.args.get('refresh', '').lower() in ('1', 'true'):
+            artifact_index.rebuild([UPLOAD_FOLDER, LABELED_FOLDER, MODELS_FOLDER, REPORTS_FOLDER])
+        else:
+            artifact_index.refresh(force=True)
+        
         return jsonify({
             'status': 'ok',
             'timestamp': datetime.now().isoformat(),
-            'uploads_available': len(os.listdir(UPLOAD_FOLDER)),
-            'labeled_data_available': len(os.listdir(LABELED_FOLDER)),
-            'models_available': len(os.listdir(MODELS_FOLDER)),
+            'uploads_available': artifact_index.count(UPLOAD_FOLDER),
+            'labeled_data_available': artifact_index.count(LABELED_FOLDER),
+            'models_available': artifact_index.count(MODELS_FOLDER, 'model'),
+            'artifacts': artifact_index.snapshot(),
         })
     except Exception as e:
         logger.error(f"Status error: {str(e)}")
@@ -134,4 +154,4 @@ if __name__ == '__main__':
     logger.info('Starting Flask API...')
     logger.info(f'Upload folder: {UPLOAD_FOLDER}')
     logger.info(f'Labeled data folder: {LABELED_FOLDER}')
-    app.run(debug=False, host='0.0.0.0', port=5000)
+    app.run(debug=False, host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,60 @@
+"""
+Auto-tuning de l'entraînement CPU
+Mesure le débit (images/s) de l'entraînement sur cette machine pour plusieurs
+tailles de modèle, tailles d'image, batchs et nombres de workers, puis propose
+un preset qui tient dans la mémoire et le temps cible. Les mesures sont mises
+en cache par empreinte de l'hôte (training_data/autotune/).
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+from utils.cpu_autotuner import CPUAutoTuner, training_images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preset d'entraînement CPU mesuré sur cette machine")
+    parser.add_argument("--data", default="data.yaml")
+    parser.add_argument("--images", type=int, help="Images par epoch (défaut: celles de --data)")
+    parser.add_argument("--epochs", type=int, help="Epochs voulues (défaut: preset selon la taille du dataset)")
+    parser.add_argument("--target-minutes", type=float, default=30, help="Durée cible de l'entraînement")
+    parser.add_argument("--memory-limit-mb", type=int, help="Mémoire maximale (défaut: 70%% de la disponible)")
+    parser.add_argument("--force", action="store_true", help="Refaire toutes les mesures")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    print("=" * 80)
+    print("🧪 AUTO-TUNING ENTRAÎNEMENT CPU")
+    print("=" * 80)
+
+    tuner = CPUAutoTuner(data_yaml=args.data)
+    print(f"Hôte {tuner.fingerprint}: {json.dumps(tuner.host)}")
+    if tuner.cache_path.exists() and not args.force:
+        print(f"♻️  Mesures en cache: {tuner.cache_path}")
+
+    nombre = args.images or len(training_images(args.data))
+    if not nombre:
+        print("❌ Aucune image d'entraînement: précisez --images")
+        return 1
+
+    preset = tuner.tune(nombre, epochs=args.epochs, target_minutes=args.target_minutes,
+                        memory_limit_mb=args.memory_limit_mb, force=args.force)
+
+    details = preset["autotune"]
+    print("\n" + "=" * 80)
+    print(f"Modèle {preset['model_size']} | imgsz {preset['img_size']} | batch {preset['batch_size']} | "
+          f"workers {preset['workers']} | threads {preset['threads']}")
+    print(f"{details['images_per_second']} img/s -> {details['epoch_seconds']} s/epoch, "
+          f"{preset['epochs']} epochs ≈ {details['estimated_minutes']} min (cible {details['target_minutes']} min)")
+    print(f"Mémoire max ≈ {details['peak_memory_mb']} MB / {details['memory_limit_mb']} MB, "
+          f"goulot: {details['bottleneck']}")
+    print("✅ Cible respectée" if details["meets_target"] else "⚠️  Cible impossible: epochs réduites")
+    print("\n" + json.dumps(preset, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
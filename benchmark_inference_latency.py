@@ -0,0 +1,149 @@
+"""
+Benchmark de latence de l'inférence pendant un ré-entraînement
+Mesure p50/p95 au repos puis pendant un entraînement lancé comme par /api/train
+(processus séparé, threads/affinité/nice de config.TRAINING_RESOURCES) et
+vérifie le budget de config.INFERENCE_LATENCY_BUDGET.
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from ultralytics import YOLO
+
+from config import INFERENCE_LATENCY_BUDGET, TRAINING_RESOURCES
+from utils.training_jobs import TrainingJobStore, TrainingLauncher, ACTIVE_STATUSES
+
+PROJECT_DIR = Path(__file__).parent
+REPORTS_DIR = PROJECT_DIR / "reports"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def charger_images(dossiers, nombre):
+    """Images de test (chemins), ou images synthétiques si aucune n'est trouvée"""
+    chemins = []
+    for dossier in dossiers:
+        dossier = PROJECT_DIR / dossier
+        if dossier.is_dir():
+            chemins += sorted(p for p in dossier.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if chemins:
+        return [str(p) for p in chemins[:nombre]]
+
+    print("⚠️  Aucune image trouvée, utilisation d'images synthétiques 640x640")
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, (640, 640, 3), dtype=np.uint8) for _ in range(min(nombre, 8))]
+
+
+def mesurer(model, images, requetes, conf):
+    """Latences (ms) de `requetes` prédictions successives"""
+    latences = []
+    for i in range(requetes):
+        debut = time.perf_counter()
+        model.predict(images[i % len(images)], conf=conf, verbose=False)
+        latences.append((time.perf_counter() - debut) * 1000)
+    return latences
+
+
+def resume(latences):
+    return {
+        "requests": len(latences),
+        "p50_ms": round(float(np.percentile(latences, 50)), 1),
+        "p95_ms": round(float(np.percentile(latences, 95)), 1),
+        "max_ms": round(float(np.max(latences)), 1),
+    }
+
+
+def attendre_entrainement(store, job_id, timeout):
+    """Attendre que le job soit dans sa boucle d'entraînement (dataset prêt, trainer démarré)"""
+    limite = time.time() + timeout
+    while time.time() < limite:
+        job = store.get(job_id)
+        if job["status"] not in ACTIVE_STATUSES:
+            return False
+        if job["state"].get("phase") not in (None, "preparing"):
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latence d'inférence pendant un ré-entraînement")
+    parser.add_argument("--model", default="models/yolov8n-seg_trained.pt", help="Modèle servi")
+    parser.add_argument("--images", nargs="+", default=["uploads", "test/images", "valid/images"])
+    parser.add_argument("--requests", type=int, default=100, help="Prédictions par phase")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--epochs", type=int, default=50, help="Époques du ré-entraînement de charge")
+    parser.add_argument("--p95-budget-ms", type=float, default=INFERENCE_LATENCY_BUDGET["p95_ms"])
+    parser.add_argument("--max-slowdown", type=float, default=INFERENCE_LATENCY_BUDGET["max_p95_slowdown"])
+    parser.add_argument("--jobs-db", default="training_data/jobs.db")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("⏱️  BENCHMARK LATENCE INFÉRENCE / RÉ-ENTRAÎNEMENT")
+    print("=" * 80)
+
+    model = YOLO(args.model if Path(args.model).exists() else "yolov8n-seg.pt")
+    images = charger_images(args.images, args.requests)
+    mesurer(model, images, args.warmup, args.conf)
+
+    print(f"\n📊 Phase 1: {args.requests} prédictions au repos...")
+    repos = resume(mesurer(model, images, args.requests, args.conf))
+    print(f"   p50={repos['p50_ms']} ms  p95={repos['p95_ms']} ms")
+
+    store = TrainingJobStore(args.jobs_db)
+    launcher = TrainingLauncher(store, TRAINING_RESOURCES)
+    job = launcher.start({"num_epochs": args.epochs, "learning_rate": 0.001, "batch_size": 4})
+    if job is None:
+        print("❌ Un entraînement est déjà en cours, benchmark impossible")
+        return 2
+
+    try:
+        print(f"\n🚀 Ré-entraînement lancé (job {job['job_id']}, ressources {TRAINING_RESOURCES})")
+        if not attendre_entrainement(store, job["job_id"], timeout=600):
+            print(f"❌ L'entraînement n'a pas démarré: {store.get(job['job_id'])['state'].get('logs')}")
+            return 2
+
+        print(f"\n📊 Phase 2: {args.requests} prédictions pendant l'entraînement...")
+        charge = resume(mesurer(model, images, args.requests, args.conf))
+        print(f"   p50={charge['p50_ms']} ms  p95={charge['p95_ms']} ms")
+        statut = store.get(job["job_id"])["status"]
+        if statut not in ACTIVE_STATUSES:
+            print(f"⚠️  L'entraînement s'est terminé pendant la mesure ({statut}), augmentez --epochs")
+    finally:
+        launcher.cancel(job["job_id"])
+        while store.get(job["job_id"])["status"] in ACTIVE_STATUSES:
+            time.sleep(0.5)
+
+    ralentissement = charge["p95_ms"] / repos["p95_ms"] if repos["p95_ms"] else float("inf")
+    succes = charge["p95_ms"] <= args.p95_budget_ms and ralentissement <= args.max_slowdown
+
+    rapport = {
+        "timestamp": datetime.now().isoformat(),
+        "model": args.model,
+        "training_resources": TRAINING_RESOURCES,
+        "budget": {"p95_ms": args.p95_budget_ms, "max_p95_slowdown": args.max_slowdown},
+        "idle": repos,
+        "during_training": charge,
+        "p95_slowdown": round(ralentissement, 2),
+        "passed": succes,
+    }
+    REPORTS_DIR.mkdir(exist_ok=True)
+    chemin = REPORTS_DIR / f"latency_benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(chemin, "w") as f:
+        json.dump(rapport, f, indent=2)
+
+    print("\n" + "=" * 80)
+    print(f"p95 au repos: {repos['p95_ms']} ms | pendant l'entraînement: {charge['p95_ms']} ms "
+          f"(x{ralentissement:.2f})")
+    print(f"Budget: p95 <= {args.p95_budget_ms} ms et x{args.max_slowdown} max")
+    print(("✅ BUDGET RESPECTÉ" if succes else "❌ BUDGET DÉPASSÉ") + f" - rapport: {chemin}")
+    return 0 if succes else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
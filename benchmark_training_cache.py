@@ -0,0 +1,163 @@
+"""
+Benchmark du cache d'images prétraitées (utils/image_cache.py)
+Compare le chargement des images (décodage JPEG + redimensionnement vs memmap)
+puis la durée des epochs d'entraînement CPU sans cache, avec un cache froid
+et avec un cache chaud (réutilisé d'un lancement à l'autre).
+"""
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import yaml
+from ultralytics import YOLO
+
+from config import TRAINING_CACHE
+from utils.image_cache import ImageCache, cached_trainer, resize_image
+
+PROJECT_DIR = Path(__file__).parent
+REPORTS_DIR = PROJECT_DIR / "reports"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def images_du_dataset(data_yaml):
+    """Images d'entraînement listées par data.yaml (dossiers ou listes .txt)"""
+    with open(data_yaml, "r") as f:
+        data = yaml.safe_load(f) or {}
+    train = data.get("train")
+    chemins = []
+    for entree in train if isinstance(train, list) else [train]:
+        for candidat in (Path(data_yaml).parent / entree, Path(data_yaml).parent / entree.replace("../", "", 1)):
+            if candidat.is_dir():
+                chemins += sorted(p for p in candidat.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+                break
+            if candidat.suffix == ".txt" and candidat.is_file():
+                chemins += [Path(l.strip()) for l in candidat.read_text().splitlines() if l.strip()]
+                break
+    return [str(p) for p in chemins]
+
+
+def mesurer_chargement(images, imgsz, racine):
+    """Images/s: décodage + resize à chaque lecture vs lecture du memmap"""
+    debut = time.perf_counter()
+    for chemin in images:
+        resize_image(chemin, imgsz)
+    decodage = time.perf_counter() - debut
+
+    cache = ImageCache(racine, "benchmark_load", imgsz)
+    debut = time.perf_counter()
+    stats = cache.prepare(images)
+    construction = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    for chemin in images:
+        cache.get(chemin)
+    lecture = time.perf_counter() - debut
+
+    return {
+        "images": len(images),
+        "decode_images_per_s": round(len(images) / decodage, 1),
+        "cache_build_seconds": round(construction, 2),
+        "cache_build_stats": stats,
+        "memmap_images_per_s": round(len(images) / lecture, 1),
+        "speedup": round(decodage / lecture, 1) if lecture else None,
+    }
+
+
+def mesurer_epochs(modele, data_yaml, epochs, imgsz, batch, workers, trainer=None):
+    """Durée (s) de la partie entraînement de chaque epoch"""
+    model = YOLO(modele)
+    durees = []
+    debut = {}
+    model.add_callback("on_train_epoch_start", lambda t: debut.update(t=time.perf_counter()))
+    model.add_callback("on_train_epoch_end", lambda t: durees.append(time.perf_counter() - debut["t"]))
+
+    options = {"trainer": trainer} if trainer else {}
+    avant = time.perf_counter()
+    model.train(data=data_yaml, epochs=epochs, imgsz=imgsz, batch=batch, device="cpu", workers=workers,
+                val=False, plots=False, save=False, verbose=False, project=tempfile.mkdtemp(), **options)
+    return {
+        "epoch_seconds": [round(d, 2) for d in durees],
+        "mean_epoch_seconds": round(float(np.mean(durees)), 2) if durees else None,
+        "total_seconds": round(time.perf_counter() - avant, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gain du cache d'images sur la durée des epochs")
+    parser.add_argument("--data", default="data.yaml")
+    parser.add_argument("--model", default="yolov8n-seg.pt")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--imgsz", type=int, default=320)
+    parser.add_argument("--batch", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=TRAINING_CACHE["loader_workers"])
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("🗄️  BENCHMARK CACHE D'IMAGES (memmap)")
+    print("=" * 80)
+
+    images = images_du_dataset(args.data)
+    if not images:
+        print(f"❌ Aucune image d'entraînement trouvée via {args.data}")
+        return 1
+
+    racine = Path(tempfile.mkdtemp(prefix="image_cache_bench_"))
+    try:
+        print(f"\n📊 Phase 1: chargement de {len(images)} images (imgsz={args.imgsz})...")
+        chargement = mesurer_chargement(images, args.imgsz, racine)
+        print(f"   décodage: {chargement['decode_images_per_s']} img/s | "
+              f"memmap: {chargement['memmap_images_per_s']} img/s (x{chargement['speedup']})")
+
+        print(f"\n📊 Phase 2: {args.epochs} epochs sans cache (workers={args.workers})...")
+        sans_cache = mesurer_epochs(args.model, args.data, args.epochs, args.imgsz, args.batch, args.workers)
+        print(f"   epoch moyenne: {sans_cache['mean_epoch_seconds']} s")
+
+        print("\n📊 Phase 3: avec cache froid (construit au démarrage)...")
+        trainer = cached_trainer("benchmark", str(racine))
+        froid = mesurer_epochs(args.model, args.data, args.epochs, args.imgsz, args.batch, args.workers, trainer)
+        print(f"   epoch moyenne: {froid['mean_epoch_seconds']} s, total {froid['total_seconds']} s")
+
+        print("\n📊 Phase 4: avec cache chaud (réutilisé)...")
+        chaud = mesurer_epochs(args.model, args.data, args.epochs, args.imgsz, args.batch, args.workers, trainer)
+        print(f"   epoch moyenne: {chaud['mean_epoch_seconds']} s, total {chaud['total_seconds']} s")
+    finally:
+        shutil.rmtree(racine, ignore_errors=True)
+
+    reduction = None
+    if sans_cache["mean_epoch_seconds"] and chaud["mean_epoch_seconds"]:
+        reduction = round(1 - chaud["mean_epoch_seconds"] / sans_cache["mean_epoch_seconds"], 3)
+
+    rapport = {
+        "timestamp": datetime.now().isoformat(),
+        "data": args.data,
+        "imgsz": args.imgsz,
+        "batch": args.batch,
+        "workers": args.workers,
+        "loading": chargement,
+        "no_cache": sans_cache,
+        "cold_cache": froid,
+        "warm_cache": chaud,
+        "epoch_time_reduction": reduction,
+    }
+    REPORTS_DIR.mkdir(exist_ok=True)
+    chemin = REPORTS_DIR / f"training_cache_benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(chemin, "w") as f:
+        json.dump(rapport, f, indent=2)
+
+    print("\n" + "=" * 80)
+    print(f"Epoch moyenne: {sans_cache['mean_epoch_seconds']} s sans cache -> "
+          f"{chaud['mean_epoch_seconds']} s avec cache"
+          + (f" (-{reduction * 100:.0f}%)" if reduction is not None else ""))
+    print(f"✅ Rapport: {chemin}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -198,6 +198,102 @@ INFERENCE_CONFIG = {
     "agnostic": False,          # Class-agnostic NMS
 }
 
+# ============================
+# RESSOURCES DU RÉ-ENTRAÎNEMENT
+# ============================
+
+# Le ré-entraînement tourne dans un processus séparé, limité pour ne pas
+# affamer l'inférence servie par Flask
+TRAINING_RESOURCES = {
+    "threads": None,                # Threads torch (None = un par CPU attribué)
+    "cpus": None,                   # Liste de CPU (None = tous sauf ceux réservés)
+    "reserved_inference_cpus": 2,   # CPU laissés à l'inférence quand cpus est None
+    "nice": 10,                     # Priorité plus basse que le serveur
+}
+
+# Fine-tuning incrémental (mode "finetune" de /api/train): backbone gelé,
+# nouveaux labels + échantillon de rejeu stratifié des anciennes données
+FINE_TUNE_CONFIG = {
+    "freeze": 10,                   # Couches gelées (0-9 = backbone YOLOv8n-seg)
+    "replay_size": 200,             # Images anciennes rejouées (stratifiées par classes)
+    "time_budget_minutes": 10,      # Budget de la boucle d'entraînement
+    "min_epochs": 1,
+    "max_epochs": 30,
+    "learning_rate": 0.0005,
+    "imgsz": 320,
+    "max_map_drop": 0.01,           # Baisse de mAP50-95 tolérée avant de refuser le déploiement
+}
+
+# Cache d'images prétraitées (redimensionnées, uint8, memmap) par version de
+# dataset et imgsz: décodées une seule fois, partagées par les workers du
+# dataloader et réutilisées d'un entraînement à l'autre
+TRAINING_CACHE = {
+    "enabled": True,
+    "root": "training_data/image_cache",
+    "keep": 4,                      # Caches conservés sur disque
+    "loader_workers": 2,            # Workers du dataloader (lisent le même memmap)
+}
+
+# Auto-tuning CPU (utils/cpu_autotuner.py, autotune_cpu.py): candidats mesurés
+# sur la machine, mesures mises en cache par empreinte de l'hôte
+AUTOTUNE_CONFIG = {
+    "model_sizes": ["n", "s"],
+    "img_sizes": [320, 416, 640],
+    "batch_sizes": [2, 4, 8, 16],
+    "workers": [0, 1, 2, 4],        # Workers du dataloader
+    "steps": 3,                     # Pas mesurés par candidat (après 1 pas de chauffe)
+    "memory_fraction": 0.7,         # Part de la mémoire disponible utilisable par défaut
+}
+
+# Recherche d'hyperparamètres (utils/hparam_search.py, hyperparameter_search.py):
+# essais parallèles sur des groupes de CPU, élagués par successive halving (ASHA)
+HPARAM_SEARCH = {
+    # Espace de recherche: noms des presets de ce fichier + tailles compatibles CPU
+    "profiles": ["FAST_TRAINING", "BALANCED_TRAINING", "HIGH_QUALITY_TRAINING", "MEMORY_EFFICIENT_PRESET"],
+    "augmentations": ["LIGHT_AUGMENTATION", "STANDARD_AUGMENTATION", "AGGRESSIVE_AUGMENTATION"],
+    "optimizers": ["SGD_CONFIG", "ADAM_CONFIG"],
+    "model_sizes": ["n", "s"],
+    "img_sizes": [320, 416],
+    "batch_sizes": [4, 8],
+    "lr_scale": [0.5, 2.0],         # Facteur log-uniforme sur le learning rate du profil
+    "trials": 12,
+    "parallel": 3,                  # Essais simultanés (CPU partagés en autant de groupes)
+    "seed": 0,
+    # ASHA: paliers à min_epochs * eta^k, seul le meilleur 1/eta continue
+    "min_epochs": 3,
+    "max_epochs": 27,
+    "eta": 3,
+    "metric": "metrics/mAP50-95(M)",
+    "latency_images": 20,           # Images de validation pour la latence CPU
+    "baseline_img_size": 320,       # imgsz d'évaluation du modèle servi
+    "cache_name": "base",           # Cache d'images partagé (TRAINING_CACHE)
+}
+
+# Distillation (mode "distill" de /api/train, distill_model.py): un grand modèle
+# (teacher) entraîné avec HIGH_QUALITY_TRAINING ou PRODUCTION_TRAINING étiquette
+# les images non validées; ses prédictions sont calculées une seule fois et mises
+# en cache, le modèle nano servi (student) s'entraîne dessus
+DISTILLATION_CONFIG = {
+    "teacher": "models/teacher_yolov8l-seg.pt",
+    "teacher_preset": "HIGH_QUALITY_TRAINING",  # Preset de distill_model.py --train-teacher
+    "teacher_imgsz": 640,           # imgsz des prédictions du teacher (et de son évaluation)
+    "conf": 0.5,                    # Confiance minimale d'un pseudo-label
+    "unlabeled_dirs": ["uploads"],  # Images sans label validé
+    "cache_root": "training_data/teacher_cache",
+    "epochs": 30,
+    "learning_rate": 0.001,
+    "imgsz": 320,                   # imgsz du student (celui du service)
+    "max_map_drop": 0.01,           # Baisse de mAP50-95 tolérée avant de refuser le déploiement
+    "latency_images": 20,           # Images de validation pour la latence CPU
+}
+
+# Budget de latence de l'inférence pendant un ré-entraînement
+# (vérifié par benchmark_inference_latency.py)
+INFERENCE_LATENCY_BUDGET = {
+    "p95_ms": 1500,                 # p95 absolu maximal
+    "max_p95_slowdown": 1.5,        # p95 pendant / p95 au repos maximal
+}
+
 # ============================
 # HELPER FUNCTIONS
 # ============================
@@ -211,6 +307,13 @@ def get_config_for_dataset_size(num_images: int):
     else:
         return HIGH_QUALITY_TRAINING
 
+def get_config_for_host(num_images: int, epochs: int = None, target_minutes: float = 30,
+                        memory_limit_mb: int = None):
+    """Configuration CPU mesurée sur cette machine (voir utils/cpu_autotuner.py)"""
+    from utils.cpu_autotuner import CPUAutoTuner
+    return CPUAutoTuner().tune(num_images, epochs=epochs, target_minutes=target_minutes,
+                               memory_limit_mb=memory_limit_mb)
+
 def get_config_for_gpu_memory(memory_gb: int):
     """Recommander une configuration basée sur la mémoire GPU"""
     if memory_gb < 4:
@@ -0,0 +1,82 @@
+"""
+Distillation d'un grand modèle (teacher) vers le modèle nano servi (student)
+Le teacher, entraîné avec un preset large de config.py, étiquette une seule fois
+les images non validées (prédictions en cache disque); le student s'entraîne sur
+le dataset + ces pseudo-labels. Le rapport compare précision et latence CPU du
+teacher, du modèle servi et du student.
+"""
+
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+
+from config import DISTILLATION_CONFIG
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distillation teacher -> YOLOv8n-seg")
+    parser.add_argument("--train-teacher", metavar="PRESET", nargs="?", const=DISTILLATION_CONFIG["teacher_preset"],
+                        help="Entraîner d'abord le teacher avec ce preset (défaut: config.DISTILLATION_CONFIG)")
+    parser.add_argument("--teacher-epochs", type=int, help="Epochs du teacher (défaut: celles du preset)")
+    parser.add_argument("--data", default="data.yaml", help="Dataset du teacher")
+    parser.add_argument("--teacher", help="Poids du teacher (défaut: config.DISTILLATION_CONFIG)")
+    parser.add_argument("--conf", type=float, help="Confiance minimale d'un pseudo-label")
+    parser.add_argument("--epochs", type=int, help="Epochs du student")
+    parser.add_argument("--model", default="models/yolov8n-seg_trained.pt", help="Modèle servi (student)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    print("=" * 80)
+    print("🎓 DISTILLATION TEACHER -> NANO")
+    print("=" * 80)
+
+    reglages = {
+        cle: valeur for cle, valeur in {
+            "teacher": args.teacher, "conf": args.conf, "epochs": args.epochs,
+        }.items() if valeur is not None
+    }
+
+    if args.train_teacher:
+        from utils.distillation import train_teacher
+
+        print(f"\n📚 Entraînement du teacher ({args.train_teacher})...")
+        reglages["teacher"] = str(train_teacher(args.train_teacher, args.data,
+                                                output=args.teacher, epochs=args.teacher_epochs))
+        print(f"   teacher: {reglages['teacher']}")
+
+    teacher = reglages.get("teacher", DISTILLATION_CONFIG["teacher"])
+    if not Path(teacher).exists():
+        print(f"❌ Teacher introuvable: {teacher} (utiliser --train-teacher)")
+        return 1
+
+    from utils.retrain_pipeline import RetrainingPipeline
+
+    print(f"\n🚀 Entraînement du student: {reglages}")
+    resultat = RetrainingPipeline(args.model).retrain(mode="distill", distill=reglages)
+
+    evaluation = resultat["evaluation"]
+    compromis = evaluation["tradeoff"]
+    print("\n" + "=" * 80)
+    print(json.dumps(resultat["distillation"], indent=2))
+    print(f"\n{'modèle':<10} {'imgsz':>6} {'mAP50-95(B)':>12} {'mAP50-95(M)':>12} {'ms':>8}  poids")
+    for nom, ligne in compromis["models"].items():
+        print(f"{nom:<10} {ligne['imgsz']:>6} {ligne['mAP50-95(B)'] if ligne['mAP50-95(B)'] is not None else '-':>12} "
+              f"{ligne['mAP50-95(M)'] if ligne['mAP50-95(M)'] is not None else '-':>12} "
+              f"{ligne['latency_ms'] if ligne['latency_ms'] is not None else '-':>8}  {ligne['weights']}")
+    if compromis["gap_closed"] is not None:
+        print(f"\nÉcart teacher/modèle servi comblé: {compromis['gap_closed'] * 100:.0f}%")
+    if compromis["speedup"] is not None:
+        print(f"Student {compromis['speedup']}x plus rapide que le teacher")
+    print(f"Rapport: {evaluation['report_path']}")
+    if evaluation["regression"]:
+        print(f"❌ Régression détectée, modèle {resultat['model_version']} non déployé")
+    else:
+        print(f"✅ Modèle {resultat['model_version']} déployé ({resultat['deployment']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
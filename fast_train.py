@@ -11,6 +11,8 @@ from datetime import datetime
 try:
     from ultralytics import YOLO
     import torch
+    from config import TRAINING_CACHE
+    from utils.image_cache import cached_trainer
 except ImportError as e:
     print(f"❌ Erreur d'import: {e}")
     print("Exécutez d'abord: python simple_setup.py")
@@ -60,7 +62,7 @@ def main():
         "save": True,
         "val": True,
         "verbose": False,      # Moins de logs
-        "workers": 0,          # Pas de workers (CPU)
+        "workers": TRAINING_CACHE["loader_workers"],  # Images lues dans le cache memmap partagé
         "augment": False,      # Pas d'augmentation (+ rapide)
         "mosaic": 0.0,         # Pas de mosaic (+ rapide)
     }
@@ -69,6 +71,10 @@ def main():
     for key, val in config.items():
         print(f"   {key:15} = {val}")
     
+    # Images décodées/redimensionnées une seule fois (réutilisées aux prochains lancements)
+    if TRAINING_CACHE["enabled"]:
+        config["trainer"] = cached_trainer("base", TRAINING_CACHE["root"], TRAINING_CACHE["keep"])
+    
     # Entraînement
     print("\n" + "=" * 80)
     print("⏳ Entraînement en cours... (~2-3 minutes)")
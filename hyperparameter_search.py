@@ -0,0 +1,63 @@
+"""
+Recherche d'hyperparamètres parallèle (ASHA)
+Échantillonne des combinaisons des presets de config.py (profil, augmentation,
+optimiseur) et de tailles compatibles CPU, lance les essais en parallèle sur
+des groupes de CPU et arrête tôt les plus faibles (successive halving).
+Le classement compare précision et latence CPU au modèle servi.
+"""
+
+import argparse
+import logging
+import sys
+
+from utils.hparam_search import HyperparameterSearch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recherche d'hyperparamètres parallèle avec ASHA")
+    parser.add_argument("--data", default="data.yaml")
+    parser.add_argument("--trials", type=int, help="Nombre d'essais (défaut: config.HPARAM_SEARCH)")
+    parser.add_argument("--parallel", type=int, help="Essais simultanés")
+    parser.add_argument("--min-epochs", type=int, help="Premier palier ASHA")
+    parser.add_argument("--max-epochs", type=int, help="Epochs maximales d'un essai")
+    parser.add_argument("--eta", type=int, help="Facteur de réduction ASHA")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--baseline", default="models/yolov8n-seg_trained.pt", help="Modèle de référence")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    reglages = {
+        cle: valeur for cle, valeur in {
+            "trials": args.trials, "parallel": args.parallel, "min_epochs": args.min_epochs,
+            "max_epochs": args.max_epochs, "eta": args.eta, "seed": args.seed,
+        }.items() if valeur is not None
+    }
+
+    print("=" * 80)
+    print("🔎 RECHERCHE D'HYPERPARAMÈTRES (ASHA)")
+    print("=" * 80)
+
+    recherche = HyperparameterSearch(data_yaml=args.data, settings=reglages, baseline=args.baseline)
+    resultat = recherche.run()
+    classement = resultat["leaderboard"]
+
+    print("\n" + "=" * 80)
+    reference = classement["baseline"]
+    if reference:
+        print(f"Référence {reference['weights']}: {classement['metric']}={reference['value']} "
+              f"latence={reference['latency_ms']} ms")
+    print(f"{'essai':<11} {'statut':<10} {'valeur':>8} {'ms':>8}  combinaison")
+    for ligne in classement["trials"]:
+        marque = "⭐" if ligne.get("beats_baseline") else ("◆" if ligne["pareto"] else " ")
+        print(f"{ligne['trial_id']:<11} {ligne['status']:<10} {ligne['best_value']:>8.4f} "
+              f"{ligne['latency_ms'] if ligne['latency_ms'] is not None else '-':>8} {marque} "
+              f"{ligne['model_size']}/{ligne['img_size']}/b{ligne['batch_size']} {ligne['profile']} "
+              f"{ligne['augmentation']} {ligne['optimizer']} lr×{ligne['lr_scale']}")
+    print("\n⭐ plus précis et plus rapide que la référence | ◆ front de Pareto")
+    print(f"✅ Classement: {resultat['json']} | {resultat['csv']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
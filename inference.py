@@ -13,6 +13,8 @@ from typing import Dict, List, Optional
 import argparse
 import torch
 
+from utils.mask_area import MaskAreaEngine
+
 PROJECT_DIR = Path(__file__).parent
 MODELS_DIR = PROJECT_DIR / "models"
 INFERENCES_DIR = PROJECT_DIR / "inferences"
@@ -23,19 +25,21 @@ INFERENCES_DIR.mkdir(exist_ok=True)
 class InferenceWithVoidRate:
     """Classe pour effectuer l'inférence et calculer le void_rate"""
     
-    def __init__(self, model_path: str, conf_threshold: float = 0.5):
+    def __init__(self, model_path: str, conf_threshold: float = 0.5, area_mode: str = "mask"):
         """
         Initialiser l'inférence
         
         Args:
             model_path: Chemin vers le modèle YOLOv11 .pt
             conf_threshold: Seuil de confiance pour les détections
+            area_mode: Calcul des aires - 'mask' (défaut), 'polygon' ou 'retina'
         """
         self.device = 0 if torch.cuda.is_available() else "cpu"
         self.model = YOLO(model_path, task="segment")
         self.model_path = model_path
         self.conf_threshold = conf_threshold
         self.class_names = {0: 'chip', 1: 'hole'}
+        self.area_engine = MaskAreaEngine(area_mode)
     
     def infer_image(self, image_path: str) -> Dict:
         """
@@ -60,6 +64,7 @@ class InferenceWithVoidRate:
             conf=self.conf_threshold,
             device=self.device,
             verbose=False,
+            **self.area_engine.predict_kwargs(),
         )
         
         result = results[0] if results else None
@@ -81,13 +86,14 @@ class InferenceWithVoidRate:
         holes_area = 0
         detections = []
         
-        for i, (cls, conf, mask, box) in enumerate(
-            zip(result.boxes.cls, result.boxes.conf, result.masks.data, result.boxes.xyxy)
+        # Aires en pixels de l'image originale (letterbox compensé)
+        areas = self.area_engine.areas(result)
+        
+        for i, (cls, conf, mask_area, box) in enumerate(
+            zip(result.boxes.cls, result.boxes.conf, areas, result.boxes.xyxy)
         ):
             cls_id = int(cls.item())
             confidence = float(conf.item())
-            mask_np = mask.cpu().numpy().astype(np.uint8) * 255
-            mask_area = np.sum(mask_np > 0)
             
             # Coordonnées du box
             x1, y1, x2, y2 = [float(v.item()) for v in box]
@@ -97,7 +103,7 @@ class InferenceWithVoidRate:
                 'class': self.class_names.get(cls_id, f"class_{cls_id}"),
                 'class_id': cls_id,
                 'confidence': confidence,
-                'area_pixels': int(mask_area),
+                'area_pixels': int(round(mask_area)),
                 'bbox': {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2},
             }
             
@@ -118,8 +124,8 @@ class InferenceWithVoidRate:
             'model_used': Path(self.model_path).name,
             'confidence_threshold': self.conf_threshold,
             'num_detections': len(detections),
-            'chip_area_pixels': int(chip_area),
-            'hole_area_pixels': int(holes_area),
+            'chip_area_pixels': int(round(chip_area)),
+            'hole_area_pixels': int(round(holes_area)),
             'void_rate': float(void_rate),
             'void_rate_percent': f"{void_rate:.2f}%",
             'detections': detections,
@@ -314,6 +320,12 @@ def main():
         "-o", "--output",
         help="Chemin pour sauvegarder les résultats JSON"
     )
+    parser.add_argument(
+        "--area-mode",
+        choices=["mask", "polygon", "retina"],
+        default="mask",
+        help="Calcul des aires: mask (défaut), polygon ou retina (pleine résolution)"
+    )
     parser.add_argument(
         "-a", "--annotate",
         action="store_true",
@@ -339,7 +351,7 @@ def main():
     print(f"Confiance: {args.confidence}")
     
     # Créer l'inférence
-    inference = InferenceWithVoidRate(model_path, args.confidence)
+    inference = InferenceWithVoidRate(model_path, args.confidence, area_mode=args.area_mode)
     
     # Traiter les images
     results = []
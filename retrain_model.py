@@ -1,8 +1,11 @@
 """
 Retrain YOLOv8n Segmentation Model
 Utilise les données du dossier train/ et test/
+--fine-tune: fine-tuning rapide (backbone gelé, nouveaux labels + rejeu) dans un budget de temps
 """
 
+import argparse
+import json
 import os
 import yaml
 from ultralytics import YOLO
@@ -49,6 +52,13 @@ def train_model():
     # Charger le modèle pré-entraîné
     model = YOLO(f'{MODEL_NAME}.pt')
     
+    # Images décodées une seule fois dans le cache memmap (réutilisé entre les lancements)
+    from config import TRAINING_CACHE
+    from utils.image_cache import cached_trainer
+    cache_args = {"workers": TRAINING_CACHE["loader_workers"]}
+    if TRAINING_CACHE["enabled"]:
+        cache_args["trainer"] = cached_trainer("base", TRAINING_CACHE["root"], TRAINING_CACHE["keep"])
+    
     # Entraîner
     results = model.train(
         data=DATA_YAML,
@@ -56,6 +66,7 @@ def train_model():
         imgsz=IMGSZ,
         batch=BATCH_SIZE,
         device=DEVICE,
+        **cache_args,
         patience=10,  # Early stopping after 10 epochs sans amélioration
         save=True,
         verbose=True,
@@ -66,23 +77,31 @@ def train_model():
     logger.info("✓ Entraînement terminé")
     return results
 
-def copy_best_model():
-    """Copier le meilleur modèle vers models/"""
+def deploy_best_model():
+    """Enregistrer le meilleur modèle dans le registre et le déployer (validation golden set)"""
     best_model = 'runs/segment/yolov8n-seg-train/weights/best.pt'
     
-    if os.path.exists(best_model):
-        os.makedirs('models', exist_ok=True)
-        import shutil
-        shutil.copy(best_model, OUTPUT_MODEL)
-        logger.info(f"✓ Modèle copié vers {OUTPUT_MODEL}")
-    else:
+    if not os.path.exists(best_model):
         logger.warning(f"Fichier {best_model} non trouvé")
+        return None
+    
+    # Jamais de copie sur le modèle servi: le registre en garde une version
+    # immuable et met à jour OUTPUT_MODEL seulement si la validation passe
+    from utils.model_registry import get_model_registry
+    registry = get_model_registry()
+    version = registry.register(best_model, source='retrain', metadata={'epochs': EPOCHS, 'script': 'retrain_model.py'})
+    deployment = registry.deploy(version['version'], background=False)
+    if deployment['status'] == 'deployed':
+        logger.info(f"✓ Modèle {version['version']} déployé vers {OUTPUT_MODEL}")
+    else:
+        logger.warning(f"⚠ Modèle {version['version']} non déployé ({deployment['status']})")
+    return version['path']
 
-def test_model():
+def test_model(model_path):
     """Tester le modèle entraîné"""
     logger.info("🧪 Test du modèle...")
     
-    model = YOLO(OUTPUT_MODEL)
+    model = YOLO(model_path)
     
     # Tester sur une image
     test_images = list(Path('test/images').glob('*.jpg'))[:1]
@@ -103,7 +122,42 @@ def test_model():
     
     logger.info("✓ Test terminé")
 
+def fine_tune_model(budget_minutes, freeze, replay_size):
+    """Fine-tuning incrémental via RetrainingPipeline (mode 'finetune')"""
+    from config import FINE_TUNE_CONFIG
+    from utils.retrain_pipeline import RetrainingPipeline
+
+    options = {'time_budget_minutes': budget_minutes or FINE_TUNE_CONFIG['time_budget_minutes']}
+    if freeze is not None:
+        options['freeze'] = freeze
+    if replay_size is not None:
+        options['replay_size'] = replay_size
+
+    logger.info(f"🚀 Fine-tuning rapide: {options}")
+    result = RetrainingPipeline(OUTPUT_MODEL).retrain(mode='finetune', fine_tune=options, batch_size=BATCH_SIZE)
+
+    evaluation = result['evaluation']
+    print(json.dumps(result['fine_tune'], indent=2))
+    print(f"Évaluation (candidat - modèle servi): {json.dumps(evaluation['deltas'], indent=2)}")
+    print(f"Rapport: {evaluation['report_path']}")
+    if evaluation['regression']:
+        print(f"❌ Régression détectée, modèle {result['model_version']} non déployé")
+    else:
+        print(f"✓ Modèle {result['model_version']} déployé ({result['deployment']})")
+    return result
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ré-entraînement YOLOv8n-seg")
+    parser.add_argument('--fine-tune', action='store_true', help="Fine-tuning rapide sur les nouveaux labels")
+    parser.add_argument('--budget', type=float, help="Budget de temps en minutes (fine-tuning)")
+    parser.add_argument('--freeze', type=int, help="Nombre de couches gelées (fine-tuning)")
+    parser.add_argument('--replay-size', type=int, help="Images anciennes rejouées (fine-tuning)")
+    args = parser.parse_args()
+
+    if args.fine_tune:
+        fine_tune_model(args.budget, args.freeze, args.replay_size)
+        raise SystemExit(0)
+
     print("="*60)
     print("YOLOv8n Segmentation Model Retraining")
     print("="*60)
@@ -114,13 +168,14 @@ if __name__ == '__main__':
     # Entraîner
     train_model()
     
-    # Copier le meilleur modèle
-    copy_best_model()
+    # Enregistrer et déployer le meilleur modèle
+    model_path = deploy_best_model()
     
     # Tester
-    test_model()
+    if model_path:
+        test_model(model_path)
     
     print("="*60)
     print("✓ Réentraînement terminé!")
-    print(f"Modèle sauvegardé: {OUTPUT_MODEL}")
+    print(f"Modèle enregistré: {model_path}")
     print("="*60)
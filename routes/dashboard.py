@@ -0,0 +1,134 @@
+"""
+Route: Dashboard
+GET /api/dashboard - Every dashboard widget in one cached, ETag-validated payload
+"""
+
+from flask import Blueprint, request, jsonify, current_app, Response
+import hashlib
+import importlib.util
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+import logging
+
+dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/api')
+logger = logging.getLogger(__name__)
+
+from utils.storage_manager import get_storage_manager
+from utils.artifact_index import artifact_index
+from routes.train import get_training_status, job_store
+from routes.feedback import feedback_manager
+
+storage = get_storage_manager()
+
+# Days shown by the history chart, newest included
+HISTORY_DAYS = 90
+# Predictions shown by the void rate chart and the recent list
+RECENT_PREDICTIONS = 20
+
+# Last payload built, keyed by its ETag
+_cache = {'etag': None, 'payload': None}
+_cache_lock = threading.Lock()
+# SAM checkpoint loaded by utils/sam_handler.py
+SAM_CHECKPOINT = 'sam_vit_b_01ec64.pth'
+# Filled on first use by _system_capabilities()
+_capabilities = {}
+
+
+def _version():
+    """
+    Tuple that changes whenever any widget's data changes
+
+    Every part is O(1): ledger offset of the analytics views, highest
+    label row id, feedback log size/mtime, last training job update and
+    artifact counts. The day is included because the history window slides.
+    """
+    storage.analytics.refresh()
+    return (
+        storage.analytics.offset,
+        storage.label_store.last_id(),
+        feedback_manager.version(),
+        job_store.version(),
+        artifact_index.count(current_app.config['MODELS_FOLDER']),
+        artifact_index.count(current_app.config['UPLOAD_FOLDER']),
+        date.today().isoformat(),
+    )
+
+
+def _system_capabilities():
+    """SAM and GPU availability, checked once per process"""
+    if not _capabilities:
+        try:
+            import torch
+            gpu_available = torch.cuda.is_available()
+        except ImportError:
+            gpu_available = False
+        _capabilities.update(
+            sam_available=importlib.util.find_spec('segment_anything') is not None
+            and Path(SAM_CHECKPOINT).exists(),
+            gpu_available=gpu_available,
+        )
+    return _capabilities
+
+
+def _build_payload():
+    """Assemble every widget's data from the cached aggregates"""
+    summary = storage.get_prediction_summary()
+    count = summary['total_images']
+    since = (date.today() - timedelta(days=HISTORY_DAYS - 1)).isoformat()
+    artifacts = artifact_index.snapshot()
+
+    return {
+        'status': 'success',
+        'generated_at': datetime.now().isoformat(),
+        'summary': summary,
+        'areas': {
+            'avg_chip_area': summary.get('total_chip_area', 0) / count if count else 0,
+            'avg_holes_area': summary.get('total_holes_area', 0) / count if count else 0,
+        },
+        'recent_predictions': storage.columns.recent(RECENT_PREDICTIONS),
+        'history': storage.get_prediction_trend('day', since=since),
+        'labels': {
+            'total': storage.label_store.count(),
+            'storage_bytes': artifacts.get(current_app.config['LABELED_FOLDER'], {}).get('bytes', 0),
+        },
+        'training': get_training_status(),
+        'feedback': feedback_manager.get_stats(),
+        'system': {
+            'status': 'ok',
+            'models_available': artifact_index.count(current_app.config['MODELS_FOLDER'], 'model'),
+            'uploads_available': artifact_index.count(current_app.config['UPLOAD_FOLDER']),
+            **_system_capabilities(),
+        },
+    }
+
+
+@dashboard_bp.route('/dashboard', methods=['GET'])
+def dashboard_data():
+    """
+    Get the data of every dashboard widget in one payload
+
+    The payload is rebuilt only when the underlying data changed and is
+    returned with an ETag; requests carrying a matching If-None-Match get
+    304 Not Modified without any payload being built.
+    """
+    try:
+        etag = hashlib.sha1(repr(_version()).encode('utf-8')).hexdigest()[:20]
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            with _cache_lock:
+                if _cache['etag'] != etag:
+                    _cache['payload'] = _build_payload()
+                    _cache['etag'] = etag
+                payload = _cache['payload']
+            response = jsonify(payload)
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    except Exception as e:
+        logger.error(f"Dashboard error: {str(e)}")
+        return jsonify({'error': f'Failed to get dashboard data: {str(e)}'}), 500
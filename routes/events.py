@@ -0,0 +1,67 @@
+"""
+Route: Events
+GET /api/events - Server-Sent Events stream of training, prediction and feedback updates
+"""
+
+from flask import Blueprint, Response, stream_with_context
+import json
+import logging
+
+events_bp = Blueprint('events', __name__, url_prefix='/api')
+logger = logging.getLogger(__name__)
+
+from utils.event_bus import event_bus
+
+# Seconds without events before a heartbeat comment is sent
+HEARTBEAT_INTERVAL = 15
+# Milliseconds the browser waits before reconnecting
+RETRY_MS = 3000
+
+
+def _format(event):
+    """One SSE message"""
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def _stream():
+    subscription = event_bus.subscribe()
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        # Current state first, so a (re)connecting client needs no extra request
+        for event in event_bus.latest():
+            yield _format(event)
+
+        while True:
+            events, dropped = subscription.get(timeout=HEARTBEAT_INTERVAL)
+            if dropped:
+                # The client fell behind: tell it to reload instead of replaying
+                yield f"event: resync\ndata: {json.dumps({'dropped': dropped})}\n\n"
+            if not events:
+                yield ": heartbeat\n\n"
+            for event in events:
+                yield _format(event)
+    finally:
+        event_bus.unsubscribe(subscription)
+
+
+@events_bp.route('/events', methods=['GET'])
+def events():
+    """
+    Server-Sent Events stream
+
+    Events:
+    - training: training status on every epoch and state change
+    - predictions: summary after every committed group of predictions
+    - feedback: feedback statistics after every change
+    - resync: events were dropped because the client fell behind
+
+    A heartbeat comment is sent every HEARTBEAT_INTERVAL seconds of silence.
+    """
+    return Response(
+        stream_with_context(_stream()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
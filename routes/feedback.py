@@ -2,16 +2,20 @@
 Feedback API Routes for Active Learning
 POST /api/feedback - Submit feedback
 GET /api/feedback - Get feedback statistics
+POST /api/feedback/stats/rebuild - Recount statistics from the log
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, current_app
 import logging
-from utils.feedback_manager import FeedbackManager
+from pathlib import Path
+from utils.feedback_manager import get_feedback_manager
+from utils.storage_manager import get_storage_manager
 
 logger = logging.getLogger(__name__)
 
 feedback_bp = Blueprint('feedback', __name__, url_prefix='/api/feedback')
-feedback_manager = FeedbackManager()
+feedback_manager = get_feedback_manager()
+storage = get_storage_manager()
 
 
 @feedback_bp.route('', methods=['POST'])
@@ -54,33 +58,70 @@ def submit_feedback():
 
 @feedback_bp.route('', methods=['GET'])
 def get_feedback_stats():
-    """Get feedback statistics and recommendations"""
+    """
+    Get feedback statistics and recommendations
+    
+    Carries an ETag derived from the feedback log; a matching
+    If-None-Match is answered with 304 Not Modified.
+    """
     try:
-        stats = feedback_manager.get_stats()
-        recommendation = feedback_manager.get_training_candidates()
+        etag = '-'.join('%x' % part for part in feedback_manager.version())
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            stats = feedback_manager.get_stats()
+            recommendation = feedback_manager.get_training_candidates()
+            response = jsonify({
+                "stats": stats,
+                "recommendation": recommendation
+            })
         
-        return jsonify({
-            "stats": stats,
-            "recommendation": recommendation
-        }), 200
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     
     except Exception as e:
         logger.error(f"Error getting feedback stats: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@feedback_bp.route('/stats/rebuild', methods=['POST'])
+def rebuild_feedback_stats():
+    """Recount feedback statistics from the whole log (normally kept incrementally)"""
+    try:
+        stats = feedback_manager.rebuild_stats()
+        return jsonify({"success": True, "stats": stats}), 200
+    
+    except Exception as e:
+        logger.error(f"Error rebuilding feedback stats: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @feedback_bp.route('/pending', methods=['GET'])
 def get_pending_feedback():
-    """Get all pending feedback records"""
+    """
+    Get pending feedback records, oldest first (served from the status index)
+    
+    Query parameters:
+    - limit: page size (default 100, max 1000)
+    - cursor: next_cursor of the previous page
+    """
     try:
-        limit = request.args.get('limit', default=None, type=int)
-        pending = feedback_manager.get_pending_feedback(limit=limit)
+        limit = request.args.get('limit', default=100, type=int)
+        pending, next_cursor = feedback_manager.query_feedback(
+            status='pending',
+            cursor=request.args.get('cursor'),
+            limit=limit
+        )
         
         return jsonify({
             "count": len(pending),
-            "feedback": pending
+            "feedback": pending,
+            "next_cursor": next_cursor
         }), 200
     
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting pending feedback: {e}")
         return jsonify({"error": str(e)}), 500
@@ -88,16 +129,29 @@ def get_pending_feedback():
 
 @feedback_bp.route('/incorrect', methods=['GET'])
 def get_incorrect_predictions():
-    """Get predictions marked as incorrect (for retraining)"""
+    """
+    Get predictions marked as incorrect or partial (for retraining), oldest first
+    
+    Query parameters:
+    - limit: page size (default 50, max 1000)
+    - cursor: next_cursor of the previous page
+    """
     try:
         limit = request.args.get('limit', default=50, type=int)
-        incorrect = feedback_manager.get_incorrect_predictions(limit=limit)
+        incorrect, next_cursor = feedback_manager.query_feedback(
+            feedback_types=['incorrect', 'partial'],
+            cursor=request.args.get('cursor'),
+            limit=limit
+        )
         
         return jsonify({
             "count": len(incorrect),
-            "predictions": incorrect
+            "predictions": incorrect,
+            "next_cursor": next_cursor
         }), 200
     
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting incorrect predictions: {e}")
         return jsonify({"error": str(e)}), 500
@@ -125,23 +179,65 @@ def mark_processed():
         return jsonify({"error": str(e)}), 500
 
 
+EXPORT_ROOT = Path('training_data')
+
+
+def _export_dir(output_dir):
+    """Export directory confined to training_data/ ('feedback' and 'training_data/feedback' are the same)"""
+    if not isinstance(output_dir, str) or not output_dir:
+        raise ValueError("output_dir must be a relative path under training_data/")
+    path = Path(output_dir)
+    if path.is_absolute() or '..' in path.parts:
+        raise ValueError("output_dir must be a relative path under training_data/ without '..'")
+    if path.parts[0] != EXPORT_ROOT.name:
+        path = EXPORT_ROOT / path
+    root = EXPORT_ROOT.resolve()
+    resolved = path.resolve()
+    # A symlink inside training_data/ must not lead out of it either
+    if resolved == root or root not in resolved.parents:
+        raise ValueError("output_dir must be a directory under training_data/")
+    return path
+
+
 @feedback_bp.route('/export', methods=['POST'])
 def export_feedback():
-    """Export feedback data for model retraining"""
+    """
+    Export flagged feedback into a YOLO-seg training dataset
+    
+    Expected JSON (all optional):
+    {
+        "output_dir": "feedback",
+        "feedback_types": ["incorrect", "partial"]
+    }
+    
+    output_dir is relative to training_data/ (absolute paths and '..' are
+    rejected). Images are hard-linked into <output_dir>/train/images and
+    the polygons of their latest validated label written to
+    <output_dir>/train/labels; records without a correction yet are skipped
+    (no_correction) and re-exports only add new records and new corrections.
+    """
     try:
-        output_path = request.json.get('output_path', 'feedback_export.json')
+        data = request.get_json(silent=True) or {}
+        output_dir = _export_dir(data.get('output_dir', 'feedback'))
+        feedback_types = data.get('feedback_types', ['incorrect', 'partial'])
+        
+        if not isinstance(feedback_types, list) or not feedback_types:
+            return jsonify({"error": "feedback_types must be a non-empty list"}), 400
         
-        result = feedback_manager.export_feedback_for_training(output_path)
+        result = feedback_manager.export_feedback_for_training(
+            str(output_dir),
+            image_dirs=[current_app.config['UPLOAD_FOLDER']],
+            label_store=storage.label_store,
+            feedback_types=tuple(feedback_types)
+        )
         
         if result['success']:
-            return jsonify({
-                "success": True,
-                "count": result['count'],
-                "file": output_path
-            }), 200
+            return jsonify(result), 200
         else:
             return jsonify(result), 500
     
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error exporting feedback: {e}")
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,124 @@
+"""
+Route: Models
+GET /api/models - Model versions and deployment status
+POST /api/models/deploy - Validate and deploy a version in the background
+POST /api/models/rollback - Serve the previous version again
+POST /api/models/golden - Seed the golden set used to validate deployments
+"""
+
+from flask import Blueprint, request, jsonify, current_app
+import logging
+import os
+
+models_bp = Blueprint('models', __name__, url_prefix='/api')
+logger = logging.getLogger(__name__)
+
+from utils.model_registry import get_model_registry
+from utils.event_bus import event_bus
+from utils.storage_manager import get_storage_manager
+
+model_registry = get_model_registry()
+storage = get_storage_manager()
+
+@models_bp.route('/models', methods=['GET'])
+def list_models():
+    """
+    Get the model versions, the current/previous pointers and the last deployment
+    """
+    try:
+        return jsonify({'status': 'success', **model_registry.describe()}), 200
+    
+    except Exception as e:
+        logger.error(f"Models error: {str(e)}")
+        return jsonify({'error': f'Failed to list models: {str(e)}'}), 500
+
+@models_bp.route('/models/deploy', methods=['POST'])
+def deploy_model():
+    """
+    Deploy a model version
+    
+    The version is loaded and warmed up in the background, and its void
+    rates on the golden set (models/golden) must stay within tolerance.
+    Only then is the registry pointer switched; requests keep being served
+    by the current model meanwhile. With an empty golden set the version
+    is rejected unless forced (see POST /api/models/golden).
+    
+    Input:
+    {
+        "version": "v0003",
+        "force": false
+    }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        version = data.get('version')
+        if not version:
+            return jsonify({'error': 'version is required'}), 400
+        
+        deployment = model_registry.deploy(version, background=True, force=bool(data.get('force', False)))
+        event_bus.publish('models', model_registry.describe())
+        return jsonify({'status': 'success', 'deployment': deployment}), 202
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    
+    except Exception as e:
+        logger.error(f"Deploy error: {str(e)}")
+        return jsonify({'error': f'Deployment failed: {str(e)}'}), 500
+
+@models_bp.route('/models/rollback', methods=['POST'])
+def rollback_model():
+    """
+    Switch back to the previous model version (instant, it is still loaded)
+    """
+    try:
+        version = model_registry.rollback()
+        event_bus.publish('models', model_registry.describe())
+        return jsonify({'status': 'success', 'current': version}), 200
+    
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    
+    except Exception as e:
+        logger.error(f"Rollback error: {str(e)}")
+        return jsonify({'error': f'Rollback failed: {str(e)}'}), 500
+
+@models_bp.route('/models/golden', methods=['POST'])
+def seed_golden():
+    """
+    Add uploaded images to the golden set, with the void rates of the model
+    currently served as expected values
+    
+    Input (all optional):
+    {
+        "images": ["20250101_120000_board.jpg", ...],
+        "count": 20
+    }
+    
+    Without images, the images of the `count` most recently validated labels are used.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        images = data.get('images')
+        if images is None:
+            count = max(1, min(int(data.get('count', 20)), 1000))
+            labels, _ = storage.list_labels(limit=count)
+            images = list(dict.fromkeys(l['image_id'] for l in labels if l.get('image_id')))
+        if not isinstance(images, list) or not all(isinstance(name, str) for name in images):
+            return jsonify({'error': 'images must be a list of file names'}), 400
+        
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        result = model_registry.seed_golden(
+            [os.path.join(upload_folder, os.path.basename(name)) for name in images]
+        )
+        return jsonify({'status': 'success', **result}), 200
+    
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    except Exception as e:
+        logger.error(f"Golden set error: {str(e)}")
+        return jsonify({'error': f'Failed to seed the golden set: {str(e)}'}), 500
@@ -13,29 +13,21 @@ import logging
 import cv2
 import numpy as np
 
-# Imports pour inference
-from void_rate_calculator import VoidRateCalculator
-
 # Configuration
-MODEL_PATH = "models/yolov8n-seg_trained.pt"
+AREA_MODE = "mask"  # 'mask', 'polygon' ou 'retina' (voir utils/mask_area.py)
 
 # Setup
 predict_bp = Blueprint('predict', __name__, url_prefix='/api')
 logger = logging.getLogger(__name__)
 
-# Import YOLO inference
-from utils.yolo_inference import YOLOInference
-
-# Lazy load YOLO - only load when needed
-yolo_model = None
+from utils.artifact_index import artifact_index
+from utils.model_registry import get_model_registry
+from utils.storage_manager import get_storage_manager
 
-def get_yolo_model():
-    """Lazy load YOLO model"""
-    global yolo_model
-    if yolo_model is None:
-        logger.info("Loading YOLO model...")
-        yolo_model = YOLOInference('models/yolov8n-seg_trained.pt')
-    return yolo_model
+storage = get_storage_manager()
+# Versioned models: deployments and rollbacks are picked up without a restart
+model_registry = get_model_registry()
+model_registry.area_mode = AREA_MODE  # avant le premier chargement
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp', 'gif', 'tiff'}
 
@@ -88,13 +80,14 @@ def generate_segmentation_image(image_path, void_rate_result):
             1: (0, 0, 255)     # hole - rouge
         }
         
-        # Dessiner chaque mask
-        masks = result.masks.data
+        # Dessiner chaque mask à partir de ses contours (masks.xy, déjà en
+        # coordonnées de l'image originale) - pas d'upsampling pleine résolution
+        polygons = result.masks.xy
         cls_ids = result.boxes.cls if hasattr(result.boxes, 'cls') else None
         
-        logger.info(f"Processing {len(masks)} masks")
+        logger.info(f"Processing {len(polygons)} masks")
         
-        for idx, mask_tensor in enumerate(masks):
+        for idx, polygon in enumerate(polygons):
             # Get class ID
             if cls_ids is not None and idx < len(cls_ids):
                 cls = int(cls_ids[idx].item())
@@ -103,32 +96,14 @@ def generate_segmentation_image(image_path, void_rate_result):
             
             color = colors.get(cls, (255, 0, 0))
             
-            # Convertir le mask en numpy array
-            if hasattr(mask_tensor, 'cpu'):
-                mask_np = mask_tensor.cpu().numpy()
-            elif hasattr(mask_tensor, 'numpy'):
-                mask_np = mask_tensor.numpy()
-            else:
-                mask_np = np.array(mask_tensor)
-            
-            # Redimensionner si nécessaire
-            if mask_np.ndim == 3:
-                mask_np = mask_np[0]  # Remove channel dimension if present
-                
-            if mask_np.shape != image.shape[:2]:
-                mask_np = cv2.resize(mask_np, (image.shape[1], image.shape[0]))
-            
-            # Convertir en uint8 (0-255)
-            mask_np = (mask_np * 255).astype(np.uint8)
+            if len(polygon) < 3:
+                logger.info(f"Processing mask {idx} (class {cls}): empty contour")
+                continue
             
-            # Trouver les contours
-            contours, _ = cv2.findContours(mask_np, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            contour = np.round(polygon).astype(np.int32).reshape(-1, 1, 2)
             
-            logger.info(f"Processing mask {idx} (class {cls}): {len(contours)} contours found")
-            
-            # Dessiner les contours
-            if len(contours) > 0:
-                cv2.drawContours(output, contours, -1, color, 2)  # Épaisseur: 2
+            # Dessiner le contour
+            cv2.polylines(output, [contour], True, color, 2)  # Épaisseur: 2
         
         # Sauvegarder l'image avec contours
         mask_filename = os.path.basename(image_path).rsplit('.', 1)[0] + '_mask.png'
@@ -136,6 +111,7 @@ def generate_segmentation_image(image_path, void_rate_result):
         success = cv2.imwrite(mask_path, output)
         
         if success:
+            artifact_index.record_write(mask_path)
             logger.info(f"✓ Generated segmentation mask: {mask_path}")
             return mask_path
         else:
@@ -191,13 +167,14 @@ def predict():
         
         upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], image_id)
         file.save(upload_path)
+        artifact_index.record_write(upload_path)
         
         logger.info(f"Processing image: {image_id}")
         
         try:
-            # Run YOLO inference and calculate void rate
-            void_rate_calc = VoidRateCalculator(MODEL_PATH)
-            void_rate_result = void_rate_calc.calculate_void_rate(upload_path, verbose=False)
+            # Run YOLO inference and calculate void rate (model loaded once, warm)
+            serving = model_registry.serving()
+            void_rate_result = serving.void_rate(upload_path)
             
             logger.info(f"Void rate result type: {type(void_rate_result)}")
             logger.info(f"Void rate result: {void_rate_result}")
@@ -238,15 +215,23 @@ def predict():
                     'num_holes': int(void_rate_result.get('num_holes', 0))
                 },
                 'image_id': image_id,
+                'model_version': serving.version,
                 'timestamp': timestamp,
                 'image_url': f'/uploads/{image_id}',
                 'mask_url': mask_image_url
             }
             
-            # Save prediction results
-            results_file = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{image_id}_results.json")
-            with open(results_file, 'w') as f:
-                json.dump(response, f, indent=2)
+            # Record the prediction in the ledger (write-behind, never blocks on disk)
+            storage.save_prediction(
+                image_id=image_id,
+                void_rate=response['result']['void_rate'],
+                chip_area=response['result']['chip_area'],
+                holes_area=response['result']['holes_area'],
+                confidence=response['result']['confidence'],
+                image_name=filename,
+                num_chips=response['result']['num_chips'],
+                num_holes=response['result']['num_holes']
+            )
             
             logger.info(f"Prediction successful for {image_id}")
             return jsonify(response), 200
@@ -280,12 +265,27 @@ def predict_batch():
                 
                 upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], image_id)
                 file.save(upload_path)
+                artifact_index.record_write(upload_path)
                 
                 # Predict
-                model = get_yolo_model()
-                pred_results = model.predict(upload_path)
+                serving = model_registry.serving()
+                model = serving.inference
+                with serving.lock:
+                    pred_results = model.predict(upload_path)
                 void_rate_result = model.calculate_void_rate(pred_results)
                 
+                storage.save_prediction(
+                    image_id=image_id,
+                    void_rate=float(void_rate_result.get('void_rate', 0)),
+                    chip_area=int(void_rate_result.get('chip_area_pixels', 0)),
+                    holes_area=int(void_rate_result.get('holes_area_pixels', 0)),
+                    confidence=float(np.mean([d['confidence'] for d in pred_results['detections']]))
+                    if pred_results['detections'] else 0.0,
+                    image_name=filename,
+                    num_chips=int(void_rate_result.get('num_chips', 0)),
+                    num_holes=int(void_rate_result.get('num_holes', 0))
+                )
+                
                 results.append({
                     'image_id': image_id,
                     'predictions': pred_results['detections'],
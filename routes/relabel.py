@@ -11,23 +11,13 @@ from pathlib import Path
 import logging
 import cv2
 import numpy as np
-from ultralytics import YOLO
 
 relabel_bp = Blueprint('relabel', __name__, url_prefix='/api')
 logger = logging.getLogger(__name__)
 
-# Load YOLO model once
-_yolo_model = None
+from utils.model_registry import get_model_registry
 
-def get_yolo_model():
-    global _yolo_model
-    if _yolo_model is None:
-        model_path = 'models/yolov8n-seg_trained.pt'
-        if not os.path.exists(model_path):
-            model_path = 'yolov8n-seg.pt'
-        _yolo_model = YOLO(model_path)
-        logger.info(f"YOLO model loaded: {model_path}")
-    return _yolo_model
+model_registry = get_model_registry()
 
 @relabel_bp.route('/relabel', methods=['POST'])
 def relabel():
@@ -69,7 +59,7 @@ def relabel():
         
         # Use YOLO for re-segmentation
         logger.info(f"Re-segmenting {image_id} with YOLO")
-        model = get_yolo_model()
+        serving = model_registry.serving()
         
         # Read image
         image = cv2.imread(image_path)
@@ -77,7 +67,8 @@ def relabel():
             return jsonify({'error': 'Cannot read image'}), 400
         
         # Run YOLO inference
-        results = model.predict(image, conf=0.3, verbose=False)
+        with serving.lock:
+            results = serving.calculator.model.predict(image, conf=0.3, verbose=False)
         
         masks_list = []
         if results and len(results) > 0:
@@ -135,7 +126,7 @@ def relabel_auto():
         
         # Use YOLO for full segmentation
         logger.info(f"Auto-segmenting {image_id} with YOLO")
-        model = get_yolo_model()
+        serving = model_registry.serving()
         
         # Read image
         image = cv2.imread(image_path)
@@ -143,7 +134,8 @@ def relabel_auto():
             return jsonify({'error': 'Cannot read image'}), 400
         
         # Run YOLO inference with lower confidence
-        results = model.predict(image, conf=0.1, verbose=False)
+        with serving.lock:
+            results = serving.calculator.model.predict(image, conf=0.1, verbose=False)
         
         masks_list = []
         if results and len(results) > 0:
@@ -3,24 +3,130 @@ Route: Report
 GET /api/report - Export CSV report
 """
 
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context, send_file
 import csv
+import json
 import os
+import zlib
 from datetime import datetime
-from io import StringIO
+from io import BytesIO, StringIO
 import logging
 
 report_bp = Blueprint('report', __name__, url_prefix='/api')
 logger = logging.getLogger(__name__)
 
-from utils.storage_manager import StorageManager
+from utils.storage_manager import get_storage_manager
+from utils.artifact_index import artifact_index
+from utils.columnar_cache import PARQUET_AVAILABLE
+from utils.prediction_stats import SHIFTS, inclusive_until
 
-storage = StorageManager()
+storage = get_storage_manager()
+
+CSV_HEADER = [
+    'Image Name',
+    'Chip Area (pixels)',
+    'Holes Area (pixels)',
+    'Void Rate (%)',
+    'Confidence',
+    'Timestamp'
+]
+
+# Rows are buffered and sent in chunks of this many
+STREAM_CHUNK_ROWS = 500
+
+
+def _export_options():
+    """Read the from/to/gzip/save query parameters shared by the exports"""
+    return {
+        'since': request.args.get('from'),
+        'until': inclusive_until(request.args.get('to')),
+        'gzip': request.args.get('gzip', '').lower() in ('1', 'true'),
+        'save': request.args.get('save', '').lower() in ('1', 'true'),
+    }
+
+
+def _csv_chunks(predictions):
+    """Render predictions as CSV text, one chunk per STREAM_CHUNK_ROWS rows"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    
+    rows = 0
+    for pred in predictions:
+        writer.writerow([
+            pred.get('image_name', ''),
+            pred.get('chip_area', 0),
+            pred.get('holes_area', 0),
+            pred.get('void_rate', 0),
+            pred.get('confidence', 0),
+            pred.get('timestamp', '')
+        ])
+        rows += 1
+        if rows % STREAM_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    yield buffer.getvalue()
+
+
+def _json_chunks(predictions, timestamp):
+    """Render predictions as one JSON document, one chunk per STREAM_CHUNK_ROWS records"""
+    yield '{"timestamp": %s, "predictions": [' % json.dumps(timestamp)
+    
+    count = 0
+    parts = []
+    for pred in predictions:
+        parts.append(json.dumps(pred) if count == 0 else ',' + json.dumps(pred))
+        count += 1
+        if len(parts) >= STREAM_CHUNK_ROWS:
+            yield ''.join(parts)
+            parts = []
+    
+    yield ''.join(parts) + '], "count": %d}' % count
+
+
+def _encode(chunks, use_gzip):
+    """Encode text chunks to bytes, gzip-compressing on the fly if requested"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def _tee_to_file(chunks, filepath):
+    """Pass chunks through while writing a copy to filepath"""
+    with open(filepath, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            yield chunk
+    artifact_index.record_write(filepath)
+
+
+def _streaming_export(chunks, filename, mimetype, options):
+    """Build the streamed download response for an export"""
+    body = _encode(chunks, options['gzip'])
+    if options['gzip']:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    if options['save']:
+        body = _tee_to_file(body, os.path.join(current_app.config['REPORTS_FOLDER'], filename))
+    
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 @report_bp.route('/report/csv', methods=['GET'])
 def export_csv():
     """
-    Export void rate report as CSV
+    Export void rate report as CSV (streamed)
     
     CSV columns:
     - Image Name
@@ -29,52 +135,21 @@ def export_csv():
     - Void Rate (%)
     - Confidence
     - Timestamp
+    
+    Query parameters:
+    - from / to: ISO timestamp bounds
+    - gzip=1: gzip-compress the download
+    - save=1: also keep a copy in reports/
     """
     try:
-        # Get all predictions
-        predictions = storage.get_all_predictions()
-        
-        # Create CSV
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow([
-            'Image Name',
-            'Chip Area (pixels)',
-            'Holes Area (pixels)',
-            'Void Rate (%)',
-            'Confidence',
-            'Timestamp'
-        ])
-        
-        # Write data
-        for pred in predictions:
-            writer.writerow([
-                pred.get('image_name', ''),
-                pred.get('chip_area', 0),
-                pred.get('holes_area', 0),
-                pred.get('void_rate', 0),
-                pred.get('confidence', 0),
-                pred.get('timestamp', '')
-            ])
+        options = _export_options()
+        predictions = storage.iter_predictions(since=options['since'], until=options['until'])
         
-        # Save to file
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"void_rate_report_{timestamp}.csv"
-        filepath = os.path.join(current_app.config['REPORTS_FOLDER'], filename)
-        
-        with open(filepath, 'w') as f:
-            f.write(output.getvalue())
         
-        logger.info(f"CSV report exported: {filename}")
-        
-        return send_file(
-            filepath,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
-        )
+        logger.info(f"CSV report export started: {filename}")
+        return _streaming_export(_csv_chunks(predictions), filename, 'text/csv', options)
     
     except Exception as e:
         logger.error(f"CSV export error: {str(e)}")
@@ -83,68 +158,152 @@ def export_csv():
 @report_bp.route('/report/summary', methods=['GET'])
 def report_summary():
     """
-    Get summary statistics
+    Get summary statistics (answered from running aggregates, O(1))
+    
+    Query parameters:
+    - from / to: ISO timestamp bounds, answered from the daily/hourly rollups
     """
     try:
-        predictions = storage.get_all_predictions()
-        
-        if not predictions:
-            return jsonify({
-                'status': 'success',
-                'summary': {
-                    'total_images': 0,
-                    'avg_void_rate': 0,
-                    'min_void_rate': 0,
-                    'max_void_rate': 0
-                }
-            }), 200
-        
-        void_rates = [p.get('void_rate', 0) for p in predictions]
-        
         return jsonify({
             'status': 'success',
-            'summary': {
-                'total_images': len(predictions),
-                'avg_void_rate': sum(void_rates) / len(void_rates),
-                'min_void_rate': min(void_rates),
-                'max_void_rate': max(void_rates),
-                'total_chip_area': sum(p.get('chip_area', 0) for p in predictions),
-                'total_holes_area': sum(p.get('holes_area', 0) for p in predictions),
-            }
+            'summary': storage.get_prediction_summary(
+                since=request.args.get('from'),
+                until=request.args.get('to')
+            )
         }), 200
     
     except Exception as e:
         logger.error(f"Summary error: {str(e)}")
         return jsonify({'error': f'Failed to get summary: {str(e)}'}), 500
 
+@report_bp.route('/report/trend', methods=['GET'])
+def report_trend():
+    """
+    Get materialized daily or hourly rollups
+    
+    Query parameters:
+    - granularity: 'day' (default) or 'hour'
+    - from / to: ISO timestamp bounds
+    """
+    try:
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in ('day', 'hour'):
+            return jsonify({'error': "granularity must be 'day' or 'hour'"}), 400
+        
+        rows = storage.get_prediction_trend(
+            granularity=granularity,
+            since=request.args.get('from'),
+            until=request.args.get('to')
+        )
+        return jsonify({
+            'status': 'success',
+            'granularity': granularity,
+            'count': len(rows),
+            'trend': rows
+        }), 200
+    
+    except Exception as e:
+        logger.error(f"Trend error: {str(e)}")
+        return jsonify({'error': f'Failed to get trend: {str(e)}'}), 500
+
+@report_bp.route('/report/distribution', methods=['GET'])
+def report_distribution():
+    """
+    Get void rate, chip area and hole count distributions (streaming sketches)
+
+    Query parameters:
+    - from / to: ISO date or timestamp bounds on the shift day
+    - shift: only this shift (morning, afternoon, night)
+    - quantiles: comma-separated quantiles (default 0.5,0.95,0.99)
+    - histograms: 0 to leave the bucket counts out
+    """
+    try:
+        shift = request.args.get('shift')
+        if shift and shift not in SHIFTS:
+            return jsonify({'error': f"shift must be one of: {', '.join(SHIFTS)}"}), 400
+
+        try:
+            quantiles = [float(q) for q in request.args.get('quantiles', '0.5,0.95,0.99').split(',')]
+        except ValueError:
+            return jsonify({'error': 'quantiles must be comma-separated numbers'}), 400
+        if not all(0 <= q <= 1 for q in quantiles):
+            return jsonify({'error': 'quantiles must be between 0 and 1'}), 400
+
+        distribution = storage.get_prediction_distribution(
+            since=request.args.get('from'),
+            until=request.args.get('to'),
+            shift=shift,
+            quantiles=quantiles,
+            histograms=request.args.get('histograms', '1') != '0'
+        )
+        return jsonify({
+            'status': 'success',
+            'quantiles': quantiles,
+            'shift_starts': SHIFTS,
+            **distribution
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Distribution error: {str(e)}")
+        return jsonify({'error': f'Failed to get distribution: {str(e)}'}), 500
+
 @report_bp.route('/report/json', methods=['GET'])
 def export_json():
     """
-    Export report as JSON
+    Export report as JSON (streamed)
+    
+    Query parameters: same as /report/csv
     """
     try:
-        predictions = storage.get_all_predictions()
+        options = _export_options()
+        predictions = storage.iter_predictions(since=options['since'], until=options['until'])
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"void_rate_report_{timestamp}.json"
-        filepath = os.path.join(current_app.config['REPORTS_FOLDER'], filename)
         
-        with open(filepath, 'w') as f:
-            json.dump({
-                'timestamp': timestamp,
-                'count': len(predictions),
-                'predictions': predictions
-            }, f, indent=2)
+        logger.info(f"JSON report export started: {filename}")
+        return _streaming_export(_json_chunks(predictions, timestamp), filename, 'application/json', options)
+    
+    except Exception as e:
+        logger.error(f"JSON export error: {str(e)}")
+        return jsonify({'error': f'JSON export failed: {str(e)}'}), 500
+
+@report_bp.route('/report/parquet', methods=['GET'])
+def export_parquet():
+    """
+    Export report as Parquet, straight from the columnar cache
+    
+    Query parameters:
+    - from / to: ISO timestamp bounds
+    - save=1: also keep a copy in reports/
+    """
+    try:
+        if not PARQUET_AVAILABLE:
+            return jsonify({'error': 'Parquet export requires pyarrow (pip install pyarrow)'}), 501
         
-        logger.info(f"JSON report exported: {filename}")
+        options = _export_options()
+        buffer = BytesIO()
+        rows = storage.columns.to_parquet(buffer, since=options['since'], until=options['until'])
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"void_rate_report_{timestamp}.parquet"
         
+        if options['save']:
+            filepath = os.path.join(current_app.config['REPORTS_FOLDER'], filename)
+            with open(filepath, 'wb') as f:
+                f.write(buffer.getbuffer())
+            artifact_index.record_write(filepath)
+        
+        logger.info(f"Parquet report exported: {filename} ({rows} rows)")
+        
+        buffer.seek(0)
         return send_file(
-            filepath,
-            mimetype='application/json',
+            buffer,
+            mimetype='application/vnd.apache.parquet',
             as_attachment=True,
             download_name=filename
         )
     
     except Exception as e:
-        logger.error(f"JSON export error: {str(e)}")
-        return jsonify({'error': f'JSON export failed: {str(e)}'}), 500
+        logger.error(f"Parquet export error: {str(e)}")
+        return jsonify({'error': f'Parquet export failed: {str(e)}'}), 500
@@ -6,110 +6,139 @@ POST /api/train - Trigger retraining with new labeled data
 from flask import Blueprint, request, jsonify, current_app
 import json
 import os
+import threading
+import time
 from datetime import datetime
 import logging
-import threading
 
 train_bp = Blueprint('train', __name__, url_prefix='/api')
 logger = logging.getLogger(__name__)
 
-from utils.retrain_pipeline import RetrainingPipeline
+from config import TRAINING_RESOURCES, FINE_TUNE_CONFIG, DISTILLATION_CONFIG
+from utils.training_jobs import TrainingJobStore, TrainingLauncher, idle_state
+from utils.event_bus import event_bus
 
-# Initialize retraining pipeline
-retrain_pipeline = RetrainingPipeline()
+# Jobs are shared by every worker process; training runs in its own process
+job_store = TrainingJobStore('training_data/jobs.db')
+launcher = TrainingLauncher(job_store, TRAINING_RESOURCES)
 
-# Track training status
-training_status = {
-    'is_training': False,
-    'progress': 0,
-    'status': 'idle',
-    'started_at': None,
-    'current_epoch': 0,
-    'total_epochs': 0
-}
+# Seconds between two checks of the job store for status changes
+STATUS_POLL_INTERVAL = 1.0
 
-def retrain_worker(num_epochs, learning_rate):
-    """Background worker for retraining"""
-    global training_status
-    try:
-        training_status['is_training'] = True
-        training_status['status'] = 'training'
-        training_status['started_at'] = datetime.now().isoformat()
-        
-        # Run retraining
-        results = retrain_pipeline.retrain(
-            num_epochs=num_epochs,
-            learning_rate=learning_rate,
-            progress_callback=lambda e, total: update_progress(e, total)
-        )
-        
-        training_status['status'] = 'completed'
-        training_status['is_training'] = False
-        training_status['progress'] = 100
-        
-        logger.info(f"Retraining completed: {results}")
-    
-    except Exception as e:
-        logger.error(f"Retraining error: {str(e)}")
-        training_status['status'] = 'error'
-        training_status['is_training'] = False
+def get_training_status():
+    """Status of the latest training job, whichever process started it"""
+    job = job_store.latest()
+    return dict(job['state'], job_id=job['job_id']) if job else idle_state()
+
+def publish_status():
+    """Push the current training status to the event stream"""
+    event_bus.publish('training', get_training_status())
 
-def update_progress(epoch, total_epochs):
-    """Update training progress"""
-    global training_status
-    training_status['current_epoch'] = epoch
-    training_status['total_epochs'] = total_epochs
-    training_status['progress'] = int((epoch / total_epochs) * 100)
-    logger.info(f"Training progress: {epoch}/{total_epochs}")
+def _watch_status():
+    """Publish the status whenever the training process writes it"""
+    last = None
+    while True:
+        try:
+            version = job_store.version()
+            if version != last:
+                last = version
+                publish_status()
+            launcher.reconcile()
+        except Exception as e:
+            logger.error(f"Training status watch error: {str(e)}")
+        time.sleep(STATUS_POLL_INTERVAL)
+
+threading.Thread(target=_watch_status, name='training-status-watch', daemon=True).start()
 
 @train_bp.route('/train', methods=['POST'])
 def train():
     """
     Trigger retraining with new labeled data
     
+    Training runs in a separate process with the thread count, CPU
+    affinity and nice level of config.TRAINING_RESOURCES.
+    
     Input:
     {
         "num_epochs": 10,
         "learning_rate": 0.001,
-        "batch_size": 4
+        "batch_size": 4,
+        "mode": "full"
     }
     
+    With "mode": "finetune" the backbone is frozen and only the new labels
+    plus a replay sample are trained on, within a time budget; num_epochs
+    and learning_rate then default to config.FINE_TUNE_CONFIG, and
+    "time_budget_minutes", "freeze" and "replay_size" can be given too.
+    
+    With "mode": "distill" the serving nano model is trained on the dataset
+    plus the unlabeled images pseudo-labeled by the teacher model (cached
+    predictions); num_epochs and learning_rate default to
+    config.DISTILLATION_CONFIG, and "conf" (minimum teacher confidence)
+    can be given too.
+    
     Returns:
     {
         "status": "success",
         "message": "Training started",
-        "training_id": "uuid"
+        "training_id": "job id"
     }
     """
     try:
-        global training_status
+        data = request.get_json(silent=True) or {}
+        num_epochs = int(data.get('num_epochs', 10))
+        learning_rate = float(data.get('learning_rate', 0.001))
+        batch_size = int(data.get('batch_size', 4))
+        mode = data.get('mode', 'full')
+        if mode not in ('full', 'finetune', 'distill'):
+            return jsonify({'error': f'Invalid training mode: {mode}'}), 400
         
-        if training_status['is_training']:
-            return jsonify({'error': 'Training already in progress'}), 400
+        params = {
+            'num_epochs': num_epochs,
+            'learning_rate': learning_rate,
+            'batch_size': batch_size,
+            'mode': mode
+        }
+        if mode == 'finetune':
+            fine_tune = {
+                'max_epochs': int(data.get('num_epochs', FINE_TUNE_CONFIG['max_epochs'])),
+                'learning_rate': float(data.get('learning_rate', FINE_TUNE_CONFIG['learning_rate'])),
+            }
+            for key, cast in (('time_budget_minutes', float), ('freeze', int), ('replay_size', int)):
+                if data.get(key) is not None:
+                    fine_tune[key] = cast(data[key])
+            params.update(num_epochs=fine_tune['max_epochs'], learning_rate=fine_tune['learning_rate'],
+                          fine_tune=fine_tune)
+            num_epochs, learning_rate = params['num_epochs'], params['learning_rate']
+        elif mode == 'distill':
+            distill = {
+                'epochs': int(data.get('num_epochs', DISTILLATION_CONFIG['epochs'])),
+                'learning_rate': float(data.get('learning_rate', DISTILLATION_CONFIG['learning_rate'])),
+            }
+            if data.get('conf') is not None:
+                distill['conf'] = float(data['conf'])
+            params.update(num_epochs=distill['epochs'], learning_rate=distill['learning_rate'], distill=distill)
+            num_epochs, learning_rate = params['num_epochs'], params['learning_rate']
         
-        data = request.get_json() or {}
-        num_epochs = data.get('num_epochs', 10)
-        learning_rate = data.get('learning_rate', 0.001)
-        batch_size = data.get('batch_size', 4)
-        
-        # Start retraining in background
-        training_thread = threading.Thread(
-            target=retrain_worker,
-            args=(num_epochs, learning_rate)
-        )
-        training_thread.daemon = True
-        training_thread.start()
+        job = launcher.start(params)
+        if job is None:
+            return jsonify({'error': 'Training already in progress'}), 400
         
-        logger.info(f"Training started: {num_epochs} epochs, lr={learning_rate}")
+        logger.info(f"Training started ({mode}): {num_epochs} epochs, lr={learning_rate}, job {job['job_id']}")
+        publish_status()
         
         return jsonify({
             'status': 'success',
             'message': 'Training started',
-            'training_id': datetime.now().isoformat(),
+            'training_id': job['job_id'],
+            'mode': mode,
             'epochs': num_epochs,
             'learning_rate': learning_rate
         }), 202
     
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid training parameters: {str(e)}'}), 400
+    
     except Exception as e:
         logger.error(f"Train start error: {str(e)}")
         return jsonify({'error': f'Training failed: {str(e)}'}), 500
@@ -122,7 +151,7 @@ def train_status():
     try:
         return jsonify({
             'status': 'success',
-            'training': training_status
+            'training': get_training_status()
         }), 200
     
     except Exception as e:
@@ -133,14 +162,15 @@ def train_status():
 def train_cancel():
     """
     Cancel ongoing training
+    
+    The trainer stops at its next batch; the status goes to 'cancelling'
+    and then to 'cancelled' once the training process has stopped.
     """
     try:
-        global training_status
-        if training_status['is_training']:
-            retrain_pipeline.cancel()
-            training_status['is_training'] = False
-            training_status['status'] = 'cancelled'
-            return jsonify({'status': 'success', 'message': 'Training cancelled'}), 200
+        job = job_store.latest()
+        if job and launcher.cancel(job['job_id']):
+            publish_status()
+            return jsonify({'status': 'success', 'message': 'Training cancellation requested'}), 202
         else:
             return jsonify({'error': 'No training in progress'}), 400
     
@@ -154,7 +184,11 @@ def train_history():
     Get training history
     """
     try:
-        history = retrain_pipeline.get_history()
+        history = [
+            dict(job['state'].get('result') or {}, job_id=job['job_id'], status=job['status'],
+                 created_at=job['created_at'], params=job['params'])
+            for job in job_store.history()
+        ]
         return jsonify({
             'status': 'success',
             'history': history
@@ -12,9 +12,9 @@ import logging
 validate_bp = Blueprint('validate', __name__, url_prefix='/api')
 logger = logging.getLogger(__name__)
 
-from utils.storage_manager import StorageManager
+from utils.storage_manager import get_storage_manager
 
-storage = StorageManager()
+storage = get_storage_manager()
 
 @validate_bp.route('/validate', methods=['POST'])
 def validate():
@@ -81,14 +81,16 @@ def validate_batch():
         if not images:
             return jsonify({'error': 'No images provided'}), 400
         
-        label_ids = []
-        for img_data in images:
-            label_id = storage.save_labels(
-                image_id=img_data.get('image_id'),
-                masks=img_data.get('masks', []),
-                timestamp=datetime.now().isoformat()
-            )
-            label_ids.append(label_id)
+        # One transaction for the whole batch
+        timestamp = datetime.now().isoformat()
+        label_ids = storage.save_labels_batch([
+            {
+                'image_id': img_data.get('image_id'),
+                'masks': img_data.get('masks', []),
+                'timestamp': timestamp
+            }
+            for img_data in images
+        ])
         
         logger.info(f"Batch validation: {len(label_ids)} images saved")
         
@@ -105,16 +107,32 @@ def validate_batch():
 @validate_bp.route('/labels', methods=['GET'])
 def get_labels():
     """
-    Get all labeled data
+    Get labeled data, newest first, one page at a time
+    
+    Query parameters:
+    - cursor: value of next_cursor from the previous page
+    - limit: page size (default 100, max 1000)
+    - image_id: only labels for this image
+    - from / to: ISO timestamp bounds
     """
     try:
-        labels = storage.get_all_labels()
+        labels, next_cursor = storage.list_labels(
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', default=100, type=int),
+            image_id=request.args.get('image_id'),
+            since=request.args.get('from'),
+            until=request.args.get('to')
+        )
         return jsonify({
             'status': 'success',
             'count': len(labels),
-            'labels': labels
+            'labels': labels,
+            'next_cursor': next_cursor
         }), 200
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     except Exception as e:
         logger.error(f"Get labels error: {str(e)}")
         return jsonify({'error': f'Failed to get labels: {str(e)}'}), 500
@@ -5,19 +5,21 @@ let areaChart = null;
 let historyChart = null;
 let trainingStatusInterval = null;
 let trainingStartTime = null;
+let eventSource = null;
+let dashboardReloadTimer = null;
 
 // Initialize dashboard on page load
 document.addEventListener('DOMContentLoaded', () => {
     initializeDashboard();
-    loadStatistics();
     setupCharts();
-    checkSystemStatus();
+    loadDashboard();
+    connectEvents();
 });
 
 function initializeDashboard() {
     const refreshBtn = document.getElementById('refreshBtn');
     if (refreshBtn) {
-        refreshBtn.addEventListener('click', loadStatistics);
+        refreshBtn.addEventListener('click', loadDashboard);
     }
 
     const exportReportBtn = document.getElementById('exportReportBtn');
@@ -51,37 +53,52 @@ function initializeDashboard() {
     }
 }
 
-// Load Statistics
-async function loadStatistics() {
+// Load every widget from the aggregated endpoint (304 when nothing changed)
+let dashboardEtag = null;
+
+async function loadDashboard() {
     try {
-        const response = await fetch('/api/report/summary');
-        if (!response.ok) throw new Error('Failed to load statistics');
+        const headers = dashboardEtag ? { 'If-None-Match': dashboardEtag } : {};
+        const response = await fetch('/api/dashboard', { headers, cache: 'no-store' });
+        if (response.status === 304) return;
+        if (!response.ok) throw new Error('Failed to load dashboard');
 
+        dashboardEtag = response.headers.get('ETag');
         const data = await response.json();
+
         updateStatistics(data);
+        updateVoidRateChart(data.recent_predictions || []);
+        updateAreaChart(data.areas || {});
+        updateHistoryChart(data.history || []);
+        updateSystemStatus(data.system || {});
 
     } catch (error) {
-        console.error('Error loading statistics:', error);
+        console.error('Error loading dashboard:', error);
     }
 }
 
 function updateStatistics(data) {
+    const summary = data.summary || {};
+
     // Update stat cards
     const totalImages = document.getElementById('totalImages');
     const avgVoidRate = document.getElementById('avgVoidRate');
 
-    if (totalImages) totalImages.textContent = data.total_images || 0;
-    if (avgVoidRate) avgVoidRate.textContent = (data.avg_void_rate || 0).toFixed(2) + '%';
+    if (totalImages) totalImages.textContent = summary.total_images || 0;
+    if (avgVoidRate) avgVoidRate.textContent = (summary.avg_void_rate || 0).toFixed(2) + '%';
 
     // Update labels info
+    const labels = data.labels || {};
     const totalLabels = document.getElementById('totalLabels');
-    if (totalLabels) totalLabels.textContent = data.total_labels || 0;
+    const storageUsed = document.getElementById('storageUsed');
+    if (totalLabels) totalLabels.textContent = labels.total || 0;
+    if (storageUsed) storageUsed.textContent = ((labels.storage_bytes || 0) / (1024 * 1024)).toFixed(1) + ' MB';
 
-    // Update recent labels
+    // Update recent predictions, newest first
     const labelsList = document.getElementById('labelsList');
-    if (labelsList && data.recent_labels) {
+    if (labelsList && data.recent_predictions) {
         labelsList.innerHTML = '';
-        data.recent_labels.slice(0, 5).forEach(label => {
+        data.recent_predictions.slice(-5).reverse().forEach(label => {
             const item = document.createElement('div');
             item.className = 'label-item';
             item.innerHTML = `
@@ -132,28 +149,14 @@ function setupVoidRateChart() {
         }
     });
 
-    loadVoidRateData();
 }
 
-async function loadVoidRateData() {
-    try {
-        const response = await fetch('/api/report/summary');
-        if (!response.ok) throw new Error('Failed to load data');
-
-        const data = await response.json();
-        
-        if (voidRateChart && data.predictions) {
-            const labels = data.predictions.slice(0, 20).map((_, i) => `Image ${i + 1}`);
-            const values = data.predictions.slice(0, 20).map(p => p.void_rate || 0);
-
-            voidRateChart.data.labels = labels;
-            voidRateChart.data.datasets[0].data = values;
-            voidRateChart.update();
-        }
+function updateVoidRateChart(predictions) {
+    if (!voidRateChart) return;
 
-    } catch (error) {
-        console.error('Error loading void rate data:', error);
-    }
+    voidRateChart.data.labels = predictions.map((_, i) => `Image ${i + 1}`);
+    voidRateChart.data.datasets[0].data = predictions.map(p => p.void_rate || 0);
+    voidRateChart.update();
 }
 
 function setupAreaChart() {
@@ -176,27 +179,13 @@ function setupAreaChart() {
         }
     });
 
-    loadAreaData();
 }
 
-async function loadAreaData() {
-    try {
-        const response = await fetch('/api/report/summary');
-        if (!response.ok) throw new Error('Failed to load data');
-
-        const data = await response.json();
-
-        if (areaChart && data.predictions && data.predictions.length > 0) {
-            const avgChip = data.predictions.reduce((a, p) => a + (p.chip_area || 0), 0) / data.predictions.length;
-            const avgHoles = data.predictions.reduce((a, p) => a + (p.holes_area || 0), 0) / data.predictions.length;
-
-            areaChart.data.datasets[0].data = [avgChip, avgHoles];
-            areaChart.update();
-        }
+function updateAreaChart(areas) {
+    if (!areaChart) return;
 
-    } catch (error) {
-        console.error('Error loading area data:', error);
-    }
+    areaChart.data.datasets[0].data = [areas.avg_chip_area || 0, areas.avg_holes_area || 0];
+    areaChart.update();
 }
 
 function setupHistoryChart() {
@@ -226,35 +215,34 @@ function setupHistoryChart() {
         }
     });
 
-    loadHistoryData();
 }
 
-async function loadHistoryData() {
-    try {
-        const response = await fetch('/api/report/summary');
-        if (!response.ok) throw new Error('Failed to load data');
+function updateHistoryChart(history) {
+    if (!historyChart) return;
 
-        const data = await response.json();
-
-        if (historyChart) {
-            const last7Days = [];
-            const counts = [];
+    // Materialized daily rollups: one row per day, no matter how many predictions
+    const counts = {};
+    history.forEach(row => { counts[row.bucket] = row.total_images; });
 
-            for (let i = 6; i >= 0; i--) {
-                const date = new Date();
-                date.setDate(date.getDate() - i);
-                last7Days.push(date.toLocaleDateString('en-US', { month: 'short', day: 'numeric' }));
-                counts.push(Math.floor(Math.random() * (data.total_images || 10)));
-            }
+    const labels = [];
+    const values = [];
+    for (let i = 89; i >= 0; i--) {
+        const date = new Date();
+        date.setDate(date.getDate() - i);
+        labels.push(date.toLocaleDateString('en-US', { month: 'short', day: 'numeric' }));
+        values.push(counts[isoDay(date)] || 0);
+    }
 
-            historyChart.data.labels = last7Days;
-            historyChart.data.datasets[0].data = counts;
-            historyChart.update();
-        }
+    historyChart.data.labels = labels;
+    historyChart.data.datasets[0].data = values;
+    historyChart.update();
+}
 
-    } catch (error) {
-        console.error('Error loading history data:', error);
-    }
+// Local calendar day as YYYY-MM-DD (rollup buckets use server local time)
+function isoDay(date) {
+    const month = String(date.getMonth() + 1).padStart(2, '0');
+    const day = String(date.getDate()).padStart(2, '0');
+    return `${date.getFullYear()}-${month}-${day}`;
 }
 
 // Training Functions
@@ -262,16 +250,26 @@ async function startTraining() {
     const epochs = parseInt(document.getElementById('epochs')?.value || '10');
     const batchSize = parseInt(document.getElementById('batchSize')?.value || '16');
     const learningRate = parseFloat(document.getElementById('learningRate')?.value || '0.001');
+    const mode = document.getElementById('trainingMode')?.value || 'full';
+    const params = {
+        batch_size: batchSize,
+        mode: mode
+    };
+    if (mode === 'full') {
+        params.num_epochs = epochs;
+        params.learning_rate = learningRate;
+    }
+    // Fine-tune and distillation take epochs and learning rate from
+    // config.FINE_TUNE_CONFIG / DISTILLATION_CONFIG
+    if (mode === 'finetune') {
+        params.time_budget_minutes = parseFloat(document.getElementById('timeBudget')?.value || '10');
+    }
 
     try {
         const response = await fetch('/api/train', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                num_epochs: epochs,
-                batch_size: batchSize,
-                learning_rate: learningRate
-            })
+            body: JSON.stringify(params)
         });
 
         if (!response.ok) throw new Error('Failed to start training');
@@ -299,22 +297,16 @@ function showTrainingMonitor() {
 }
 
 function monitorTraining() {
+    // Progress is pushed by /api/events; poll only without EventSource support
+    if (eventSource) return;
+
     trainingStatusInterval = setInterval(async () => {
         try {
             const response = await fetch('/api/train/status');
             if (!response.ok) return;
 
-            const status = await response.json();
-            updateTrainingProgress(status);
-
-            if (status.status === 'completed' || status.status === 'failed') {
-                clearInterval(trainingStatusInterval);
-                hideTrainingMonitor();
-                showNotification(`Training ${status.status}!`, 
-                    status.status === 'completed' ? 'success' : 'error');
-                loadStatistics();
-                setupCharts();
-            }
+            const data = await response.json();
+            handleTrainingStatus(data.training || {});
 
         } catch (error) {
             console.error('Error monitoring training:', error);
@@ -322,6 +314,29 @@ function monitorTraining() {
     }, 1000);
 }
 
+function handleTrainingStatus(status) {
+    const monitor = document.getElementById('trainingMonitor');
+    const monitoring = monitor && monitor.style.display !== 'none';
+
+    if (status.is_training) {
+        if (!monitoring) {
+            showTrainingMonitor();
+            trainingStartTime = status.started_at ? Date.parse(status.started_at) : Date.now();
+        }
+        updateTrainingProgress(status);
+        return;
+    }
+
+    if (monitoring && ['completed', 'error', 'cancelled'].includes(status.status)) {
+        clearInterval(trainingStatusInterval);
+        updateTrainingProgress(status);
+        hideTrainingMonitor();
+        showNotification(`Training ${status.status}!`,
+            status.status === 'completed' ? 'success' : status.status === 'cancelled' ? 'info' : 'error');
+        loadDashboard();
+    }
+}
+
 function updateTrainingProgress(status) {
     const progressBar = document.getElementById('trainingProgress');
     const progressPercent = document.getElementById('progressPercent');
@@ -353,8 +368,10 @@ function updateTrainingProgress(status) {
         const elapsed = Math.floor((Date.now() - trainingStartTime) / 1000);
         trainTime.textContent = formatTime(elapsed);
 
-        // Estimate remaining time
-        if (status.progress > 0 && trainEta) {
+        // Remaining time measured by the trainer, else estimated from progress
+        if (trainEta && status.eta_seconds != null) {
+            trainEta.textContent = formatTime(Math.round(status.eta_seconds));
+        } else if (status.progress > 0 && trainEta) {
             const totalTime = (elapsed / status.progress) * 100;
             const remaining = Math.floor(totalTime - elapsed);
             trainEta.textContent = formatTime(remaining);
@@ -384,9 +401,10 @@ async function cancelTraining() {
         const response = await fetch('/api/train/cancel', { method: 'POST' });
         if (!response.ok) throw new Error('Failed to cancel training');
 
-        clearInterval(trainingStatusInterval);
-        hideTrainingMonitor();
-        showNotification('Training cancelled', 'info');
+        // The monitor closes when the status turns 'cancelled'
+        const cancelBtn = document.getElementById('cancelTrainBtn');
+        if (cancelBtn) cancelBtn.disabled = true;
+        showNotification('Stopping training...', 'info');
 
     } catch (error) {
         console.error('Error:', error);
@@ -455,33 +473,27 @@ async function clearData() {
 }
 
 // System Status
-async function checkSystemStatus() {
-    try {
-        const response = await fetch('/api/health');
-        const health = await response.json();
+function updateSystemStatus(system) {
+    const apiHealth = document.getElementById('apiHealth');
+    const modelStatus = document.getElementById('modelStatus');
 
-        const apiHealth = document.getElementById('apiHealth');
-        const modelStatus = document.getElementById('modelStatus');
-
-        if (apiHealth) {
-            apiHealth.textContent = health.status === 'ok' ? '✓ Online' : '✗ Offline';
-            apiHealth.className = health.status === 'ok' ? 'stat-value status-ok' : 'stat-value status-error';
-        }
+    if (apiHealth) {
+        apiHealth.textContent = system.status === 'ok' ? '✓ Online' : '✗ Offline';
+        apiHealth.className = system.status === 'ok' ? 'stat-value status-ok' : 'stat-value status-error';
+    }
 
-        if (modelStatus && health.model) {
-            modelStatus.textContent = 'Ready';
-        }
+    if (modelStatus) {
+        modelStatus.textContent = system.models_available > 0 ? 'Ready' : 'No model';
+    }
 
-        // Check system info
-        const samStatus = document.getElementById('samStatus');
-        const gpuStatus = document.getElementById('gpuStatus');
+    const samStatus = document.getElementById('samStatus');
+    const gpuStatus = document.getElementById('gpuStatus');
 
-        if (samStatus) samStatus.textContent = health.sam_available ? '✓ Available' : '✗ Not Available';
-        if (gpuStatus) gpuStatus.textContent = health.gpu_available ? '✓ Yes' : '✗ No';
+    if (samStatus) samStatus.textContent = system.sam_available ? '✓ Available' : '✗ Not Available';
+    if (gpuStatus) gpuStatus.textContent = system.gpu_available ? '✓ Yes' : '✗ No';
 
-    } catch (error) {
-        console.error('Error checking system status:', error);
-    }
+    const lastUpdated = document.getElementById('lastUpdated');
+    if (lastUpdated) lastUpdated.textContent = new Date().toLocaleTimeString();
 }
 
 function viewLabel(labelId) {
@@ -509,5 +521,27 @@ function showNotification(message, type = 'info') {
     setTimeout(() => notification.remove(), 3000);
 }
 
-// Refresh statistics every 30 seconds
-setInterval(loadStatistics, 30000);
+// Live updates pushed by the server (Server-Sent Events)
+function connectEvents() {
+    if (!window.EventSource) {
+        // Revalidate every 30 seconds (answered with 304 while nothing changed)
+        setInterval(loadDashboard, 30000);
+        return;
+    }
+
+    eventSource = new EventSource('/api/events');
+    eventSource.addEventListener('training', e => handleTrainingStatus(JSON.parse(e.data)));
+    eventSource.addEventListener('predictions', scheduleDashboardReload);
+    eventSource.addEventListener('resync', scheduleDashboardReload);
+    // Catch up on anything missed while disconnected
+    eventSource.addEventListener('open', scheduleDashboardReload);
+}
+
+// Coalesce bursts of events into at most one conditional reload every 2 seconds
+function scheduleDashboardReload() {
+    if (dashboardReloadTimer) return;
+    dashboardReloadTimer = setTimeout(() => {
+        dashboardReloadTimer = null;
+        loadDashboard();
+    }, 2000);
+}
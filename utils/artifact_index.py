@@ -0,0 +1,222 @@
+"""
+Artifact Index
+Keeps file counts and byte totals of the data folders in memory
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff'}
+# Reads recheck directory mtimes at most this often (seconds)
+REFRESH_INTERVAL = 2.0
+
+
+def classify(filename):
+    """Artifact type of a file, from its name"""
+    name = filename.lower()
+    if name.endswith('_mask.png'):
+        return 'mask'
+    if name.endswith('_results.json'):
+        return 'results'
+    suffix = os.path.splitext(name)[1]
+    if suffix in IMAGE_EXTENSIONS:
+        return 'image'
+    if suffix == '.pt':
+        return 'model'
+    if suffix in ('.json', '.jsonl'):
+        return 'json'
+    if suffix in ('.csv', '.gz', '.parquet'):
+        return 'report'
+    if suffix in ('.db', '.sqlite'):
+        return 'database'
+    return 'other'
+
+
+class ArtifactIndex:
+    """
+    In-memory index of the files under a set of folders
+
+    Rebuilt once with os.scandir at startup, then kept current by
+    record_write / record_delete so that status queries are O(1).
+    Files written by other processes (training worker, other Flask
+    workers) are picked up by refresh(): only the directories whose mtime
+    changed are rescanned, at most every REFRESH_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._roots = {}    # folder name -> resolved path
+        self._files = {}    # resolved file path -> (folder, type, size)
+        self._totals = {}   # folder -> {'files', 'bytes', 'types': {type: {'files', 'bytes'}}}
+        self._dirs = {}     # directory path -> (folder, mtime_ns when scanned)
+        self._checked = 0.0
+
+    def rebuild(self, folders):
+        """Scan folders from scratch (recursively) and replace the index"""
+        files = {}
+        roots = {}
+        dirs = {}
+        for folder in folders:
+            root = Path(folder).resolve()
+            roots[folder] = root
+            self._scan(folder, str(root), files, dirs)
+
+        totals = {folder: self._empty_totals() for folder in folders}
+        for folder, file_type, size in files.values():
+            self._add(totals[folder], file_type, 1, size)
+
+        with self._lock:
+            self._roots = roots
+            self._files = files
+            self._totals = totals
+            self._dirs = dirs
+            self._checked = time.monotonic()
+
+        logger.info(f"Artifact index rebuilt: {len(files)} files in {len(folders)} folders")
+
+    def refresh(self, force=False):
+        """Rescan the directories created, changed or removed since they were last scanned"""
+        if not force and time.monotonic() - self._checked < REFRESH_INTERVAL:
+            return
+        with self._refresh_lock:
+            with self._lock:
+                known = dict(self._dirs)
+                roots = dict(self._roots)
+
+            files, scanned, removed = {}, {}, []
+            for folder, root in roots.items():
+                if str(root) not in known and root.is_dir():
+                    self._scan(folder, str(root), files, scanned)
+            for directory, (folder, mtime) in known.items():
+                try:
+                    current = os.stat(directory).st_mtime_ns
+                except FileNotFoundError:
+                    removed.append(directory)
+                    continue
+                if current == mtime:
+                    continue
+                for sub in self._scan(folder, directory, files, scanned, recursive=False):
+                    if sub not in known:
+                        self._scan(folder, sub, files, scanned)
+
+            if scanned or removed:
+                stale = set(scanned) | set(removed)
+                with self._lock:
+                    for path in [p for p in self._files if os.path.dirname(p) in stale]:
+                        folder, file_type, size = self._files.pop(path)
+                        self._add(self._totals[folder], file_type, -1, -size)
+                    for path, entry in files.items():
+                        self._files[path] = entry
+                        self._add(self._totals[entry[0]], entry[1], 1, entry[2])
+                    for directory in removed:
+                        self._dirs.pop(directory, None)
+                    self._dirs.update(scanned)
+            self._checked = time.monotonic()
+
+    @staticmethod
+    def _scan(folder, directory, files, dirs, recursive=True):
+        """
+        Add the files under a directory to `files` and each scanned directory's mtime to `dirs`
+
+        Returns:
+            The subdirectories not recursed into (recursive=False)
+        """
+        stack = [directory]
+        subdirs = []
+        while stack:
+            path = stack.pop()
+            try:
+                # Taken before listing, so a change during the listing is rescanned next time
+                mtime = os.stat(path).st_mtime_ns
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            (stack if recursive else subdirs).append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            size = entry.stat(follow_symlinks=False).st_size
+                            files[entry.path] = (folder, classify(entry.name), size)
+            except FileNotFoundError:
+                continue
+            dirs[path] = (folder, mtime)
+        return subdirs
+
+    def record_write(self, path):
+        """Register a file that was created, appended to or overwritten"""
+        resolved = Path(path).resolve()
+        folder = self._folder_of(resolved)
+        if folder is None:
+            return
+        try:
+            size = resolved.stat().st_size
+        except OSError:
+            return
+
+        key = str(resolved)
+        with self._lock:
+            previous = self._files.get(key)
+            file_type = classify(resolved.name)
+            if previous is not None:
+                self._add(self._totals[folder], previous[1], -1, -previous[2])
+            self._files[key] = (folder, file_type, size)
+            self._add(self._totals[folder], file_type, 1, size)
+
+    def record_delete(self, path):
+        """Register a file that was removed"""
+        key = str(Path(path).resolve())
+        with self._lock:
+            previous = self._files.pop(key, None)
+            if previous is not None:
+                folder, file_type, size = previous
+                self._add(self._totals[folder], file_type, -1, -size)
+
+    def count(self, folder, file_type=None):
+        """Number of files under a folder, or only those of one type (e.g. 'model')"""
+        self.refresh()
+        with self._lock:
+            totals = self._totals.get(folder, {})
+            if file_type is not None:
+                return totals.get('types', {}).get(file_type, {}).get('files', 0)
+            return totals.get('files', 0)
+
+    def snapshot(self):
+        """Per-folder file counts, byte totals and per-type breakdown"""
+        self.refresh()
+        with self._lock:
+            return {
+                folder: {
+                    'files': totals['files'],
+                    'bytes': totals['bytes'],
+                    'types': {t: dict(v) for t, v in totals['types'].items()},
+                }
+                for folder, totals in self._totals.items()
+            }
+
+    def _folder_of(self, resolved):
+        for folder, root in self._roots.items():
+            if resolved == root or root in resolved.parents:
+                return folder
+        return None
+
+    @staticmethod
+    def _empty_totals():
+        return {'files': 0, 'bytes': 0, 'types': {}}
+
+    @staticmethod
+    def _add(totals, file_type, files, size):
+        totals['files'] += files
+        totals['bytes'] += size
+        entry = totals['types'].setdefault(file_type, {'files': 0, 'bytes': 0})
+        entry['files'] += files
+        entry['bytes'] += size
+        if entry['files'] <= 0:
+            del totals['types'][file_type]
+
+
+# Process-wide index, rebuilt by app.py at startup and refreshed on reads
+artifact_index = ArtifactIndex()
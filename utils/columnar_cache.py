@@ -0,0 +1,274 @@
+"""
+Columnar Prediction Cache
+Predictions kept as append-only NumPy column chunks for exports and vectorized aggregations
+"""
+
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+import logging
+
+import numpy as np
+
+from utils.prediction_stats import inclusive_until
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# Column name -> (record key, dtype, default)
+COLUMNS = {
+    'timestamp': ('timestamp', np.float64, 0.0),
+    'void_rate': ('void_rate', np.float64, 0.0),
+    'chip_area': ('chip_area', np.int64, 0),
+    'holes_area': ('holes_area', np.int64, 0),
+    'confidence': ('confidence', np.float32, 0.0),
+    'num_chips': ('num_chips', np.int32, 0),
+    'num_holes': ('num_holes', np.int32, 0),
+    'image_id': ('image_id', np.str_, ''),
+    'image_name': ('image_name', np.str_, ''),
+}
+
+CHUNK_ROWS = 65536
+
+
+def to_epoch(timestamp):
+    """ISO timestamp -> seconds since the epoch (0.0 if missing or invalid)"""
+    if not timestamp:
+        return 0.0
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ColumnarPredictionCache:
+    """
+    Column-oriented copy of the prediction ledger
+
+    Rows are buffered in Python lists and sealed into NumPy arrays every
+    CHUNK_ROWS rows. Sealed chunks are written once to disk as .npz files
+    with the ledger offset they end at, so a restart loads them directly
+    and only replays the ledger after the last sealed chunk.
+
+    In memory the sealed chunks are kept concatenated (extended once per
+    seal) and the buffer is converted to arrays only when it grew, so
+    queries never copy the whole history. Time ranges are located with
+    searchsorted on parts whose timestamps are in order.
+    """
+
+    def __init__(self, ledger, directory, legacy_file=None, chunk_rows=CHUNK_ROWS):
+        self.ledger = ledger
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.legacy_file = Path(legacy_file) if legacy_file else None
+        self.chunk_rows = chunk_rows
+
+        self._lock = threading.RLock()
+        self._chunk_count = 0
+        self._sealed = None         # concatenated sealed chunks
+        self._sealed_sorted = True  # their timestamps are non-decreasing
+        self._buffer = {name: [] for name in COLUMNS}
+        self._tail = None           # (buffer arrays, sorted) until the buffer grows
+        self._offset = 0
+
+        self._load_chunks()
+        self.refresh()
+        ledger.add_commit_listener(lambda records, end_offset: self.refresh())
+
+    def __len__(self):
+        with self._lock:
+            sealed = len(self._sealed['timestamp']) if self._sealed is not None else 0
+            return sealed + len(self._buffer['timestamp'])
+
+    def refresh(self):
+        """Append the ledger records written since the last refresh"""
+        with self._lock:
+            try:
+                size = self.ledger.path.stat().st_size
+            except FileNotFoundError:
+                return
+            if size <= self._offset:
+                return
+            for end, record in self.ledger.read(start=self._offset):
+                self._append(record)
+                self._offset = end
+                if len(self._buffer['timestamp']) >= self.chunk_rows:
+                    self._seal()
+            self._tail = None
+
+    def columns(self, since=None, until=None, names=None):
+        """
+        Column arrays, optionally restricted to a time range
+
+        Args:
+            since / until: ISO timestamp bounds (inclusive)
+            names: subset of column names (all by default)
+
+        Returns:
+            dict of column name -> numpy array
+        """
+        names = names or list(COLUMNS)
+        parts = self._parts(since, until)
+        if not parts:
+            return {name: np.array([], dtype=COLUMNS[name][1]) for name in names}
+        if len(parts) == 1:
+            return {name: parts[0][name] for name in names}
+        return {name: np.concatenate([p[name] for p in parts]) for name in names}
+
+    def summary(self, since=None, until=None):
+        """Vectorized summary statistics, in the /api/report/summary format"""
+        parts = [p for p in self._parts(since, until) if len(p['void_rate'])]
+        if not parts:
+            return {'total_images': 0, 'avg_void_rate': 0, 'min_void_rate': 0, 'max_void_rate': 0}
+        count = sum(len(p['void_rate']) for p in parts)
+        mean = sum(float(p['void_rate'].sum()) for p in parts) / count
+        squares = sum(float(np.square(p['void_rate']).sum()) for p in parts) / count
+        return {
+            'total_images': count,
+            'avg_void_rate': mean,
+            'min_void_rate': min(float(p['void_rate'].min()) for p in parts),
+            'max_void_rate': max(float(p['void_rate'].max()) for p in parts),
+            'std_void_rate': float(np.sqrt(max(squares - mean * mean, 0.0))),
+            'total_chip_area': sum(int(p['chip_area'].sum()) for p in parts),
+            'total_holes_area': sum(int(p['holes_area'].sum()) for p in parts),
+        }
+
+    def recent(self, n=20):
+        """The n most recent predictions as a list of dicts (oldest first)"""
+        rows = []
+        for part in reversed(self._parts()):
+            for i in range(len(part['timestamp']) - 1, -1, -1):
+                if len(rows) == n:
+                    break
+                rows.append({
+                    'image_name': str(part['image_name'][i]),
+                    'void_rate': float(part['void_rate'][i]),
+                    'chip_area': int(part['chip_area'][i]),
+                    'holes_area': int(part['holes_area'][i]),
+                    'timestamp': datetime.fromtimestamp(part['timestamp'][i]).isoformat(),
+                })
+        return rows[::-1]
+
+    def _parts(self, since=None, until=None):
+        """The sealed and buffered columns (at most two parts), restricted to [since, until]"""
+        self.refresh()
+        with self._lock:
+            if self._tail is None:
+                tail = self._buffer_arrays()
+                self._tail = (tail, self._in_order(tail['timestamp']))
+            parts = [
+                (part, ordered) for part, ordered in ((self._sealed, self._sealed_sorted), self._tail)
+                if part is not None and len(part['timestamp'])
+            ]
+
+        low = to_epoch(since) if since else None
+        high = to_epoch(inclusive_until(until)) if until else None
+        if low is None and high is None:
+            return [part for part, _ in parts]
+
+        selected = []
+        for part, ordered in parts:
+            ts = part['timestamp']
+            if ordered:
+                start = int(np.searchsorted(ts, low, side='left')) if low is not None else 0
+                stop = int(np.searchsorted(ts, high, side='right')) if high is not None else len(ts)
+                selected.append({name: values[start:stop] for name, values in part.items()})
+            else:
+                mask = np.ones(len(ts), dtype=bool)
+                if low is not None:
+                    mask &= ts >= low
+                if high is not None:
+                    mask &= ts <= high
+                selected.append({name: values[mask] for name, values in part.items()})
+        return selected
+
+    @staticmethod
+    def _in_order(timestamps):
+        return bool(len(timestamps) < 2 or np.all(timestamps[1:] >= timestamps[:-1]))
+
+    def to_parquet(self, sink, since=None, until=None):
+        """Write the (filtered) columns to a Parquet file or buffer"""
+        if not PARQUET_AVAILABLE:
+            raise RuntimeError("pyarrow is not installed. Install with: pip install pyarrow")
+        cols = self.columns(since, until)
+        table = pa.table({
+            **{name: cols[name] for name in COLUMNS if name != 'timestamp'},
+            'timestamp': pa.array((cols['timestamp'] * 1e6).astype('int64'), type=pa.timestamp('us')),
+        })
+        pq.write_table(table, sink, compression='zstd')
+        return table.num_rows
+
+    def _append(self, record):
+        for name, (key, dtype, default) in COLUMNS.items():
+            value = record.get(key, default)
+            if name == 'timestamp':
+                value = to_epoch(value)
+            elif dtype is np.str_:
+                value = '' if value is None else str(value)
+            elif value is None:
+                value = default
+            self._buffer[name].append(value)
+
+    def _buffer_arrays(self):
+        return {
+            name: np.array(values, dtype=COLUMNS[name][1])
+            for name, values in self._buffer.items()
+        }
+
+    def _seal(self):
+        """Turn the buffer into an immutable chunk and persist it"""
+        chunk = self._buffer_arrays()
+        index = self._chunk_count
+        path = self.directory / f"chunk_{index:06d}.npz"
+        np.savez(path, **chunk)
+        with open(path.with_suffix('.json'), 'w') as f:
+            json.dump({'rows': len(chunk['timestamp']), 'ledger_offset': self._offset}, f)
+
+        self._add_sealed([chunk])
+        self._buffer = {name: [] for name in COLUMNS}
+
+    def _add_sealed(self, chunks):
+        """Extend the concatenated sealed columns with new chunks"""
+        previous = self._sealed
+        parts = ([previous] if previous is not None else []) + chunks
+        self._sealed = {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+        # Only the new rows and their boundary with the previous ones need checking
+        start = len(previous['timestamp']) - 1 if previous is not None else 0
+        self._sealed_sorted = self._sealed_sorted and self._in_order(self._sealed['timestamp'][max(start, 0):])
+        self._chunk_count += len(chunks)
+
+    def _load_chunks(self):
+        """Load sealed chunks from disk, or fold the legacy JSONL if there are none"""
+        meta_paths = sorted(self.directory.glob('chunk_*.json'))
+        chunks = []
+        for position, meta_path in enumerate(meta_paths):
+            try:
+                with open(meta_path, 'r') as f:
+                    meta = json.load(f)
+                with np.load(meta_path.with_suffix('.npz')) as npz:
+                    chunk = {name: npz[name] for name in COLUMNS}
+            except (OSError, ValueError, KeyError) as e:
+                # Chunks are append-only: drop the first unusable one and everything
+                # after it, the ledger tail is replayed from the last good chunk
+                logger.warning(f"Discarding columnar chunks from {meta_path}: {e}")
+                for stale in meta_paths[position:]:
+                    stale.unlink(missing_ok=True)
+                    stale.with_suffix('.npz').unlink(missing_ok=True)
+                break
+            chunks.append(chunk)
+            self._offset = int(meta['ledger_offset'])
+        if chunks:
+            self._add_sealed(chunks)
+
+        if not chunks and self.legacy_file and self.legacy_file.exists():
+            with open(self.legacy_file, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        self._append(json.loads(line))
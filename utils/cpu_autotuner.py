@@ -0,0 +1,457 @@
+"""
+CPU Auto-Tuner
+Calibrates training throughput on this host and derives a tuned CPU preset, cached per host fingerprint
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from importlib import metadata
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+MODEL_SIZES = 'nsmlx'
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+# Seconds a single calibration step may take before it is abandoned
+PROBE_TIMEOUT = 300
+
+
+def _read_proc(path, field):
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                if line.startswith(field):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return None
+
+
+def _memory_mb(field):
+    value = _read_proc('/proc/meminfo', field)
+    return int(value.split()[0]) // 1024 if value else None
+
+
+def _version(package):
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def host_fingerprint(limits):
+    """
+    Short hash of what decides training throughput here: CPU model, CPUs and
+    threads granted to training, memory and the torch/ultralytics versions
+
+    Returns:
+        (fingerprint, details)
+    """
+    details = {
+        'machine': platform.machine(),
+        'cpu_model': _read_proc('/proc/cpuinfo', 'model name') or platform.processor(),
+        'cpus': len(limits['cpus']),
+        'threads': limits['threads'],
+        'memory_total_mb': _memory_mb('MemTotal'),
+        'python': platform.python_version(),
+        'torch': _version('torch'),
+        'ultralytics': _version('ultralytics'),
+    }
+    digest = hashlib.sha256(json.dumps(details, sort_keys=True).encode('utf-8')).hexdigest()
+    return digest[:16], details
+
+
+def training_images(data_yaml, split='train'):
+    """Image paths of a data.yaml split (folders or .txt lists, Roboflow '../' paths)"""
+    import yaml
+
+    data_yaml = Path(data_yaml)
+    if not data_yaml.exists():
+        return []
+    with open(data_yaml, 'r') as f:
+        data = yaml.safe_load(f) or {}
+    entries = data.get(split)
+    images = []
+    for entry in (entries if isinstance(entries, list) else [entries]):
+        if not entry:
+            continue
+        for candidate in (data_yaml.parent / entry, data_yaml.parent / entry.replace('../', '', 1)):
+            if candidate.is_dir():
+                images += sorted(str(p) for p in candidate.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+                break
+            if candidate.suffix == '.txt' and candidate.is_file():
+                images += [line.strip() for line in candidate.read_text().splitlines() if line.strip()]
+                break
+    return images
+
+
+def _tensors(outputs):
+    if hasattr(outputs, 'float'):
+        return [outputs]
+    if isinstance(outputs, (list, tuple)):
+        return [t for item in outputs for t in _tensors(item)]
+    return []
+
+
+def probe_compute(model_size, imgsz, batch, steps=3, warmup=1):
+    """
+    Images/s of forward + backward + SGD step of a YOLO-seg model on random batches
+
+    The target assignment of the real loss is not included; it costs about
+    the same for every candidate, so the ranking is unaffected.
+    """
+    import torch
+    from ultralytics import YOLO
+
+    net = YOLO(f"yolov8{model_size}-seg.yaml").model
+    net.train()
+    for parameter in net.parameters():
+        parameter.requires_grad_(True)
+    optimizer = torch.optim.SGD(net.parameters(), lr=0.001, momentum=0.9)
+    images = torch.rand(batch, 3, imgsz, imgsz)
+
+    durations = []
+    for step in range(warmup + steps):
+        started = time.perf_counter()
+        optimizer.zero_grad()
+        loss = sum(t.float().mean() for t in _tensors(net(images)))
+        loss.backward()
+        optimizer.step()
+        if step >= warmup:
+            durations.append(time.perf_counter() - started)
+
+    return {
+        'images_per_second': round(batch * len(durations) / sum(durations), 2),
+        'step_seconds': round(sum(durations) / len(durations), 3),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+    }
+
+
+def probe_loader(images, imgsz, workers, batch=4, samples=64, use_cache=True):
+    """
+    Images/s delivered by a DataLoader with `workers` processes
+
+    Reads the memmap image cache when use_cache is set (as training does
+    with config.TRAINING_CACHE enabled), otherwise decodes and resizes.
+    """
+    import numpy as np
+    import torch
+    from torch.utils.data import DataLoader, Dataset
+
+    from utils.image_cache import ImageCache, resize_image
+
+    cache_root = tempfile.mkdtemp(prefix='autotune_cache_')
+    try:
+        cache = None
+        if use_cache:
+            cache = ImageCache(cache_root, 'probe', imgsz)
+            cache.prepare(images, workers=max(1, workers))
+
+        class Probe(Dataset):
+            def __len__(self):
+                return samples
+
+            def __getitem__(self, i):
+                path = images[i % len(images)]
+                im = cache.get(path)[0] if cache else resize_image(path, imgsz)[0]
+                padded = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+                padded[:im.shape[0], :im.shape[1]] = im
+                return torch.from_numpy(padded).permute(2, 0, 1).float() / 255
+
+        loader = DataLoader(Probe(), batch_size=batch, num_workers=workers)
+        iterator = iter(loader)
+        next(iterator)  # worker start-up is not part of the steady state
+        started = time.perf_counter()
+        count = sum(len(item) for item in iterator)
+        elapsed = time.perf_counter() - started
+        worker_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // 1024 if workers else 0
+        return {
+            'images_per_second': round(count / elapsed, 2) if elapsed else None,
+            'worker_peak_rss_mb': worker_rss,
+        }
+    finally:
+        shutil.rmtree(cache_root, ignore_errors=True)
+
+
+class CPUAutoTuner:
+    """
+    Measures training throughput for candidate model sizes, image sizes,
+    batch sizes and loader worker counts, then picks a preset
+
+    Every calibration step runs in its own process with the CPU set,
+    thread count and priority training gets (config.TRAINING_RESOURCES),
+    which also gives a clean peak memory per candidate. Measurements are
+    stored in <cache_dir>/<host fingerprint>.json; only candidates missing
+    from that file are measured again.
+    """
+
+    def __init__(self, candidates=None, resources=None, cache_dir='training_data/autotune',
+                 data_yaml='data.yaml'):
+        from config import AUTOTUNE_CONFIG, TRAINING_CACHE, TRAINING_RESOURCES
+        from utils.training_jobs import resolve_resources
+
+        self.candidates = dict(AUTOTUNE_CONFIG, **(candidates or {}))
+        self.limits = resolve_resources(resources or TRAINING_RESOURCES)
+        self.use_cache = TRAINING_CACHE['enabled']
+        self.cache_dir = Path(cache_dir)
+        self.data_yaml = data_yaml
+        self.fingerprint, self.host = host_fingerprint(self.limits)
+        self.cache_path = self.cache_dir / f"{self.fingerprint}.json"
+
+    def calibrate(self, force=False):
+        """
+        Measure every candidate not measured yet on this host
+
+        Returns:
+            The calibration: host details, compute and loader measurements
+        """
+        calibration = None if force else self._load()
+        if calibration is None:
+            calibration = {'fingerprint': self.fingerprint, 'host': self.host, 'compute': {}, 'loader': {}}
+
+        workers = [w for w in self.candidates['workers'] if w < self.limits['threads']] or [0]
+        for model_size in self.candidates['model_sizes']:
+            for imgsz in self.candidates['img_sizes']:
+                failed = None
+                for batch in sorted(self.candidates['batch_sizes']):
+                    key = f"{model_size}_{imgsz}_{batch}"
+                    if key in calibration['compute']:
+                        failed = failed or calibration['compute'][key].get('error') and batch
+                        continue
+                    if failed:
+                        # Larger batches of this model/size will not fit either
+                        calibration['compute'][key] = {'error': f"skipped, batch {failed} failed"}
+                        continue
+                    result = self._probe({'kind': 'compute', 'model_size': model_size, 'imgsz': imgsz,
+                                          'batch': batch, 'steps': self.candidates['steps']})
+                    calibration['compute'][key] = result
+                    self._save(calibration)
+                    if result.get('error'):
+                        failed = batch
+
+        images = None
+        for imgsz in self.candidates['img_sizes']:
+            for worker_count in workers:
+                key = f"{imgsz}_{worker_count}"
+                if key in calibration['loader']:
+                    continue
+                if images is None:
+                    images = self._calibration_images()
+                calibration['loader'][key] = self._probe({'kind': 'loader', 'images': images[:64], 'imgsz': imgsz,
+                                                          'workers': worker_count, 'use_cache': self.use_cache})
+                self._save(calibration)
+
+        if images is not None:
+            self._cleanup_images(images)
+        return calibration
+
+    def tune(self, num_images, epochs=None, target_minutes=30, memory_limit_mb=None, force=False):
+        """
+        Tuned CPU preset for a dataset of num_images
+
+        For each model size and image size the batch size and loader worker
+        count with the highest estimated throughput within the memory limit
+        are kept. The largest model (then image size) that trains `epochs`
+        epochs within target_minutes wins; if none does, the fastest one is
+        used and epochs is lowered to fit the target.
+
+        Args:
+            num_images: Training images per epoch
+            epochs: Epochs wanted (default: those of the dataset-size preset)
+            target_minutes: Wall-clock target of the whole training
+            memory_limit_mb: Peak memory allowed (default: share of available memory)
+            force: Recalibrate even if this host has cached measurements
+
+        Returns:
+            Preset dict (config.py keys, plus workers, threads and autotune details)
+        """
+        from config import get_config_for_dataset_size
+
+        calibration = self.calibrate(force=force)
+        base = dict(get_config_for_dataset_size(num_images))
+        epochs = int(epochs or base['epochs'])
+        if memory_limit_mb is None:
+            available = _memory_mb('MemAvailable') or self.host['memory_total_mb'] or 0
+            memory_limit_mb = int(available * self.candidates['memory_fraction'])
+
+        options = self._estimates(calibration, memory_limit_mb)
+        if not options:
+            raise RuntimeError(f"No calibrated configuration fits in {memory_limit_mb} MB")
+
+        required = num_images * epochs / (target_minutes * 60)
+        best = {}
+        for option in options:
+            key = (option['model_size'], option['img_size'])
+            if key not in best or option['images_per_second'] > best[key]['images_per_second']:
+                best[key] = option
+        fitting = [o for o in best.values() if o['images_per_second'] >= required]
+        if fitting:
+            chosen = max(fitting, key=lambda o: (MODEL_SIZES.index(o['model_size']), o['img_size']))
+        else:
+            chosen = max(best.values(), key=lambda o: o['images_per_second'])
+            epochs = max(1, int(target_minutes * 60 * chosen['images_per_second'] / num_images))
+
+        epoch_seconds = num_images / chosen['images_per_second']
+        preset = dict(base)
+        preset.update({
+            'model_size': chosen['model_size'],
+            'img_size': chosen['img_size'],
+            'batch_size': chosen['batch_size'],
+            'epochs': epochs,
+            'workers': chosen['workers'],
+            'threads': self.limits['threads'],
+            'device': 'cpu',
+            'autotune': {
+                'fingerprint': self.fingerprint,
+                'images_per_second': chosen['images_per_second'],
+                'epoch_seconds': round(epoch_seconds, 1),
+                'estimated_minutes': round(epoch_seconds * epochs / 60, 1),
+                'target_minutes': target_minutes,
+                'meets_target': bool(fitting),
+                'peak_memory_mb': chosen['peak_memory_mb'],
+                'memory_limit_mb': memory_limit_mb,
+                'bottleneck': chosen['bottleneck'],
+            },
+        })
+        logger.info(f"Tuned preset for {self.fingerprint}: {preset['autotune']}")
+        return preset
+
+    def _estimates(self, calibration, memory_limit_mb):
+        """
+        Training throughput of every calibrated combination
+
+        Without workers, loading and compute are serial; with workers they
+        overlap, but the workers take CPU time from the compute threads.
+        """
+        threads = self.limits['threads']
+        options = []
+        for key, compute in calibration['compute'].items():
+            if compute.get('error'):
+                continue
+            model_size, imgsz, batch = key.split('_')
+            for loader_key, loader in calibration['loader'].items():
+                loader_imgsz, workers = (int(v) for v in loader_key.split('_'))
+                if loader_imgsz != int(imgsz) or loader.get('error') or not loader['images_per_second']:
+                    continue
+                compute_ips = compute['images_per_second']
+                if workers:
+                    compute_ips *= max(1, threads - workers) / threads
+                    ips = min(compute_ips, loader['images_per_second'])
+                else:
+                    ips = 1 / (1 / compute_ips + 1 / loader['images_per_second'])
+                memory = compute['peak_rss_mb'] + workers * loader['worker_peak_rss_mb']
+                if memory > memory_limit_mb:
+                    continue
+                options.append({
+                    'model_size': model_size,
+                    'img_size': int(imgsz),
+                    'batch_size': int(batch),
+                    'workers': workers,
+                    'images_per_second': round(ips, 2),
+                    'peak_memory_mb': memory,
+                    'bottleneck': 'loader' if loader['images_per_second'] < compute_ips else 'compute',
+                })
+        return options
+
+    def _probe(self, spec):
+        env = os.environ.copy()
+        for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+            env[name] = str(self.limits['threads'])
+        command = [
+            sys.executable, '-m', 'utils.cpu_autotuner',
+            '--probe', json.dumps(spec),
+            '--threads', str(self.limits['threads']),
+            '--cpus', ','.join(str(cpu) for cpu in self.limits['cpus']),
+            '--nice', str(self.limits['nice']),
+        ]
+        label = {k: v for k, v in spec.items() if k != 'images'}
+        try:
+            completed = subprocess.run(command, cwd=str(PROJECT_DIR), env=env, capture_output=True,
+                                       text=True, timeout=PROBE_TIMEOUT)
+            if completed.returncode != 0:
+                error = (completed.stderr.strip().splitlines() or ['failed'])[-1]
+                logger.warning(f"Calibration step {label} failed: {error}")
+                return {'error': error}
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            logger.info(f"Calibration step {label}: {result}")
+            return result
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Calibration step {label} timed out")
+            return {'error': 'timeout'}
+
+    def _calibration_images(self):
+        """Real training images if there are any, otherwise synthetic 640x640 JPEGs"""
+        images = training_images(self.data_yaml)
+        if images:
+            return images[:64]
+
+        import cv2
+        import numpy as np
+
+        directory = Path(tempfile.mkdtemp(prefix='autotune_images_'))
+        rng = np.random.default_rng(0)
+        synthetic = []
+        for i in range(16):
+            path = directory / f"synthetic_{i}.jpg"
+            cv2.imwrite(str(path), rng.integers(0, 255, (640, 640, 3), dtype=np.uint8))
+            synthetic.append(str(path))
+        return synthetic
+
+    @staticmethod
+    def _cleanup_images(images):
+        parent = Path(images[0]).parent
+        if parent.name.startswith('autotune_images_'):
+            shutil.rmtree(parent, ignore_errors=True)
+
+    def _load(self):
+        try:
+            with open(self.cache_path, 'r') as f:
+                calibration = json.load(f)
+            return calibration if calibration.get('fingerprint') == self.fingerprint else None
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, calibration):
+        calibration['updated'] = datetime.now().isoformat()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_path.with_suffix(f'.json.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(calibration, f, indent=2)
+        os.replace(tmp_path, self.cache_path)
+
+
+def main(argv=None):
+    """Calibration step process: python -m utils.cpu_autotuner --probe '<json>' ..."""
+    parser = argparse.ArgumentParser(description='Run one calibration step')
+    parser.add_argument('--probe', required=True)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--cpus', default='')
+    parser.add_argument('--nice', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from utils.training_worker import apply_limits
+    apply_limits(args.threads, [int(cpu) for cpu in args.cpus.split(',') if cpu], args.nice)
+
+    spec = json.loads(args.probe)
+    if spec['kind'] == 'compute':
+        result = probe_compute(spec['model_size'], spec['imgsz'], spec['batch'], steps=spec.get('steps', 3))
+    else:
+        result = probe_loader(spec['images'], spec['imgsz'], spec['workers'], use_cache=spec.get('use_cache', True))
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""
+Dataset Builder
+Incremental, content-hashed YOLO-seg training sets built from validated labels
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+import logging
+
+import yaml
+from PIL import Image
+
+from utils.group_commit import FileLock
+from utils.yolo_labels import CLASS_NAMES, polygon_lines
+
+logger = logging.getLogger(__name__)
+
+
+def link_file(src, dst):
+    """Hard-link src to dst, copying only when linking is impossible (other device)"""
+    if dst.exists():
+        if os.path.samefile(src, dst):
+            return
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _sha256_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DatasetBuilder:
+    """
+    Turns the validated labels of the label store into versioned YOLO datasets
+
+    Every sample lives once in a content-addressed pool (pool/images/<image
+    sha>.<ext>, pool/labels/<sample hash>.txt). A build converts only labels
+    whose image or masks changed since the previous build - image hashes are
+    cached by size and mtime - and then assembles an immutable snapshot
+    (versions/vNNNN) out of hard links to the pool. When nothing changed the
+    latest snapshot is reused as-is.
+    """
+
+    def __init__(self, label_store, root='training_data', image_dirs=('uploads',),
+                 base_data='data.yaml', keep_versions=5):
+        self.label_store = label_store
+        self.root = Path(root)
+        self.image_dirs = [Path(d) for d in image_dirs]
+        self.base_data = Path(base_data)
+        self.keep_versions = keep_versions
+        self.pool_images = self.root / 'pool' / 'images'
+        self.pool_labels = self.root / 'pool' / 'labels'
+        self.versions_dir = self.root / 'versions'
+        self.manifest_path = self.root / 'manifest.json'
+
+    def build(self):
+        """
+        Bring the pool up to date and return the dataset version to train on
+
+        Returns:
+            Dict with version, data_yaml, per-outcome sample counts and
+            whether the previous snapshot was reused
+        """
+        for directory in (self.pool_images, self.pool_labels, self.versions_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        # One build at a time, across processes
+        with FileLock(self.root / 'build.lock'):
+            manifest = self._load_manifest()
+            previous = manifest['samples']
+            images = manifest['images']
+            samples = {}
+            counts = {'added': 0, 'changed': 0, 'unchanged': 0, 'missing_image': 0, 'no_polygons': 0}
+            latest = manifest['versions'][-1] if manifest['versions'] else None
+            number = int(latest['version'][1:]) + 1 if latest else 1
+
+            # Oldest first: the latest label of an image wins
+            latest_masks = {}
+            for label in self.label_store.iter_all():
+                if label.get('image_id'):
+                    latest_masks[label['image_id']] = label.get('masks')
+
+            for image_id, masks in latest_masks.items():
+                source = self._find_image(image_id)
+                if source is None:
+                    counts['missing_image'] += 1
+                    continue
+
+                image = self._image_entry(source, images)
+                lines = polygon_lines(masks, (image['width'], image['height']))
+                if not lines:
+                    counts['no_polygons'] += 1
+                    continue
+
+                text = '\n'.join(lines) + '\n'
+                sample_hash = hashlib.sha256((image['sha'] + '\n' + text).encode('utf-8')).hexdigest()
+                samples[image_id] = {
+                    'name': Path(image_id).stem,
+                    'image': f"{image['sha']}{source.suffix.lower()}",
+                    'label': f"{sample_hash}.txt",
+                    'source': str(source),
+                    'text': text,
+                    'objects': len(lines),
+                }
+
+            for image_id, sample in samples.items():
+                old = previous.get(image_id)
+                if old and old['label'] == sample['label'] and (self.pool_labels / sample['label']).exists():
+                    counts['unchanged'] += 1
+                    sample['added_in'] = old.get('added_in')
+                else:
+                    counts['changed' if old else 'added'] += 1
+                    # First version whose snapshot contains this label
+                    sample['added_in'] = f"v{number:04d}"
+                    self._write_pool(sample)
+                del sample['text'], sample['source']
+            counts['removed'] = len(set(previous) - set(samples))
+
+            digest = hashlib.sha256(json.dumps(
+                sorted((s['name'], s['image'], s['label']) for s in samples.values())
+            ).encode('utf-8')).hexdigest()
+
+            reused = bool(latest and latest['digest'] == digest and (self.versions_dir / latest['version']).exists())
+            if reused:
+                version = latest
+            else:
+                version = self._snapshot(samples, digest, number)
+                manifest['versions'].append(version)
+                self._prune(manifest)
+
+            # Forget cached hashes of images no sample uses anymore
+            used = {sample['image'].split('.')[0] for sample in samples.values()}
+            manifest['images'] = {path: entry for path, entry in images.items() if entry['sha'] in used}
+            manifest['samples'] = samples
+            self._save_manifest(manifest)
+
+        logger.info(f"Dataset {version['version']} ({'reused' if reused else 'built'}): {counts}")
+        return {
+            'version': version['version'],
+            'data_yaml': str(self.versions_dir / version['version'] / 'data.yaml'),
+            'samples': len(samples),
+            'reused': reused,
+            **counts,
+        }
+
+    def samples(self):
+        """Samples of the latest build: image_id -> name, pool files, objects, added_in"""
+        with FileLock(self.root / 'build.lock'):
+            return self._load_manifest()['samples']
+
+    def _find_image(self, image_id):
+        if not image_id:
+            return None
+        name = Path(image_id).name
+        for directory in self.image_dirs:
+            path = directory / name
+            if path.is_file():
+                return path
+        return None
+
+    @staticmethod
+    def _image_entry(source, images):
+        """Hash and size of an image, recomputed only if its size or mtime changed"""
+        stat = source.stat()
+        key = str(source.resolve())
+        entry = images.get(key)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry
+
+        with Image.open(source) as image:
+            width, height = image.size
+        entry = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha': _sha256_file(source),
+            'width': width,
+            'height': height,
+        }
+        images[key] = entry
+        return entry
+
+    def _write_pool(self, sample):
+        image_path = self.pool_images / sample['image']
+        if not image_path.exists():
+            link_file(Path(sample['source']), image_path)
+
+        label_path = self.pool_labels / sample['label']
+        tmp_path = label_path.with_suffix(f'.txt.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(sample['text'])
+        os.replace(tmp_path, label_path)
+
+    def _snapshot(self, samples, digest, number):
+        """Assemble versions/vNNNN from hard links to the pool (built aside, then renamed)"""
+        name = f"v{number:04d}"
+        target = self.versions_dir / name
+        tmp_dir = self.versions_dir / f".{name}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        images_dir = tmp_dir / 'train' / 'images'
+        labels_dir = tmp_dir / 'train' / 'labels'
+        images_dir.mkdir(parents=True)
+        labels_dir.mkdir(parents=True)
+
+        for sample in samples.values():
+            link_file(self.pool_images / sample['image'], images_dir / f"{sample['name']}{Path(sample['image']).suffix}")
+            link_file(self.pool_labels / sample['label'], labels_dir / f"{sample['name']}.txt")
+
+        with open(tmp_dir / 'data.yaml', 'w') as f:
+            yaml.dump(self._data_yaml(target, bool(samples)), f)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_dir, target)
+
+        return {
+            'version': name,
+            'digest': digest,
+            'samples': len(samples),
+            'created': datetime.now().isoformat(),
+        }
+
+    def _data_yaml(self, target, has_samples):
+        """data.yaml of a snapshot: the base train set plus the snapshot's samples"""
+        base = {}
+        if self.base_data.exists():
+            with open(self.base_data, 'r') as f:
+                base = yaml.safe_load(f) or {}
+
+        def resolve(path):
+            # Roboflow exports point one level above the yaml ('../train/images')
+            if not path:
+                return None
+            for candidate in (self.base_data.parent / path, self.base_data.parent / path.replace('../', '', 1)):
+                if candidate.is_dir():
+                    return str(candidate.resolve())
+            return None
+
+        snapshot_train = str((target / 'train' / 'images').resolve())
+        base_train = resolve(base.get('train'))
+        train = [p for p in (base_train, snapshot_train if has_samples else None) if p]
+        val = resolve(base.get('val')) or (train[0] if train else snapshot_train)
+        names = base.get('names', CLASS_NAMES)
+
+        return {
+            'train': train if len(train) > 1 else (train[0] if train else snapshot_train),
+            'val': val,
+            'nc': base.get('nc', len(names)),
+            'names': names,
+        }
+
+    def _prune(self, manifest):
+        """Drop old snapshots, then pool files no snapshot links to anymore"""
+        stale = manifest['versions'][:-self.keep_versions] if self.keep_versions else []
+        if not stale:
+            return
+        for version in stale:
+            shutil.rmtree(self.versions_dir / version['version'], ignore_errors=True)
+        manifest['versions'] = manifest['versions'][len(stale):]
+
+        # A pool file no snapshot (nor its source upload) links to has a single link left
+        for directory in (self.pool_images, self.pool_labels):
+            for path in directory.iterdir():
+                if path.stat().st_nlink == 1:
+                    path.unlink()
+
+    def _load_manifest(self):
+        if self.manifest_path.exists():
+            try:
+                with open(self.manifest_path, 'r') as f:
+                    manifest = json.load(f)
+                if all(key in manifest for key in ('images', 'samples', 'versions')):
+                    return manifest
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable dataset manifest: {e}")
+        return {'images': {}, 'samples': {}, 'versions': []}
+
+    def _save_manifest(self, manifest):
+        manifest['updated'] = datetime.now().isoformat()
+        tmp_path = self.manifest_path.with_suffix(f'.json.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,246 @@
+"""
+Distillation
+Cached teacher predictions turned into pseudo-labels, so a large model supervises the nano student
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+import logging
+
+import yaml
+
+from utils.dataset_builder import link_file
+from utils.group_commit import FileLock
+from utils.yolo_labels import polygon_lines
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+# Teacher detections are cached down to this confidence; pseudo-labels use a higher threshold
+CACHE_CONF = 0.25
+PREDICT_BATCH = 8
+
+
+def _sha256_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TeacherCache:
+    """
+    Teacher outputs (class, confidence, normalized box and mask polygon of
+    every detection) per image, computed once
+
+    Entries live in <root>/<teacher sha>_<imgsz>/predictions.jsonl keyed by
+    the image content hash, so a new teacher or image size starts a new
+    cache, and renamed or re-uploaded images are not predicted twice.
+    """
+
+    def __init__(self, root, teacher_path, imgsz):
+        self.teacher_path = str(teacher_path)
+        self.imgsz = int(imgsz)
+        self.teacher_sha = _sha256_file(self.teacher_path)
+        self.dir = Path(root) / f"{self.teacher_sha[:16]}_{self.imgsz}"
+        self.path = self.dir / 'predictions.jsonl'
+        self._lock = FileLock(self.dir / 'predictions.lock')
+
+    def load(self):
+        entries = {}
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line of an interrupted run
+                    entries[entry['sha']] = entry
+        return entries
+
+    def predictions(self, images, should_stop=None):
+        """
+        Teacher detections of every image, running the teacher only on uncached ones
+
+        Returns:
+            ({image path: entry}, number of images the teacher ran on)
+        """
+        with self._lock:
+            cached = self.load()
+            shas = {str(path): _sha256_file(path) for path in images}
+            missing = [path for path, sha in shas.items() if sha not in cached]
+
+            if missing:
+                from ultralytics import YOLO
+
+                teacher = YOLO(self.teacher_path)
+                logger.info(f"Teacher {self.dir.name}: predicting {len(missing)} images")
+                with open(self.path, 'a') as f:
+                    for start in range(0, len(missing), PREDICT_BATCH):
+                        if should_stop and should_stop():
+                            break
+                        batch = missing[start:start + PREDICT_BATCH]
+                        results = teacher.predict(batch, imgsz=self.imgsz, conf=CACHE_CONF, device='cpu',
+                                                  verbose=False)
+                        for path, result in zip(batch, results):
+                            entry = self._entry(shas[path], result)
+                            cached[entry['sha']] = entry
+                            f.write(json.dumps(entry) + '\n')
+                        f.flush()
+                        os.fsync(f.fileno())
+
+        found = {path: cached[sha] for path, sha in shas.items() if sha in cached}
+        return found, len(missing)
+
+    @staticmethod
+    def _entry(sha, result):
+        height, width = result.orig_shape
+        detections = []
+        boxes = result.boxes
+        polygons = result.masks.xyn if result.masks is not None else [None] * len(boxes)
+        for i in range(len(boxes)):
+            polygon = polygons[i]
+            detections.append({
+                'class_id': int(boxes.cls[i]),
+                'confidence': round(float(boxes.conf[i]), 4),
+                'box': [round(float(v), 5) for v in boxes.xyxyn[i]],
+                'polygon': [[round(float(x), 5), round(float(y), 5)] for x, y in polygon] if polygon is not None else None,
+            })
+        return {'sha': sha, 'width': width, 'height': height, 'detections': detections}
+
+
+class DistillationSetBuilder:
+    """
+    Training set of a distillation run: the labeled dataset version plus
+    the unlabeled images, labeled by the teacher
+
+    Images with a validated label keep it. Every other image of the
+    unlabeled folders gets the teacher detections above `conf` as its
+    label; the set links to the images instead of copying them.
+    """
+
+    def __init__(self, dataset_builder, teacher_cache, root='training_data/distill', keep_runs=3):
+        self.dataset_builder = dataset_builder
+        self.teacher_cache = teacher_cache
+        self.root = Path(root)
+        self.keep_runs = keep_runs
+
+    def build(self, dataset, unlabeled_dirs, conf=0.5, should_stop=None):
+        """
+        Args:
+            dataset: Result of DatasetBuilder.build()
+            unlabeled_dirs: Folders of images without validated labels (e.g. uploads)
+            conf: Minimum teacher confidence of a pseudo-label
+
+        Returns:
+            Dict with data_yaml, the pseudo-labeled image and object counts and teacher cache stats
+        """
+        labeled = {sample['name'] for sample in self.dataset_builder.samples().values()}
+        images = []
+        for directory in unlabeled_dirs:
+            directory = Path(directory)
+            if directory.is_dir():
+                images += sorted(p for p in directory.iterdir()
+                                 if p.suffix.lower() in IMAGE_EXTENSIONS and p.stem not in labeled)
+
+        predictions, predicted = self.teacher_cache.predictions(images, should_stop=should_stop)
+
+        run_dir = self.root / f"{dataset['version']}_{self.teacher_cache.dir.name}"
+        tmp_dir = self.root / f".{run_dir.name}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        images_dir = tmp_dir / 'train' / 'images'
+        labels_dir = tmp_dir / 'train' / 'labels'
+        images_dir.mkdir(parents=True)
+        labels_dir.mkdir(parents=True)
+
+        pseudo_labeled = objects = 0
+        for path, entry in predictions.items():
+            path = Path(path)
+            detections = [d for d in entry['detections'] if d['confidence'] >= conf]
+            lines = polygon_lines(detections, (entry['width'], entry['height']))
+            if not lines:
+                continue
+            link_file(path, images_dir / path.name)
+            with open(labels_dir / f"{path.stem}.txt", 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+            pseudo_labeled += 1
+            objects += len(lines)
+
+        with open(dataset['data_yaml'], 'r') as f:
+            data = yaml.safe_load(f) or {}
+        train = data.get('train')
+        train = list(train) if isinstance(train, list) else [train]
+        if pseudo_labeled:
+            train.append(str((run_dir / 'train' / 'images').resolve()))
+        data['train'] = train
+        with open(tmp_dir / 'data.yaml', 'w') as f:
+            yaml.dump(data, f)
+
+        shutil.rmtree(run_dir, ignore_errors=True)
+        os.replace(tmp_dir, run_dir)
+        self._prune()
+
+        logger.info(f"Distillation set {run_dir.name}: {pseudo_labeled}/{len(images)} unlabeled images "
+                    f"pseudo-labeled ({objects} objects, teacher ran on {predicted})")
+        return {
+            'data_yaml': str(run_dir / 'data.yaml'),
+            'unlabeled_images': len(images),
+            'pseudo_labeled': pseudo_labeled,
+            'pseudo_objects': objects,
+            'teacher_predicted': predicted,
+            'teacher_cached': len(predictions) - predicted,
+        }
+
+    def _prune(self):
+        runs = sorted((p for p in self.root.iterdir() if p.is_dir() and not p.name.startswith('.')),
+                      key=lambda p: p.stat().st_mtime)
+        for stale in runs[:-self.keep_runs] if self.keep_runs else []:
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+def train_teacher(preset_name, data_yaml='data.yaml', output=None, epochs=None):
+    """
+    Train a teacher from one of the large config.py presets (HIGH_QUALITY_TRAINING, PRODUCTION_TRAINING)
+
+    Returns:
+        Path of the teacher weights
+    """
+    import config
+    from ultralytics import YOLO
+
+    from utils.image_cache import cached_trainer
+
+    preset = getattr(config, preset_name)
+    model_name = f"yolov8{preset['model_size']}-seg"
+    output = Path(output or f"models/teacher_{model_name}.pt")
+
+    model = YOLO(f"{model_name}.pt")
+    train_args = {}
+    if config.TRAINING_CACHE['enabled']:
+        train_args['trainer'] = cached_trainer('base', config.TRAINING_CACHE['root'], config.TRAINING_CACHE['keep'])
+    model.train(
+        data=data_yaml,
+        epochs=epochs or preset['epochs'],
+        imgsz=preset['img_size'],
+        batch=preset['batch_size'],
+        patience=preset['patience'],
+        lr0=preset['learning_rate'],
+        cos_lr=preset.get('lr_scheduler') == 'cosine',
+        weight_decay=preset.get('weight_decay', 0.0005),
+        device='cpu',
+        workers=config.TRAINING_CACHE['loader_workers'],
+        project='runs/teacher',
+        name=model_name,
+        exist_ok=True,
+        verbose=False,
+        **train_args
+    )
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(model.trainer.best, output)
+    logger.info(f"Teacher trained with {preset_name}: {output}")
+    return output
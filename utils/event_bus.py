@@ -0,0 +1,101 @@
+"""
+Event Bus
+In-process publish/subscribe channel feeding the Server-Sent Events stream
+"""
+
+import itertools
+import threading
+import time
+from collections import deque
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    One client's bounded event buffer
+
+    When the client falls behind, the oldest events are dropped and the
+    next read reports it, so a slow client never holds memory or blocks
+    publishers.
+    """
+
+    def __init__(self, max_buffer):
+        self._events = deque(maxlen=max_buffer)
+        self._condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, event):
+        with self._condition:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            self._condition.notify()
+
+    def get(self, timeout):
+        """
+        Wait up to timeout seconds for events
+
+        Returns:
+            (events, dropped) - every buffered event (possibly none) and the
+            number of events dropped since the previous call
+        """
+        with self._condition:
+            if not self._events and not self.closed:
+                self._condition.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            dropped, self.dropped = self.dropped, 0
+            return events, dropped
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+
+
+class EventBus:
+    """Fan-out of named events to every subscribed client"""
+
+    def __init__(self, max_buffer=100):
+        self.max_buffer = max_buffer
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self._latest = {}
+
+    def subscribe(self):
+        subscription = Subscription(self.max_buffer)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, name, data):
+        """Send an event to every subscriber (never blocks)"""
+        event = {'id': next(self._ids), 'event': name, 'data': data, 'time': time.time()}
+        with self._lock:
+            self._latest[name] = event
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def latest(self):
+        """Most recent event of each name, for clients that just connected"""
+        with self._lock:
+            return sorted(self._latest.values(), key=lambda event: event['id'])
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+# Process-wide bus; publishers and the /api/events route share it
+event_bus = EventBus()
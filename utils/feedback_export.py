@@ -0,0 +1,180 @@
+"""
+Feedback Export
+Streams flagged feedback into a YOLO-seg train/images + train/labels dataset
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import logging
+
+from PIL import Image
+
+from utils.dataset_builder import link_file
+from utils.feedback_index import StaleCursorError, record_id
+from utils.group_commit import FileLock
+from utils.yolo_labels import polygon_lines
+
+logger = logging.getLogger(__name__)
+
+# Feedback records read from the log per page
+PAGE_SIZE = 500
+
+
+class FeedbackExporter:
+    """
+    Incremental export of feedback records into a YOLO-seg dataset
+
+    Records are paged from the feedback index, so the log is never loaded
+    whole. A flagged prediction is wrong by definition, so the labels come
+    from the label store: the latest validated correction of the image.
+    Records whose image has none yet are skipped. Each sample is written by
+    a thread pool: the image is hard-linked into train/images and the
+    corrected polygons go to train/labels/<stem>.txt. A manifest
+    (feedback_manifest.json) remembers the exported record ids and the label
+    they used, so a re-export only handles new feedback and new corrections.
+    """
+
+    def __init__(self, feedback_manager, label_store, image_dirs, workers=8):
+        self.feedback_manager = feedback_manager
+        self.label_store = label_store
+        self.image_dirs = [Path(d) for d in image_dirs]
+        self.workers = workers
+
+    def _find_image(self, filename):
+        name = Path(filename).name
+        for directory in self.image_dirs:
+            path = directory / name
+            if path.is_file():
+                return path
+        return None
+
+    def _correction(self, record):
+        """Latest validated label of the record's image, or None"""
+        name = Path(record.get('image_filename') or '').name
+        if not name:
+            return None
+        labels, _ = self.label_store.query(image_id=name, limit=1)
+        return labels[0] if labels else None
+
+    def _export_one(self, record, label, images_dir, labels_dir):
+        """Write one sample; returns (status, manifest entry)"""
+        source = self._find_image(record.get('image_filename') or '')
+        if source is None:
+            return 'missing_image', None
+
+        with Image.open(source) as image:
+            size = image.size
+
+        lines = polygon_lines(label.get('masks'), size)
+        if not lines:
+            return 'no_polygons', None
+
+        label_path = labels_dir / f"{source.stem}.txt"
+        tmp_path = label_path.with_suffix(f'.txt.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, label_path)
+        link_file(source, images_dir / source.name)
+
+        return 'exported', {
+            'image': source.name,
+            'label': label_path.name,
+            'objects': len(lines),
+            'label_id': label['label_id'],
+            'user_feedback': record.get('user_feedback'),
+        }
+
+    def export(self, output_dir, feedback_types=('incorrect', 'partial')):
+        """
+        Export the records of the given feedback types not exported yet (or
+        whose image got a newer correction since)
+
+        Args:
+            output_dir: Dataset root; train/images and train/labels are created in it
+            feedback_types: Feedback values to export
+
+        Returns:
+            Counts of exported, already exported and skipped records
+            (no_correction: no validated label for the image yet)
+        """
+        output_dir = Path(output_dir)
+        images_dir = output_dir / 'train' / 'images'
+        labels_dir = output_dir / 'train' / 'labels'
+        images_dir.mkdir(parents=True, exist_ok=True)
+        labels_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path = output_dir / 'feedback_manifest.json'
+
+        counts = {'exported': 0, 'already_exported': 0, 'no_correction': 0, 'missing_image': 0, 'no_polygons': 0, 'failed': 0}
+
+        # One export at a time per dataset, across processes
+        with FileLock(output_dir / 'feedback_export.lock'):
+            manifest = self._load_manifest(manifest_path)
+            samples = manifest['samples']
+
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='feedback-export') as pool:
+                cursor = None
+                while True:
+                    try:
+                        records, cursor = self.feedback_manager.query_feedback(
+                            feedback_types=list(feedback_types), cursor=cursor, limit=PAGE_SIZE
+                        )
+                    except StaleCursorError:
+                        # The log was compacted between two pages; the manifest
+                        # skips what was already exported
+                        cursor = None
+                        continue
+                    pending = []
+                    for record in records:
+                        rid = record_id(record)
+                        label = self._correction(record)
+                        if label is None:
+                            counts['no_correction'] += 1
+                            continue
+                        exported = samples.get(rid)
+                        if exported and exported.get('label_id') == label['label_id'] \
+                                and (labels_dir / exported['label']).exists():
+                            counts['already_exported'] += 1
+                            continue
+                        pending.append((rid, pool.submit(self._export_one, record, label, images_dir, labels_dir)))
+
+                    for rid, future in pending:
+                        try:
+                            status, entry = future.result()
+                        except Exception as e:
+                            logger.error(f"Feedback export error for {rid}: {str(e)}")
+                            counts['failed'] += 1
+                            continue
+                        counts[status] += 1
+                        if entry is not None:
+                            samples[rid] = entry
+
+                    if pending:
+                        self._save_manifest(manifest_path, manifest)
+                    if cursor is None:
+                        break
+
+        logger.info(f"Feedback export to {output_dir}: {counts}")
+        return {'success': True, 'output_dir': str(output_dir), 'total_samples': len(samples), **counts}
+
+    @staticmethod
+    def _load_manifest(path):
+        if path.exists():
+            try:
+                with open(path, 'r') as f:
+                    manifest = json.load(f)
+                if isinstance(manifest.get('samples'), dict):
+                    return manifest
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable export manifest: {e}")
+        return {'samples': {}}
+
+    @staticmethod
+    def _save_manifest(path, manifest):
+        manifest['updated'] = datetime.now().isoformat()
+        tmp_path = path.with_suffix(f'.json.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, path)
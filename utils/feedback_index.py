@@ -0,0 +1,173 @@
+"""
+Feedback Index
+Secondary indexes of the feedback log by status and feedback type, holding byte offsets
+"""
+
+import heapq
+import json
+import os
+from bisect import bisect_left, bisect_right, insort
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _delta_encode(offsets):
+    return [offset - previous for previous, offset in zip([0] + offsets[:-1], offsets)]
+
+
+def _delta_decode(deltas):
+    offsets, total = [], 0
+    for delta in deltas:
+        total += delta
+        offsets.append(total)
+    return offsets
+
+
+class StaleCursorError(ValueError):
+    """Cursor issued for a feedback log that has since been compacted or cleared"""
+
+
+def record_id(record):
+    """Stable id of a feedback record (legacy records without one use their timestamp)"""
+    return record.get('id') or record.get('timestamp')
+
+
+class FeedbackIndex:
+    """
+    Sorted lists of log offsets per status and per feedback type
+
+    Offsets are appended in log order, so every list stays sorted and a
+    page is found with one bisect; only the records returned are read
+    from the log. Status transitions move a record's offset between the
+    status lists and are remembered as overrides of the status written
+    in the record itself.
+    """
+
+    KINDS = ('status', 'type')
+
+    def __init__(self):
+        self.log_offset = 0
+        self.log_inode = None
+        self.offsets = {kind: {} for kind in self.KINDS}
+        self.positions = {}     # record id -> offset
+        self.overrides = {}     # offset -> status set by a transition
+        self.transitions = 0    # transition lines in the current log
+
+    def add(self, offset, record):
+        """Index the record starting at offset (offsets must be increasing)"""
+        self.offsets['status'].setdefault(record.get('status', 'pending'), []).append(offset)
+        self.offsets['type'].setdefault(record.get('user_feedback', 'unsure'), []).append(offset)
+        self.positions[record_id(record)] = offset
+
+    def apply_transition(self, rid, status):
+        """
+        Move a record to another status
+
+        Returns:
+            The record's previous status, or None if the id is unknown
+        """
+        self.transitions += 1
+        offset = self.positions.get(rid)
+        if offset is None:
+            return None
+
+        previous = self.status_at(offset)
+        if previous is None or previous == status:
+            return previous
+
+        offsets = self.offsets['status'][previous]
+        del offsets[bisect_left(offsets, offset)]
+        insort(self.offsets['status'].setdefault(status, []), offset)
+        self.overrides[offset] = status
+        return previous
+
+    def status_at(self, offset):
+        """Current status of the record at offset"""
+        if offset in self.overrides:
+            return self.overrides[offset]
+        for status, offsets in self.offsets['status'].items():
+            position = bisect_left(offsets, offset)
+            if position < len(offsets) and offsets[position] == offset:
+                return status
+        return None
+
+    def find(self, kind, keys, cursor=None, limit=100):
+        """
+        Offsets of the records matching any of keys, oldest first
+
+        Args:
+            kind: 'status' or 'type'
+            keys: values to match
+            cursor: only offsets after this one
+            limit: page size (None for all)
+
+        Returns:
+            (offsets, next_cursor) - next_cursor is None on the last page
+        """
+        lists = []
+        for key in keys:
+            offsets = self.offsets[kind].get(key, [])
+            start = bisect_right(offsets, cursor) if cursor is not None else 0
+            lists.append(offsets[start:] if limit is None else offsets[start:start + limit + 1])
+
+        merged = list(heapq.merge(*lists)) if len(lists) > 1 else (lists[0] if lists else [])
+        if limit is None or len(merged) <= limit:
+            return merged, None
+        return merged[:limit], merged[limit - 1]
+
+    def count(self, kind, key):
+        return len(self.offsets[kind].get(key, []))
+
+    def counts(self, kind):
+        return {key: len(offsets) for key, offsets in self.offsets[kind].items()}
+
+    def save(self, path):
+        """Write the index as a compact, delta-encoded sidecar (temp file + rename)"""
+        path = Path(path)
+        ordered = sorted(self.positions.items(), key=lambda item: item[1])
+        data = {
+            'log_offset': self.log_offset,
+            'log_inode': self.log_inode,
+            'transitions': self.transitions,
+            'offsets': {
+                kind: {key: _delta_encode(offsets) for key, offsets in groups.items()}
+                for kind, groups in self.offsets.items()
+            },
+            'ids': [rid for rid, _ in ordered],
+            'id_offsets': _delta_encode([offset for _, offset in ordered]),
+            'overrides': [[offset, status] for offset, status in self.overrides.items()],
+        }
+        tmp_path = path.with_suffix(f'{path.suffix}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Feedback index save error: {str(e)}")
+
+    def load(self, path):
+        """Load a sidecar written by save(); False if it is missing or unreadable"""
+        path = Path(path)
+        if not path.exists():
+            return False
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            self.offsets = {
+                kind: {key: _delta_decode(deltas) for key, deltas in data['offsets'].get(kind, {}).items()}
+                for kind in self.KINDS
+            }
+            self.positions = dict(zip(data['ids'], _delta_decode(data['id_offsets'])))
+            self.overrides = {offset: status for offset, status in data['overrides']}
+            self.transitions = int(data['transitions'])
+            self.log_inode = data['log_inode']
+            self.log_offset = int(data['log_offset'])
+            return True
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable feedback index: {e}")
+            self.__init__()
+            return False
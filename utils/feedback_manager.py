@@ -3,25 +3,43 @@ Feedback Management System for Active Learning
 Handles user feedback collection, storage, and analysis
 """
 
+import atexit
 import json
 import os
+import threading
+import time
+import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import logging
 
+from utils.event_bus import event_bus
+from utils.feedback_export import FeedbackExporter
+from utils.feedback_index import FeedbackIndex, StaleCursorError, record_id
+from utils.group_commit import FileLock, GroupCommitWriter
+
 logger = logging.getLogger(__name__)
 
 
 class FeedbackManager:
     """Manages user feedback for model improvements"""
     
-    def __init__(self, feedback_dir: str = "feedback_data"):
+    MAX_PAGE_SIZE = 1000
+    
+    def __init__(self, feedback_dir: str = "feedback_data", snapshot_every: int = 100,
+                 snapshot_interval: float = 5.0, index_save_every: int = 10000,
+                 compact_interval: float = 300.0, compact_min_transitions: int = 1000):
         """
         Initialize FeedbackManager
         
         Args:
             feedback_dir: Directory to store feedback files
+            snapshot_every: Persist the stats snapshot after this many new records
+            snapshot_interval: ... or when this many seconds passed since the last one
+            index_save_every: Persist the index sidecar after this many new log lines
+            compact_interval: Seconds between background compaction checks
+            compact_min_transitions: Compact once the log holds this many status transitions
         """
         self.feedback_dir = Path(feedback_dir)
         self.feedback_dir.mkdir(exist_ok=True)
@@ -29,6 +47,42 @@ class FeedbackManager:
         # Feedback storage files
         self.feedback_file = self.feedback_dir / "feedback_log.jsonl"
         self.stats_file = self.feedback_dir / "feedback_stats.json"
+        self.index_file = self.feedback_dir / "feedback_index.json"
+        
+        # Byte offsets of the records per status and per feedback type, so
+        # queries only read the records they return and statistics are
+        # counted in O(1); persisted in a sidecar so a restart only indexes
+        # the log tail
+        self._lock = threading.RLock()
+        self._index = FeedbackIndex()
+        self.index_save_every = index_save_every
+        self._index_unsaved = 0
+        self._last_updated = None
+        
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval = snapshot_interval
+        self._unsaved = 0
+        self._last_snapshot = time.monotonic()
+        
+        self._index.load(self.index_file)
+        self._refresh()
+        
+        # Every append goes through one writer thread per process, which
+        # commits concurrent writes together (one write and one fsync per
+        # group) under a lock shared with the other worker processes
+        self._file_lock = FileLock(self.feedback_dir / "feedback_log.lock")
+        self._compact_lock = FileLock(self.feedback_dir / "feedback_compact.lock")
+        self._writer = GroupCommitWriter(self._commit_lines, name='feedback-writer')
+        
+        # Status transitions are appended to the log; a background thread
+        # periodically folds them into a fresh segment
+        self.compact_min_transitions = compact_min_transitions
+        self._closed = threading.Event()
+        self._compactor = threading.Thread(
+            target=self._compact_loop, args=(compact_interval,), name='feedback-compactor', daemon=True
+        )
+        self._compactor.start()
+        atexit.register(self.close)
         
     def add_feedback(
         self,
@@ -52,6 +106,7 @@ class FeedbackManager:
             Feedback record
         """
         feedback_record = {
+            "id": uuid.uuid4().hex,
             "timestamp": datetime.now().isoformat(),
             "image_filename": image_filename,
             "prediction": prediction,
@@ -62,20 +117,63 @@ class FeedbackManager:
         }
         
         try:
-            # Append to feedback log (JSONL format)
-            with open(self.feedback_file, 'a') as f:
-                f.write(json.dumps(feedback_record) + '\n')
+            # Append to feedback log (JSONL format), committed with concurrent writes
+            self._writer.write([feedback_record])
             
             logger.info(f"Feedback recorded for {image_filename}: {user_feedback}")
             
-            # Update statistics
-            self._update_stats()
-            
             return {"success": True, "record": feedback_record}
         except Exception as e:
             logger.error(f"Error recording feedback: {e}")
             return {"success": False, "error": str(e)}
     
+    def query_feedback(
+        self,
+        status: str = None,
+        feedback_types: List[str] = None,
+        cursor: str = None,
+        limit: int = 100
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Page through feedback records by status or by feedback type, oldest first
+        
+        Args:
+            status: Only records with this status
+            feedback_types: Only records with one of these feedback types
+            cursor: Opaque cursor returned by the previous page (None for the first page)
+            limit: Page size (capped at MAX_PAGE_SIZE, None for all)
+            
+        Returns:
+            (records, next_cursor) - next_cursor is None on the last page
+        """
+        if (status is None) == (feedback_types is None):
+            raise ValueError("Query by either status or feedback_types")
+        if limit is not None:
+            limit = max(1, min(int(limit), self.MAX_PAGE_SIZE))
+        
+        # Offsets are only meaningful for the file they were indexed from, and
+        # another process may swap in a compacted log at any time: the index is
+        # brought up to date from the same open file the records are read from
+        try:
+            log = open(self.feedback_file, 'rb')
+        except FileNotFoundError:
+            log = None
+        try:
+            with self._lock:
+                self._refresh(log)
+                inode = self._index.log_inode
+                start = self._decode_cursor(cursor, inode)
+                if status is not None:
+                    offsets, next_offset = self._index.find('status', [status], start, limit)
+                else:
+                    offsets, next_offset = self._index.find('type', feedback_types, start, limit)
+                records = self._read_at(log, offsets)
+        finally:
+            if log is not None:
+                log.close()
+        
+        return records, (f"{inode}:{next_offset}" if next_offset is not None else None)
+    
     def get_pending_feedback(self, limit: int = None) -> List[Dict]:
         """
         Get all pending feedback records
@@ -86,22 +184,11 @@ class FeedbackManager:
         Returns:
             List of pending feedback records
         """
-        if not self.feedback_file.exists():
-            return []
-        
-        pending = []
         try:
-            with open(self.feedback_file, 'r') as f:
-                for line in f:
-                    record = json.loads(line)
-                    if record.get('status') == 'pending':
-                        pending.append(record)
-                        if limit and len(pending) >= limit:
-                            break
+            return self.query_feedback(status='pending', limit=limit)[0]
         except Exception as e:
             logger.error(f"Error reading feedback: {e}")
-        
-        return pending
+            return []
     
     def get_incorrect_predictions(self, limit: int = None) -> List[Dict]:
         """
@@ -113,58 +200,95 @@ class FeedbackManager:
         Returns:
             List of incorrect prediction records
         """
-        if not self.feedback_file.exists():
-            return []
-        
-        incorrect = []
         try:
-            with open(self.feedback_file, 'r') as f:
-                for line in f:
-                    record = json.loads(line)
-                    if record.get('user_feedback') in ['incorrect', 'partial']:
-                        incorrect.append(record)
-                        if limit and len(incorrect) >= limit:
-                            break
+            return self.query_feedback(feedback_types=['incorrect', 'partial'], limit=limit)[0]
         except Exception as e:
             logger.error(f"Error reading feedback: {e}")
-        
-        return incorrect
+            return []
     
-    def mark_as_processed(self, record_ids: List[str]) -> Dict:
+    @staticmethod
+    def _decode_cursor(cursor: Optional[str], inode: Optional[int]) -> Optional[int]:
+        """Log offset of a '<log inode>:<offset>' cursor issued for the current log"""
+        if cursor in (None, ''):
+            return None
+        try:
+            cursor_inode, offset = cursor.split(':')
+            cursor_inode, offset = int(cursor_inode), int(offset)
+        except ValueError:
+            raise ValueError(f"Invalid cursor: {cursor}")
+        if cursor_inode != inode:
+            raise StaleCursorError("Stale cursor: the feedback log was compacted, restart from the first page")
+        return offset
+    
+    def _read_at(self, log, offsets: List[int]) -> List[Dict]:
+        """Read the records starting at the given offsets of the open log (one seek each)"""
+        if not offsets:
+            return []
+        records = []
+        for offset in offsets:
+            log.seek(offset)
+            record = json.loads(log.readline())
+            record['id'] = record_id(record)
+            record['status'] = self._index.status_at(offset) or record.get('status', 'pending')
+            records.append(record)
+        return records
+    
+    def mark_as_processed(self, record_ids: List[str], status: str = 'processed') -> Dict:
         """
         Mark feedback records as processed (used for training)
         
+        Appends one small transition line per record instead of rewriting
+        the log; the compactor folds them in later.
+        
         Args:
-            record_ids: List of record IDs (timestamps)
+            record_ids: List of record IDs (legacy records: their timestamp)
+            status: New status
             
         Returns:
             Status of operation
         """
-        if not self.feedback_file.exists():
-            return {"success": False, "error": "No feedback file"}
-        
         try:
-            all_records = []
-            with open(self.feedback_file, 'r') as f:
-                for line in f:
-                    record = json.loads(line)
-                    if record['timestamp'] in record_ids:
-                        record['status'] = 'processed'
-                    all_records.append(record)
-            
-            # Rewrite file
-            with open(self.feedback_file, 'w') as f:
-                for record in all_records:
-                    f.write(json.dumps(record) + '\n')
-            
-            logger.info(f"Marked {len(record_ids)} records as processed")
-            self._update_stats()
+            with self._lock:
+                self._refresh()
+                known = [rid for rid in dict.fromkeys(record_ids) if rid in self._index.positions]
+            if known:
+                now = datetime.now().isoformat()
+                self._writer.write([
+                    {"transition": "status", "id": rid, "status": status, "timestamp": now}
+                    for rid in known
+                ])
             
-            return {"success": True, "count": len(record_ids)}
+            logger.info(f"Marked {len(known)} records as {status}")
+            return {"success": True, "count": len(known)}
         except Exception as e:
             logger.error(f"Error marking feedback: {e}")
             return {"success": False, "error": str(e)}
     
+    def _commit_lines(self, records: List[Dict]):
+        """Writer thread: append a group of log lines with one write and one fsync"""
+        data = ''.join(json.dumps(record) + '\n' for record in records).encode('utf-8')
+        with self._file_lock:
+            with open(self.feedback_file, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        
+        # Index the new line(s) only, O(1) per write
+        self._refresh()
+    
+    def version(self) -> tuple:
+        """
+        Cheap change marker of the feedback log (size and mtime)
+        
+        Returns:
+            Tuple that changes whenever feedback is added, updated or cleared
+        """
+        try:
+            stat = self.feedback_file.stat()
+            return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            return (0, 0, 0)
+    
     def get_stats(self) -> Dict:
         """
         Get feedback statistics
@@ -172,62 +296,236 @@ class FeedbackManager:
         Returns:
             Statistics dictionary
         """
-        if self.stats_file.exists():
-            try:
-                with open(self.stats_file, 'r') as f:
-                    return json.load(f)
-            except:
-                pass
-        
-        return {
-            "total_feedback": 0,
-            "correct": 0,
-            "incorrect": 0,
-            "partial": 0,
-            "unsure": 0,
-            "accuracy": 0.0
-        }
+        with self._lock:
+            self._refresh()
+            return self._stats()
     
-    def _update_stats(self):
-        """Update feedback statistics"""
-        if not self.feedback_file.exists():
-            return
-        
+    def _stats(self) -> Dict:
+        """Statistics from the index list sizes, O(number of statuses and types)"""
+        statuses = self._index.counts('status')
+        types = self._index.counts('type')
         stats = {
-            "total_feedback": 0,
+            "total_feedback": sum(statuses.values()),
             "correct": 0,
             "incorrect": 0,
             "partial": 0,
             "unsure": 0,
             "pending": 0,
             "processed": 0,
+            **types,
+            **statuses,
             "accuracy": 0.0,
-            "last_updated": datetime.now().isoformat()
+            "last_updated": self._last_updated
         }
         
+        # Calculate accuracy
+        total_correct_incorrect = stats['correct'] + stats['incorrect'] + stats['partial']
+        if total_correct_incorrect > 0:
+            stats['accuracy'] = stats['correct'] / total_correct_incorrect
+        return stats
+    
+    @staticmethod
+    def _apply_line(index: FeedbackIndex, offset: int, record: Dict):
+        """Apply one log line (feedback record or status transition) to an index"""
+        if 'transition' in record:
+            index.apply_transition(record['id'], record['status'])
+        else:
+            index.add(offset, record)
+    
+    def _refresh(self, log=None):
+        """
+        Index the log lines appended since the last refresh (by this or another process)
+        
+        Args:
+            log: Log file opened by the caller, so the index describes that very
+                file even if a compaction replaced the path meanwhile
+        """
+        with self._lock:
+            if log is None:
+                try:
+                    with open(self.feedback_file, 'rb') as f:
+                        return self._refresh(f)
+                except FileNotFoundError:
+                    size, inode = 0, None
+            else:
+                stat = os.fstat(log.fileno())
+                size, inode = stat.st_size, stat.st_ino
+            # A replaced or truncated log (compaction, clear) invalidates every offset
+            if (self._index.log_inode is not None and inode != self._index.log_inode) \
+                    or size < self._index.log_offset:
+                self._index = FeedbackIndex()
+            self._index.log_inode = inode
+            
+            start = self._index.log_offset
+            if size == start:
+                return
+            
+            applied = 0
+            offset = start
+            log.seek(start)
+            for line in log:
+                if not line.endswith(b'\n'):
+                    break  # partial line still being written
+                if line.strip():
+                    self._apply_line(self._index, offset, json.loads(line))
+                    applied += 1
+                offset += len(line)
+            self._index.log_offset = offset
+            
+            if applied:
+                self._changed(applied)
+    
+    def _changed(self, lines: int):
+        """Persist snapshots when due and publish the new statistics"""
+        self._last_updated = datetime.now().isoformat()
+        self._index_unsaved += lines
+        self._unsaved += lines
+        if self._index_unsaved >= self.index_save_every:
+            self._save_index()
+        if self._unsaved >= self.snapshot_every or (
+            time.monotonic() - self._last_snapshot > self.snapshot_interval
+        ):
+            self._save_stats()
+        event_bus.publish('feedback', self._stats())
+    
+    def rebuild_stats(self) -> Dict:
+        """
+        Re-index the whole log and recount the statistics
+        
+        Only needed without a usable index sidecar (handled at startup) or
+        on demand.
+        
+        Returns:
+            Statistics dictionary
+        """
+        with self._lock:
+            self._index = FeedbackIndex()
+            self._refresh()
+            self._save_index()
+            self._save_stats()
+            stats = self._stats()
+        event_bus.publish('feedback', stats)
+        logger.info(f"Feedback index rebuilt: {stats['total_feedback']} records")
+        return stats
+    
+    def _save_index(self):
+        self._index.save(self.index_file)
+        self._index_unsaved = 0
+    
+    def _save_stats(self):
+        """Persist the statistics atomically (temp file + rename)"""
+        tmp_path = self.stats_file.with_suffix(f'.json.{os.getpid()}.tmp')
         try:
-            with open(self.feedback_file, 'r') as f:
-                for line in f:
+            with open(tmp_path, 'w') as f:
+                json.dump({**self._stats(), "log_offset": self._index.log_offset}, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.stats_file)
+            self._unsaved = 0
+            self._last_snapshot = time.monotonic()
+        except OSError as e:
+            logger.error(f"Error saving stats: {e}")
+    
+    def compact(self, keep=None) -> Dict:
+        """
+        Fold status transitions into a fresh log segment and swap it in atomically
+        
+        The bulk of the log is copied without holding the lock; only the
+        lines appended meanwhile are copied under the lock, right before
+        the new segment replaces the old one with os.replace.
+        
+        Args:
+            keep: Optional predicate; records for which it returns False are dropped
+            
+        Returns:
+            Status of operation with the number of records kept and dropped
+        """
+        # One compaction at a time across every process sharing the log
+        with self._compact_lock:
+            return self._compact(keep)
+    
+    def _compact(self, keep=None) -> Dict:
+        with self._lock:
+            self._refresh()
+            if not self.feedback_file.exists():
+                return {"success": True, "kept": 0, "dropped": 0}
+            end = self._index.log_offset
+            inode = self._index.log_inode
+            overrides = dict(self._index.overrides)
+        
+        tmp_path = self.feedback_file.with_suffix(f'.jsonl.{os.getpid()}.compact')
+        segment = FeedbackIndex()
+        kept = dropped = 0
+        try:
+            with open(self.feedback_file, 'rb') as src, open(tmp_path, 'wb') as dst:
+                offset = new_offset = 0
+                while offset < end:
+                    line = src.readline()
+                    if not line:
+                        break
+                    line_offset, offset = offset, offset + len(line)
+                    if not line.strip():
+                        continue
                     record = json.loads(line)
-                    stats["total_feedback"] += 1
-                    
-                    feedback_type = record.get('user_feedback', 'unsure')
-                    stats[feedback_type] = stats.get(feedback_type, 0) + 1
+                    if 'transition' in record:
+                        continue
+                    record['id'] = record_id(record)
+                    record['status'] = overrides.get(line_offset, record.get('status', 'pending'))
+                    if keep is not None and not keep(record):
+                        dropped += 1
+                        continue
+                    data = (json.dumps(record) + '\n').encode('utf-8')
+                    dst.write(data)
+                    segment.add(new_offset, record)
+                    new_offset += len(data)
+                    kept += 1
+                
+                with self._file_lock, self._lock:
+                    if self.feedback_file.stat().st_ino != inode:
+                        raise RuntimeError("feedback log was replaced during compaction")
+                    # Lines appended since the copy started are carried over as-is
+                    src.seek(end)
+                    tail = src.read()
+                    tail = tail[:tail.rfind(b'\n') + 1]
+                    for line in tail.splitlines(keepends=True):
+                        if line.strip():
+                            self._apply_line(segment, new_offset, json.loads(line))
+                        new_offset += len(line)
+                    dst.write(tail)
+                    dst.flush()
+                    os.fsync(dst.fileno())
                     
-                    status = record.get('status', 'pending')
-                    stats[status] = stats.get(status, 0) + 1
-            
-            # Calculate accuracy
-            total_correct_incorrect = stats['correct'] + stats['incorrect'] + stats['partial']
-            if total_correct_incorrect > 0:
-                stats['accuracy'] = stats['correct'] / total_correct_incorrect
+                    os.replace(tmp_path, self.feedback_file)
+                    segment.log_offset = new_offset
+                    segment.log_inode = self.feedback_file.stat().st_ino
+                    self._index = segment
+                    self._save_index()
+                    self._save_stats()
+                    stats = self._stats()
             
-            # Save stats
-            with open(self.stats_file, 'w') as f:
-                json.dump(stats, f, indent=2)
+            event_bus.publish('feedback', stats)
+            logger.info(f"Feedback log compacted: {kept} records kept, {dropped} dropped")
+            return {"success": True, "kept": kept, "dropped": dropped}
         
         except Exception as e:
-            logger.error(f"Error updating stats: {e}")
+            tmp_path.unlink(missing_ok=True)
+            logger.error(f"Error compacting feedback: {e}")
+            return {"success": False, "error": str(e)}
+    
+    def _compact_loop(self, interval: float):
+        while not self._closed.wait(interval):
+            if self._index.transitions >= self.compact_min_transitions:
+                self.compact()
+    
+    def close(self):
+        """Commit queued writes, stop the compactor and persist the snapshots (registered with atexit)"""
+        self._writer.close()
+        self._closed.set()
+        with self._lock:
+            if self._unsaved:
+                self._save_stats()
+            if self._index_unsaved:
+                self._save_index()
     
     def get_training_candidates(self, min_count: int = 5) -> Dict:
         """
@@ -252,31 +550,34 @@ class FeedbackManager:
         
         return recommendation
     
-    def export_feedback_for_training(self, output_path: str) -> Dict:
+    def export_feedback_for_training(
+        self,
+        output_dir: str,
+        image_dirs: List[str],
+        label_store,
+        feedback_types: Tuple[str, ...] = ('incorrect', 'partial'),
+        workers: int = 8
+    ) -> Dict:
         """
-        Export feedback data for model retraining
+        Export flagged feedback as a YOLO-seg dataset (train/images + train/labels)
+        
+        The labels are the validated corrections of the label store, not the
+        flagged predictions. Incremental: records already listed in the
+        dataset's manifest with the same correction are skipped.
         
         Args:
-            output_path: Path to save training data
+            output_dir: Dataset root directory
+            image_dirs: Directories searched for the feedback images
+            label_store: Label store holding the validated corrections
+            feedback_types: Feedback values to export
+            workers: Threads writing the samples
             
         Returns:
-            Export status
+            Export status with per-outcome counts
         """
         try:
-            incorrect = self.get_incorrect_predictions()
-            
-            export_data = {
-                "total_samples": len(incorrect),
-                "feedback_samples": incorrect,
-                "export_time": datetime.now().isoformat(),
-                "training_notes": "High priority samples from user feedback"
-            }
-            
-            with open(output_path, 'w') as f:
-                json.dump(export_data, f, indent=2)
-            
-            logger.info(f"Exported {len(incorrect)} feedback samples for training")
-            return {"success": True, "count": len(incorrect)}
+            exporter = FeedbackExporter(self, label_store, image_dirs, workers=workers)
+            return exporter.export(output_dir, feedback_types=feedback_types)
         
         except Exception as e:
             logger.error(f"Error exporting feedback: {e}")
@@ -294,22 +595,34 @@ class FeedbackManager:
         """
         try:
             if keep_processed and self.feedback_file.exists():
-                processed = []
-                with open(self.feedback_file, 'r') as f:
-                    for line in f:
-                        record = json.loads(line)
-                        if record.get('status') == 'processed':
-                            processed.append(record)
-                
-                with open(self.feedback_file, 'w') as f:
-                    for record in processed:
-                        f.write(json.dumps(record) + '\n')
-                
-                return {"success": True, "kept": len(processed)}
+                result = self.compact(keep=lambda record: record.get('status') == 'processed')
+                if not result['success']:
+                    return result
+                return {"success": True, "kept": result['kept']}
             else:
-                self.feedback_file.unlink(missing_ok=True)
+                with self._file_lock, self._lock:
+                    self.feedback_file.unlink(missing_ok=True)
+                    self.rebuild_stats()
                 return {"success": True, "kept": 0}
         
         except Exception as e:
             logger.error(f"Error clearing feedback: {e}")
             return {"success": False, "error": str(e)}
+
+
+_shared_feedback = None
+_shared_lock = threading.Lock()
+
+
+def get_feedback_manager() -> FeedbackManager:
+    """
+    Process-wide FeedbackManager
+
+    The feedback log has a single writer thread and one in-memory index
+    per process, so every route must share one instance.
+    """
+    global _shared_feedback
+    with _shared_lock:
+        if _shared_feedback is None:
+            _shared_feedback = FeedbackManager()
+        return _shared_feedback
@@ -0,0 +1,131 @@
+"""
+Group Commit
+Single-writer queue that batches concurrent writes, plus a cross-process file lock
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+    FILE_LOCKS_AVAILABLE = True
+except ImportError:
+    FILE_LOCKS_AVAILABLE = False
+
+
+class FileLock:
+    """
+    Exclusive advisory lock on a lock file, shared by every process
+
+    Uses flock; on platforms without fcntl only the threads of one process
+    are serialized.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread_lock = threading.Lock()
+        self._fd = None
+        if not FILE_LOCKS_AVAILABLE:
+            logger.warning(f"fcntl not available, {self.path} only locks within this process")
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if FILE_LOCKS_AVAILABLE:
+            try:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except OSError:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._thread_lock.release()
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+
+class GroupCommitWriter:
+    """
+    One writer thread per process for a resource
+
+    submit() queues a batch of items and returns a Future. The writer
+    drains whatever is waiting (up to batch_size items) and hands it to
+    commit(items) in one call - one write, one fsync or one transaction
+    for many concurrent callers - then resolves every Future with the
+    slice of commit's result that belongs to it.
+    """
+
+    def __init__(self, commit, name, batch_size=512, max_wait=0.002, max_queue=10000):
+        self.commit = commit
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, items):
+        """Queue a list of items; the Future resolves to commit's results for them"""
+        if self._closed.is_set():
+            raise RuntimeError("Writer is closed")
+        future = Future()
+        self._queue.put((list(items), future))
+        return future
+
+    def write(self, items, timeout=30):
+        """Submit and wait until the items are committed"""
+        return self.submit(items).result(timeout=timeout)
+
+    def close(self, timeout=10):
+        """Commit what is queued and stop the writer"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._thread.join(timeout=timeout)
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._closed.is_set():
+                    return
+                continue
+
+            requests = [first]
+            pending = len(first[0])
+            while pending < self.batch_size:
+                try:
+                    request = self._queue.get(timeout=self.max_wait)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                pending += len(request[0])
+
+            items = [item for request_items, _ in requests for item in request_items]
+            try:
+                results = self.commit(items)
+            except Exception as e:
+                logger.error(f"Group commit error: {str(e)}")
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            position = 0
+            for request_items, future in requests:
+                count = len(request_items)
+                future.set_result(results[position:position + count] if results is not None else None)
+                position += count
@@ -0,0 +1,482 @@
+"""
+Hyperparameter Search
+Parallel trials over the config.py presets, pruned early with asynchronous successive halving (ASHA)
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    trial_id TEXT PRIMARY KEY,
+    number INTEGER NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    cpus TEXT,
+    pid INTEGER,
+    epochs INTEGER,
+    latency_ms REAL,
+    weights TEXT,
+    error TEXT,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS reports (
+    trial_id TEXT NOT NULL,
+    epoch INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (trial_id, epoch)
+);
+"""
+
+FINISHED_STATUSES = ('completed', 'pruned', 'failed')
+
+# Project root, working directory of the trial processes
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+class SuccessiveHalvingPruner:
+    """
+    Asynchronous successive halving
+
+    Rungs sit at min_epochs * eta^k epochs. A trial reaching a rung goes on
+    only if its value is in the top 1/eta of every value reported at that
+    rung so far; until min_trials_per_rung values exist nothing is pruned.
+    """
+
+    def __init__(self, min_epochs=3, max_epochs=27, eta=3, min_trials_per_rung=None):
+        self.eta = eta
+        self.min_trials_per_rung = min_trials_per_rung or eta
+        self.rungs = []
+        rung = max(1, min_epochs)
+        while rung < max_epochs:
+            self.rungs.append(rung)
+            rung *= eta
+
+    def should_prune(self, value, rung_values):
+        if len(rung_values) < self.min_trials_per_rung:
+            return False
+        keep = max(1, len(rung_values) // self.eta)
+        return value < sorted(rung_values, reverse=True)[keep - 1]
+
+
+class SearchStore:
+    """Trials and their per-epoch values in a SQLite database shared by the trial processes"""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def add(self, trial_id, number, params):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'INSERT INTO trials (trial_id, number, params, status) VALUES (?, ?, ?, ?)',
+                (trial_id, number, json.dumps(params), 'queued')
+            )
+
+    def start(self, trial_id, pid, cpus):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'UPDATE trials SET status = ?, pid = ?, cpus = ?, started_at = ? WHERE trial_id = ?',
+                ('running', pid, ','.join(str(c) for c in cpus), datetime.now().isoformat(), trial_id)
+            )
+
+    def finish(self, trial_id, status, epochs=None, latency_ms=None, weights=None, error=None):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'UPDATE trials SET status = ?, epochs = ?, latency_ms = ?, weights = ?, error = ?, finished_at = ? '
+                'WHERE trial_id = ?',
+                (status, epochs, latency_ms, weights, error, datetime.now().isoformat(), trial_id)
+            )
+
+    def report(self, trial_id, epoch, value, pruner):
+        """
+        Record the validation value of an epoch
+
+        Returns:
+            True if the trial should stop (pruned at a rung)
+        """
+        conn = self._connection()
+        with conn:
+            # The insert and the rung read are atomic across trial processes
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                'INSERT OR REPLACE INTO reports (trial_id, epoch, value) VALUES (?, ?, ?)',
+                (trial_id, epoch, value)
+            )
+            if epoch not in pruner.rungs:
+                return False
+            values = [row['value'] for row in conn.execute('SELECT value FROM reports WHERE epoch = ?', (epoch,))]
+        return pruner.should_prune(value, values)
+
+    def get(self, trial_id):
+        row = self._connection().execute('SELECT * FROM trials WHERE trial_id = ?', (trial_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def trials(self):
+        """Every trial with its best value and the epoch it was reached at"""
+        rows = self._connection().execute('SELECT * FROM trials ORDER BY number').fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def _to_dict(self, row):
+        trial = dict(row)
+        trial['params'] = json.loads(trial['params'])
+        best = self._connection().execute(
+            'SELECT value, epoch FROM reports WHERE trial_id = ? ORDER BY value DESC, epoch LIMIT 1',
+            (trial['trial_id'],)
+        ).fetchone()
+        trial['best_value'] = best['value'] if best else None
+        trial['best_epoch'] = best['epoch'] if best else None
+        return trial
+
+
+def sample_trials(space, count, seed=0):
+    """
+    Distinct random combinations of profile, augmentation set, optimizer,
+    model size, image size, batch size and learning-rate scale
+    """
+    rng = random.Random(seed)
+    low, high = space['lr_scale']
+    combinations, seen = [], set()
+    for _ in range(count * 20):
+        if len(combinations) == count:
+            break
+        params = {
+            'profile': rng.choice(space['profiles']),
+            'augmentation': rng.choice(space['augmentations']),
+            'optimizer': rng.choice(space['optimizers']),
+            'model_size': rng.choice(space['model_sizes']),
+            'img_size': rng.choice(space['img_sizes']),
+            'batch_size': rng.choice(space['batch_sizes']),
+            'lr_scale': round(math.exp(rng.uniform(math.log(low), math.log(high))), 3),
+        }
+        key = tuple(v for k, v in sorted(params.items()) if k != 'lr_scale')
+        if key in seen:
+            continue
+        seen.add(key)
+        combinations.append(params)
+    return combinations
+
+
+def train_arguments(params):
+    """YOLO.train arguments of a sampled combination (config.py preset names resolved)"""
+    import config
+
+    profile = getattr(config, params['profile'])
+    augmentation = getattr(config, params['augmentation'])
+    optimizer = getattr(config, params['optimizer'])
+
+    args = dict(augmentation)
+    args.update({
+        'optimizer': optimizer['optimizer'],
+        # Adam's beta1 is the momentum argument of ultralytics
+        'momentum': optimizer.get('momentum', optimizer.get('beta1', 0.937)),
+        'lr0': round(profile['learning_rate'] * params['lr_scale'], 6),
+        'weight_decay': profile.get('weight_decay', 0.0005),
+        'cos_lr': profile.get('lr_scheduler') == 'cosine',
+        'imgsz': params['img_size'],
+        'batch': params['batch_size'],
+    })
+    return args
+
+
+def partition_cpus(cpus, parallel):
+    """Split the CPU list into `parallel` contiguous, near-equal groups"""
+    parallel = max(1, min(parallel, len(cpus)))
+    size, extra = divmod(len(cpus), parallel)
+    groups, start = [], 0
+    for i in range(parallel):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(cpus[start:end])
+        start = end
+    return groups
+
+
+def measure_latency(weights, images, imgsz, runs=20):
+    """Median CPU prediction time (ms) of a model over up to `runs` images"""
+    from ultralytics import YOLO
+
+    if not images:
+        return None
+    model = YOLO(weights)
+    for image in images[:2]:
+        model.predict(image, imgsz=imgsz, device='cpu', verbose=False)
+    durations = []
+    for image in (images * runs)[:runs]:
+        started = time.perf_counter()
+        model.predict(image, imgsz=imgsz, device='cpu', verbose=False)
+        durations.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(durations), 2)
+
+
+class HyperparameterSearch:
+    """
+    Runs sampled trials as parallel processes, each pinned to its own CPU group
+
+    The CPUs training may use (config.TRAINING_RESOURCES) are split into
+    `parallel` groups; a trial gets one group and as many torch threads.
+    Every trial validates after each epoch and reports to the study
+    database, where the successive-halving pruner stops weak trials at
+    its rungs. The serving model is evaluated the same way as a baseline,
+    and leaderboard.json/csv rank the trials by validation value and CPU
+    latency.
+    """
+
+    def __init__(self, data_yaml='data.yaml', settings=None, resources=None, root='training_data/hpsearch',
+                 baseline='models/yolov8n-seg_trained.pt'):
+        from config import HPARAM_SEARCH, TRAINING_RESOURCES
+
+        self.data_yaml = data_yaml
+        self.settings = dict(HPARAM_SEARCH, **(settings or {}))
+        self.resources = resources or TRAINING_RESOURCES
+        self.root = Path(root)
+        self.baseline = baseline
+        self._processes = {}
+
+    def run(self):
+        """
+        Run the whole search
+
+        Returns:
+            Dict with study_dir, leaderboard rows and the leaderboard paths
+        """
+        from utils.training_jobs import resolve_resources
+
+        study_dir = self.root / datetime.now().strftime('%Y%m%d_%H%M%S')
+        study_dir.mkdir(parents=True, exist_ok=True)
+        study = dict(self.settings, data_yaml=str(Path(self.data_yaml).resolve()), created=datetime.now().isoformat())
+        with open(study_dir / 'study.json', 'w') as f:
+            json.dump(study, f, indent=2)
+
+        store = SearchStore(study_dir / 'study.db')
+        queue = []
+        if self.baseline and Path(self.baseline).exists():
+            store.add('baseline', 0, {'kind': 'baseline', 'weights': str(Path(self.baseline).resolve())})
+            queue.append('baseline')
+        for number, params in enumerate(sample_trials(self.settings, self.settings['trials'],
+                                                      self.settings['seed']), start=1):
+            trial_id = f"trial_{number:03d}"
+            store.add(trial_id, number, dict(params, kind='train'))
+            queue.append(trial_id)
+
+        limits = resolve_resources(self.resources)
+        groups = partition_cpus(limits['cpus'], self.settings['parallel'])
+        logger.info(f"Search {study_dir.name}: {len(queue)} trials on CPU groups {groups}")
+
+        free = list(range(len(groups)))
+        try:
+            while queue or self._processes:
+                while queue and free:
+                    slot = free.pop(0)
+                    self._launch(store, study_dir, queue.pop(0), groups[slot], limits['nice'], slot)
+                time.sleep(1)
+                for trial_id, (process, slot) in list(self._processes.items()):
+                    if process.poll() is None:
+                        continue
+                    del self._processes[trial_id]
+                    free.append(slot)
+                    if store.get(trial_id)['status'] not in FINISHED_STATUSES:
+                        store.finish(trial_id, 'failed', error=f"exit code {process.returncode}")
+                    logger.info(f"{trial_id}: {store.get(trial_id)['status']}")
+        finally:
+            for process, _ in self._processes.values():
+                process.terminate()
+
+        return self._write_leaderboard(store, study_dir)
+
+    def _launch(self, store, study_dir, trial_id, cpus, nice, slot):
+        env = os.environ.copy()
+        for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+            env[name] = str(len(cpus))
+        command = [
+            sys.executable, '-m', 'utils.hparam_search',
+            '--study-dir', str(study_dir.resolve()),
+            '--trial-id', trial_id,
+            '--threads', str(len(cpus)),
+            '--cpus', ','.join(str(cpu) for cpu in cpus),
+            '--nice', str(nice),
+        ]
+        with open(study_dir / f"{trial_id}.log", 'w') as log:
+            process = subprocess.Popen(command, cwd=str(PROJECT_DIR), env=env, stdout=log, stderr=subprocess.STDOUT)
+        store.start(trial_id, process.pid, cpus)
+        self._processes[trial_id] = (process, slot)
+
+    def _write_leaderboard(self, store, study_dir):
+        trials = store.trials()
+        baseline = next((t for t in trials if t['trial_id'] == 'baseline'), None)
+        rows = []
+        for trial in trials:
+            if trial['trial_id'] == 'baseline' or trial['best_value'] is None:
+                continue
+            row = {
+                'trial_id': trial['trial_id'],
+                'status': trial['status'],
+                'best_value': round(trial['best_value'], 5),
+                'best_epoch': trial['best_epoch'],
+                'epochs': trial['epochs'],
+                'latency_ms': trial['latency_ms'],
+                **{k: v for k, v in trial['params'].items() if k != 'kind'},
+                'weights': trial['weights'],
+            }
+            if baseline and baseline['best_value'] is not None and trial['latency_ms'] and baseline['latency_ms']:
+                row['beats_baseline'] = (trial['best_value'] > baseline['best_value']
+                                         and trial['latency_ms'] < baseline['latency_ms'])
+            rows.append(row)
+
+        # Pareto front: no other finished trial is both more accurate and faster
+        timed = [r for r in rows if r['latency_ms'] is not None]
+        for row in rows:
+            row['pareto'] = row['latency_ms'] is not None and not any(
+                o['best_value'] >= row['best_value'] and o['latency_ms'] <= row['latency_ms']
+                and (o['best_value'], o['latency_ms']) != (row['best_value'], row['latency_ms'])
+                for o in timed
+            )
+        rows.sort(key=lambda r: (-r['best_value'], r['latency_ms'] if r['latency_ms'] is not None else float('inf')))
+
+        leaderboard = {
+            'study': study_dir.name,
+            'metric': self.settings['metric'],
+            'baseline': {
+                'weights': self.baseline,
+                'value': baseline['best_value'],
+                'latency_ms': baseline['latency_ms'],
+            } if baseline else None,
+            'trials': rows,
+        }
+        json_path = study_dir / 'leaderboard.json'
+        with open(json_path, 'w') as f:
+            json.dump(leaderboard, f, indent=2)
+
+        csv_path = study_dir / 'leaderboard.csv'
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+
+        return {'study_dir': str(study_dir), 'leaderboard': leaderboard, 'json': str(json_path), 'csv': str(csv_path)}
+
+
+def run_trial(study_dir, trial_id, threads):
+    """Train (or, for the baseline, only evaluate) one trial inside its process"""
+    from ultralytics import YOLO
+
+    from config import TRAINING_CACHE
+    from utils.cpu_autotuner import training_images
+    from utils.image_cache import cached_trainer
+
+    with open(study_dir / 'study.json', 'r') as f:
+        study = json.load(f)
+    store = SearchStore(study_dir / 'study.db')
+    params = store.get(trial_id)['params']
+    metric = study['metric']
+    val_images = training_images(study['data_yaml'], split='val')[:study['latency_images']]
+
+    if params['kind'] == 'baseline':
+        imgsz = study['baseline_img_size']
+        results = YOLO(params['weights']).val(data=study['data_yaml'], imgsz=imgsz, device='cpu',
+                                              plots=False, verbose=False)
+        value = float((getattr(results, 'results_dict', {}) or {}).get(metric, 0))
+        store.report(trial_id, 0, value, SuccessiveHalvingPruner(max_epochs=0))
+        latency = measure_latency(params['weights'], val_images, imgsz)
+        store.finish(trial_id, 'completed', epochs=0, latency_ms=latency, weights=params['weights'])
+        return
+
+    pruner = SuccessiveHalvingPruner(study['min_epochs'], study['max_epochs'], study['eta'])
+    state = {'pruned': False, 'epochs': 0}
+
+    def on_fit_epoch_end(trainer):
+        epoch = trainer.epoch + 1
+        state['epochs'] = epoch
+        value = float((trainer.metrics or {}).get(metric, 0))
+        if store.report(trial_id, epoch, value, pruner) and epoch < trainer.epochs:
+            logger.info(f"{trial_id} pruned at epoch {epoch} ({metric}={value:.4f})")
+            state['pruned'] = True
+            trainer.stop = True
+
+    model = YOLO(f"yolov8{params['model_size']}-seg.pt")
+    model.add_callback('on_fit_epoch_end', on_fit_epoch_end)
+    train_args = train_arguments(params)
+    if TRAINING_CACHE['enabled']:
+        train_args['trainer'] = cached_trainer(study.get('cache_name', 'base'), TRAINING_CACHE['root'],
+                                               TRAINING_CACHE['keep'])
+    model.train(
+        data=study['data_yaml'],
+        epochs=study['max_epochs'],
+        patience=study['max_epochs'],
+        device='cpu',
+        workers=min(TRAINING_CACHE['loader_workers'], max(0, threads - 1)),
+        project=str(study_dir / 'runs'),
+        name=trial_id,
+        exist_ok=True,
+        plots=False,
+        verbose=False,
+        **train_args
+    )
+
+    weights = Path(model.trainer.best)
+    latency = measure_latency(str(weights), val_images, params['img_size']) if weights.exists() else None
+    store.finish(trial_id, 'pruned' if state['pruned'] else 'completed', epochs=state['epochs'],
+                 latency_ms=latency, weights=str(weights) if weights.exists() else None)
+
+
+def main(argv=None):
+    """Trial process: python -m utils.hparam_search --study-dir ... --trial-id ..."""
+    parser = argparse.ArgumentParser(description='Run one hyperparameter search trial')
+    parser.add_argument('--study-dir', required=True)
+    parser.add_argument('--trial-id', required=True)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--cpus', default='')
+    parser.add_argument('--nice', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s [{args.trial_id}] %(levelname)s %(message)s')
+
+    from utils.training_worker import apply_limits
+    apply_limits(args.threads, [int(cpu) for cpu in args.cpus.split(',') if cpu], args.nice)
+
+    study_dir = Path(args.study_dir)
+    try:
+        run_trial(study_dir, args.trial_id, args.threads)
+        return 0
+    except Exception as e:
+        logger.error(f"Trial error: {str(e)}")
+        SearchStore(study_dir / 'study.db').finish(args.trial_id, 'failed', error=str(e))
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
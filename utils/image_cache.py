@@ -0,0 +1,331 @@
+"""
+Image Cache
+Resized training images in memory-mapped files, shared by loader workers and reused across runs
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import logging
+
+import cv2
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from ultralytics.data.dataset import YOLODataset
+    from ultralytics.models.yolo.segment import SegmentationTrainer
+except ImportError:  # ultralytics < 8.1
+    from ultralytics.yolo.data.dataset import YOLODataset
+    from ultralytics.yolo.v8.segment import SegmentationTrainer
+
+from utils.group_commit import FileLock
+
+logger = logging.getLogger(__name__)
+
+
+def _file_key(path):
+    """Identity of an image file: hard links of one upload share it across dataset versions"""
+    stat = os.stat(path)
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def resize_image(path, imgsz):
+    """Decode and resize an image exactly like YOLODataset.load_image (rect mode)"""
+    im = cv2.imread(str(path))
+    if im is None:
+        raise FileNotFoundError(f"Image Not Found {path}")
+    h0, w0 = im.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        w, h = (min(math.ceil(w0 * r), imgsz), min(math.ceil(h0 * r), imgsz))
+        im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+    return im, (h0, w0)
+
+
+class ImageCache:
+    """
+    One dataset's images, decoded and resized once
+
+    images.npy holds one imgsz x imgsz x 3 uint8 slot per image (the
+    resized image in its top-left corner) and index.json maps each image
+    path to its slot and sizes. The array is opened read-only with mmap in
+    every process that reads it, so dataloader workers share the page
+    cache instead of holding copies. When a dataset version is cached for
+    the first time, slots of unchanged files are copied from the other
+    caches of the same imgsz; only new images are decoded.
+    
+    Each build gets a new id in index.json; a process only maps images.npy
+    if it still belongs to the build it prepared, so a cache rebuilt
+    meanwhile by another trainer is never read with a stale index.
+    
+    Every process using a cache holds a shared lock on <name>_<imgsz>.use
+    from prepare() on; pruning skips the caches it cannot lock exclusively.
+    """
+
+    def __init__(self, root, name, imgsz, keep=4):
+        self.root = Path(root)
+        self.name = name
+        self.imgsz = int(imgsz)
+        self.keep = keep
+        self.dir = self.root / f"{name}_{self.imgsz}"
+        self._index = None
+        self._build_id = None
+        self._array = None
+        self._use_fd = None
+
+    def prepare(self, files, workers=4):
+        """
+        Make sure every file is cached, building or refreshing the cache if needed
+
+        Returns:
+            Dict with images, decoded, copied (from other caches) and reused counts
+        """
+        files = [str(f) for f in files]
+        keys = {f: _file_key(f) for f in files}
+        # Taken before the index is checked, so the cache cannot be pruned in between
+        self._hold()
+
+        with FileLock(self.root / f"{self.dir.name}.lock"):
+            built = self._read_index(self.dir)
+            index = built['images'] if built and built.get('build') else None
+            if index and all(f in index and index[f]['key'] == keys[f] for f in files):
+                self._index, self._build_id, self._array = index, built['build'], None
+                return {'images': len(files), 'decoded': 0, 'copied': 0, 'reused': len(files)}
+
+            stats = self._build(files, keys, workers)
+            built = self._read_index(self.dir)
+            self._index, self._build_id, self._array = built['images'], built['build'], None
+            self._prune()
+
+        logger.info(f"Image cache {self.dir.name}: {stats}")
+        return stats
+
+    def get(self, path):
+        """(resized image copy, original (h, w)) or None when the file is not cached"""
+        entry = self._index.get(path) if self._index is not None else None
+        if entry is None:
+            return None
+        if self._array is None:
+            # Opened lazily, once per process (each loader worker maps it itself)
+            try:
+                array = np.load(self.dir / 'images.npy', mmap_mode='r')
+            except OSError as e:
+                logger.warning(f"Image cache {self.dir.name} unavailable, decoding images: {str(e)}")
+                self._index = None
+                return None
+            # Checked after mapping: a matching id means the array is the one indexed
+            built = self._read_index(self.dir)
+            if not built or built.get('build') != self._build_id:
+                logger.warning(f"Image cache {self.dir.name} was rebuilt by another run, decoding images")
+                self._index = None
+                return None
+            self._array = array
+        h, w = entry['hw']
+        return np.array(self._array[entry['slot'], :h, :w]), tuple(entry['hw0'])
+
+    def __getstate__(self):
+        # Loader workers started with spawn re-open the map instead of pickling it
+        state = dict(self.__dict__)
+        state['_array'] = None
+        state['_use_fd'] = None
+        return state
+    
+    def close(self):
+        """Drop this process's hold on the cache"""
+        if self._use_fd is not None:
+            # Closing (not LOCK_UN) keeps the lock of forked workers sharing the descriptor
+            os.close(self._use_fd)
+            self._use_fd = None
+    
+    def __del__(self):
+        self.close()
+    
+    def _hold(self):
+        if self._use_fd is not None or fcntl is None:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._use_fd = os.open(self.root / f"{self.dir.name}.use", os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._use_fd, fcntl.LOCK_SH)
+
+    def _build(self, files, keys, workers):
+        tmp_dir = self.root / f".{self.dir.name}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        array = np.lib.format.open_memmap(
+            tmp_dir / 'images.npy', mode='w+', dtype=np.uint8,
+            shape=(len(files), self.imgsz, self.imgsz, 3)
+        )
+
+        donors = self._donors()
+        index = {}
+        to_decode = []
+        copied = 0
+        for slot, path in enumerate(files):
+            donor = donors.get(tuple(keys[path]))
+            if donor:
+                source, entry = donor
+                h, w = entry['hw']
+                array[slot, :h, :w] = source[entry['slot'], :h, :w]
+                index[path] = {'slot': slot, 'key': keys[path], 'hw': entry['hw'], 'hw0': entry['hw0']}
+                copied += 1
+            else:
+                to_decode.append((slot, path))
+
+        def decode(item):
+            slot, path = item
+            im, hw0 = resize_image(path, self.imgsz)
+            h, w = im.shape[:2]
+            array[slot, :h, :w] = im
+            return path, {'slot': slot, 'key': keys[path], 'hw': [h, w], 'hw0': list(hw0)}
+
+        # cv2 releases the GIL while decoding and resizing
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            index.update(executor.map(decode, to_decode))
+
+        array.flush()
+        del array
+        with open(tmp_dir / 'index.json', 'w') as f:
+            json.dump({
+                'imgsz': self.imgsz,
+                'build': uuid.uuid4().hex,
+                'created': datetime.now().isoformat(),
+                'images': index,
+            }, f)
+        shutil.rmtree(self.dir, ignore_errors=True)
+        os.replace(tmp_dir, self.dir)
+
+        return {'images': len(files), 'decoded': len(to_decode), 'copied': copied, 'reused': 0}
+
+    def _donors(self):
+        """file key -> (array, entry) over the other caches of the same imgsz"""
+        donors = {}
+        for directory in self.root.glob(f"*_{self.imgsz}"):
+            index = self._load_index(directory)
+            if not index:
+                continue
+            try:
+                array = np.load(directory / 'images.npy', mmap_mode='r')
+            except OSError:
+                continue  # pruned meanwhile
+            for entry in index.values():
+                donors[tuple(entry['key'])] = (array, entry)
+        return donors
+
+    @staticmethod
+    def _read_index(directory):
+        """Contents of index.json (build id, images), or None"""
+        try:
+            with open(directory / 'index.json', 'r') as f:
+                built = json.load(f)
+            return built if isinstance(built.get('images'), dict) else None
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    @classmethod
+    def _load_index(cls, directory):
+        built = cls._read_index(directory)
+        return built['images'] if built else None
+
+    def _prune(self):
+        """Keep the `keep` most recently built caches, and every cache still in use"""
+        caches = sorted(
+            (d for d in self.root.iterdir() if d.is_dir() and not d.name.startswith('.')),
+            key=lambda d: (d / 'index.json').stat().st_mtime if (d / 'index.json').exists() else 0,
+            reverse=True
+        )
+        for stale in caches[self.keep:] if self.keep else []:
+            if fcntl is None:
+                shutil.rmtree(stale, ignore_errors=True)
+                continue
+            fd = os.open(self.root / f"{stale.name}.use", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                logger.info(f"Image cache {stale.name} in use, not pruned")
+                os.close(fd)
+                continue
+            try:
+                shutil.rmtree(stale, ignore_errors=True)
+            finally:
+                os.close(fd)
+
+
+class CachedYOLODataset(YOLODataset):
+    """
+    YOLODataset whose load_image reads the image cache before decoding
+    
+    Images missing from the cache (or all of them, if its file has gone)
+    are decoded by YOLODataset.load_image.
+    """
+
+    image_cache = None
+
+    def load_image(self, i, rect_mode=True):
+        cached = self.image_cache.get(self.im_files[i]) if rect_mode and self.ims[i] is None else None
+        if cached is None:
+            return super().load_image(i, rect_mode)
+
+        im, hw0 = cached
+        # Same mosaic buffer bookkeeping as YOLODataset.load_image
+        if self.augment:
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, hw0, im.shape[:2]
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                if getattr(self, 'cache', None) != 'ram':
+                    self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+        return im, hw0, im.shape[:2]
+
+
+class CachedSegmentationTrainer(SegmentationTrainer):
+    """SegmentationTrainer whose train/val datasets go through an ImageCache"""
+
+    cache_name = 'base'
+    cache_root = 'training_data/image_cache'
+    cache_keep = 4
+
+    def build_dataset(self, img_path, mode='train', batch=None):
+        dataset = super().build_dataset(img_path, mode, batch)
+        if type(dataset) is not YOLODataset:
+            logger.warning(f"Image cache disabled for {type(dataset).__name__}")
+            return dataset
+
+        # Keyed by the resolved file list too: trainers sharing a cache name
+        # (e.g. 'base') on different data.yaml files get separate caches
+        files = sorted(os.path.realpath(f) for f in dataset.im_files)
+        digest = hashlib.sha256('\n'.join(files).encode('utf-8')).hexdigest()[:12]
+        cache = ImageCache(
+            self.cache_root, f"{self.cache_name}_{mode}_{digest}", self.args.imgsz, keep=self.cache_keep
+        )
+        cache.prepare(dataset.im_files, workers=max(1, self.args.workers))
+        dataset.__class__ = CachedYOLODataset
+        dataset.image_cache = cache
+        return dataset
+
+
+def cached_trainer(name, root='training_data/image_cache', keep=4):
+    """
+    Trainer class for YOLO.train(trainer=...) caching images under `name`
+
+    Args:
+        name: Dataset key (dataset version), combined with the split, a digest
+            of the image files and imgsz
+        root: Directory of the caches
+        keep: Number of caches kept on disk
+    """
+    return type('CachedSegmentationTrainer', (CachedSegmentationTrainer,), {
+        'cache_name': name,
+        'cache_root': root,
+        'cache_keep': keep,
+    })
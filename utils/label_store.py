@@ -0,0 +1,192 @@
+"""
+SQLite Label Store
+Indexed, paginated storage backend for labeled data
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS labels (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    label_id TEXT NOT NULL UNIQUE,
+    image_id TEXT,
+    timestamp TEXT NOT NULL,
+    masks TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_labels_image_id ON labels(image_id);
+CREATE INDEX IF NOT EXISTS idx_labels_timestamp ON labels(timestamp);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+MAX_PAGE_SIZE = 1000
+
+
+class SQLiteLabelStore:
+    """Labels in a local SQLite database (WAL mode, one connection per thread)"""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_dict(row):
+        return {
+            'label_id': row['label_id'],
+            'image_id': row['image_id'],
+            'masks': json.loads(row['masks']),
+            'timestamp': row['timestamp'],
+        }
+
+    def insert_many(self, labels):
+        """
+        Insert label records in a single transaction
+
+        Args:
+            labels: iterable of dicts with label_id, image_id, masks, timestamp
+        """
+        rows = [
+            (l['label_id'], l.get('image_id'), l['timestamp'], json.dumps(l.get('masks', [])))
+            for l in labels
+        ]
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                'INSERT INTO labels (label_id, image_id, timestamp, masks) VALUES (?, ?, ?, ?)',
+                rows
+            )
+        return len(rows)
+
+    def insert(self, label):
+        """Insert a single label record"""
+        return self.insert_many([label])
+
+    def get(self, label_id):
+        """Get one label by its label_id, or None"""
+        row = self._connection().execute(
+            'SELECT * FROM labels WHERE label_id = ?', (label_id,)
+        ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def query(self, cursor=None, limit=100, image_id=None, since=None, until=None):
+        """
+        Page through labels, newest first
+
+        Args:
+            cursor: opaque cursor returned by the previous page (None for the first page)
+            limit: page size (capped at MAX_PAGE_SIZE)
+            image_id: only labels for this image
+            since / until: ISO timestamp bounds (inclusive)
+
+        Returns:
+            (labels, next_cursor) - next_cursor is None on the last page
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        clauses, params = [], []
+        if cursor not in (None, ''):
+            try:
+                cursor = int(cursor)
+            except ValueError:
+                raise ValueError(f"Invalid cursor: {cursor}")
+            clauses.append('id < ?')
+            params.append(cursor)
+        if image_id:
+            clauses.append('image_id = ?')
+            params.append(image_id)
+        if since:
+            clauses.append('timestamp >= ?')
+            params.append(since)
+        if until:
+            clauses.append('timestamp <= ?')
+            params.append(until)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._connection().execute(
+            f'SELECT * FROM labels {where} ORDER BY id DESC LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+
+        next_cursor = str(rows[limit - 1]['id']) if len(rows) > limit else None
+        return [self._to_dict(r) for r in rows[:limit]], next_cursor
+
+    def iter_all(self, batch_size=500):
+        """Iterate over every label, oldest first, without loading them all"""
+        last_id = 0
+        conn = self._connection()
+        while True:
+            rows = conn.execute(
+                'SELECT * FROM labels WHERE id > ? ORDER BY id LIMIT ?', (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._to_dict(row)
+            last_id = rows[-1]['id']
+
+    def count(self):
+        """Total number of labels"""
+        return self._connection().execute('SELECT COUNT(*) FROM labels').fetchone()[0]
+
+    def last_id(self):
+        """Highest row id (0 if empty); changes whenever a label is inserted"""
+        return self._connection().execute('SELECT MAX(id) FROM labels').fetchone()[0] or 0
+
+    def migrate_from_json(self, labels_dir):
+        """
+        One-shot import of the legacy one-file-per-label JSON directory
+
+        Returns:
+            Number of labels imported (0 if the migration already ran)
+        """
+        conn = self._connection()
+        done = conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        if done:
+            return 0
+
+        labels = []
+        labels_dir = Path(labels_dir)
+        if labels_dir.exists():
+            for label_file in labels_dir.glob('*.json'):
+                try:
+                    with open(label_file, 'r') as f:
+                        labels.append(json.load(f))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable label file {label_file}: {e}")
+
+        labels.sort(key=lambda l: l.get('timestamp') or '')
+        with conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO labels (label_id, image_id, timestamp, masks) VALUES (?, ?, ?, ?)',
+                [
+                    (l['label_id'], l.get('image_id'), l.get('timestamp') or '', json.dumps(l.get('masks', [])))
+                    for l in labels if l.get('label_id')
+                ]
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (str(len(labels)),))
+
+        if labels:
+            logger.info(f"Migrated {len(labels)} JSON labels into {self.db_path}")
+        return len(labels)
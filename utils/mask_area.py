@@ -0,0 +1,113 @@
+"""
+Mask Area Engine
+Computes segmentation areas in original-image pixel units
+"""
+
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# mask    - count pixels at model resolution, rescale through the letterbox (default)
+# polygon - shoelace area of the contours in result.masks.xy
+# retina  - full-resolution masks, only when precision demands it
+AREA_MODES = ('mask', 'polygon', 'retina')
+
+
+def letterbox_crop(mask_shape, orig_shape):
+    """
+    Locate the image inside a letterboxed mask
+
+    Mirrors ultralytics.utils.ops.scale_image so that the crop matches
+    exactly the region the model saw.
+
+    Args:
+        mask_shape: (height, width) of the model-resolution masks
+        orig_shape: (height, width) of the original image
+
+    Returns:
+        ((top, left, bottom, right), scale) where scale converts one mask
+        pixel inside the crop to original-image pixels
+    """
+    mh, mw = mask_shape[:2]
+    h, w = orig_shape[:2]
+
+    gain = min(mh / h, mw / w)
+    pad_x = (mw - w * gain) / 2
+    pad_y = (mh - h * gain) / 2
+
+    top, left = int(pad_y), int(pad_x)
+    bottom, right = int(mh - pad_y), int(mw - pad_x)
+
+    crop_pixels = max((bottom - top) * (right - left), 1)
+    scale = (h * w) / crop_pixels
+    return (top, left, bottom, right), scale
+
+
+def polygon_area(points):
+    """Shoelace area of a polygon given as [[x, y], ...]"""
+    pts = np.asarray(points, dtype=np.float64)
+    if pts.ndim != 2 or len(pts) < 3:
+        return 0.0
+    x, y = pts[:, 0], pts[:, 1]
+    return float(0.5 * abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1))))
+
+
+class MaskAreaEngine:
+    """Per-detection mask areas for an ultralytics segmentation result"""
+
+    def __init__(self, mode='mask'):
+        if mode not in AREA_MODES:
+            raise ValueError(f"Unknown area mode '{mode}', expected one of {AREA_MODES}")
+        self.mode = mode
+
+    def predict_kwargs(self):
+        """Extra arguments for model.predict required by the current mode"""
+        return {'retina_masks': True} if self.mode == 'retina' else {}
+
+    def areas(self, result):
+        """
+        Compute the area of every mask in a result
+
+        Args:
+            result: ultralytics Results with masks
+
+        Returns:
+            numpy array of areas (float, original-image pixels), one per mask
+        """
+        if result is None or result.masks is None:
+            return np.zeros(0, dtype=np.float64)
+
+        if self.mode == 'polygon':
+            return np.array([polygon_area(poly) for poly in result.masks.xy], dtype=np.float64)
+
+        orig_shape = result.orig_shape
+        data = result.masks.data
+        (top, left, bottom, right), scale = letterbox_crop(data.shape[1:], orig_shape)
+
+        if self.mode == 'retina' and tuple(data.shape[1:]) != tuple(orig_shape[:2]):
+            # Model was not run with retina_masks: upsample one mask at a time
+            logger.warning("Retina area mode without retina masks, upsampling per mask")
+            return self._upsampled_areas(data, (top, left, bottom, right), orig_shape)
+
+        cropped = data[:, top:bottom, left:right] > 0.5
+        if hasattr(cropped, 'cpu'):
+            counts = cropped.sum(dim=(1, 2)).cpu().numpy()
+        else:
+            counts = np.asarray(cropped).sum(axis=(1, 2))
+
+        return counts.astype(np.float64) * scale
+
+    def _upsampled_areas(self, data, crop, orig_shape):
+        """Exact-resolution areas, allocating a single full-size mask at a time"""
+        top, left, bottom, right = crop
+        h, w = orig_shape[:2]
+        areas = []
+        for mask in data:
+            mask_np = mask.cpu().numpy() if hasattr(mask, 'cpu') else np.asarray(mask)
+            full = cv2.resize(mask_np[top:bottom, left:right].astype(np.float32), (w, h),
+                              interpolation=cv2.INTER_LINEAR)
+            areas.append(float(np.count_nonzero(full > 0.5)))
+        return np.array(areas, dtype=np.float64)
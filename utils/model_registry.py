@@ -0,0 +1,503 @@
+"""
+Model Registry
+Versioned model store with validated background deployment and instant rollback
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+import logging
+
+import numpy as np
+
+from utils.artifact_index import artifact_index
+from utils.group_commit import FileLock
+
+logger = logging.getLogger(__name__)
+
+# Path every script and legacy route loads; kept pointing at the current version
+LEGACY_MODEL_PATH = 'models/yolov8n-seg_trained.pt'
+FALLBACK_MODEL = 'yolov8n-seg.pt'
+
+# Golden-set void rate tolerances, in percentage points
+DEFAULT_TOLERANCES = {
+    'max_abs_diff': 5.0,     # worst image
+    'mean_abs_diff': 2.0,    # average over the golden set
+}
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff'}
+
+
+def _sha256_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ServingModel:
+    """
+    One loaded model version
+
+    The void-rate calculator and the YOLOInference wrapper share the same
+    weights. Ultralytics predictors are not thread-safe, so predictions
+    on one instance go through its lock.
+    """
+
+    def __init__(self, version, path, area_mode='mask'):
+        from void_rate_calculator import VoidRateCalculator
+        from utils.yolo_inference import YOLOInference
+
+        self.version = version
+        self.path = str(path)
+        self.calculator = VoidRateCalculator(self.path, area_mode=area_mode)
+        self.inference = YOLOInference(self.path, model=self.calculator.model)
+        self.lock = threading.Lock()
+
+    def void_rate(self, image, conf_threshold=0.5):
+        with self.lock:
+            return self.calculator.calculate_void_rate(image, conf_threshold=conf_threshold, verbose=False)
+
+    def warmup(self, images, runs=3):
+        """Run a few predictions so the first real request pays no lazy initialization"""
+        if not images:
+            images = [np.zeros((640, 640, 3), dtype=np.uint8)]
+        for i in range(runs):
+            with self.lock:
+                self.calculator.predict_masks(images[i % len(images)])
+
+
+class ModelRegistry:
+    """
+    Immutable model versions plus a pointer to the one being served
+
+    registry.json (replaced atomically, guarded by a file lock) holds the
+    versions and the current/previous pointers. A deployment loads the
+    candidate, warms it up and checks its void rates on the golden set
+    before moving the pointer. Every process serves from its in-memory
+    model and, when the pointer moves, loads the new version in the
+    background and switches only once it is warm; the previous version
+    stays loaded, so a rollback is a reference swap.
+    """
+
+    def __init__(self, root='models', area_mode='mask', golden_dir='models/golden',
+                 tolerances=None, warmup_runs=3, check_interval=1.0):
+        self.root = Path(root)
+        self.area_mode = area_mode
+        self.golden_dir = Path(golden_dir)
+        self.tolerances = dict(DEFAULT_TOLERANCES, **(tolerances or {}))
+        self.warmup_runs = warmup_runs
+        self.check_interval = check_interval
+
+        self.registry_dir = self.root / 'registry'
+        self.versions_dir = self.registry_dir / 'versions'
+        self.versions_dir.mkdir(parents=True, exist_ok=True)
+        self.pointer_path = self.registry_dir / 'registry.json'
+        self._file_lock = FileLock(self.registry_dir / 'registry.lock')
+
+        self._lock = threading.Lock()
+        self._serving = None        # ServingModel answering requests
+        self._standby = None        # previously served model, kept warm for rollback
+        self._loading = None        # version being loaded in the background
+        self._last_check = 0.0
+        self._deploy_thread = None
+
+        self._bootstrap()
+
+    # ------------------------------------------------------------------
+    # Store
+    # ------------------------------------------------------------------
+
+    def _read(self):
+        if self.pointer_path.exists():
+            try:
+                with open(self.pointer_path, 'r') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Model registry read error: {str(e)}")
+        return {'current': None, 'previous': None, 'versions': {}, 'deployment': None}
+
+    def _write(self, data):
+        tmp_path = self.pointer_path.with_suffix(f'.json.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.pointer_path)
+
+    def _update(self, change):
+        """Read-modify-write of registry.json under the cross-process lock"""
+        with self._file_lock:
+            data = self._read()
+            result = change(data)
+            self._write(data)
+            return result
+
+    def _bootstrap(self):
+        """Register the legacy model as the first version of an empty registry"""
+        if self._read()['versions'] or not Path(LEGACY_MODEL_PATH).exists():
+            return
+        entry = self.register(LEGACY_MODEL_PATH, source='initial')
+
+        def make_current(data):
+            if data['current'] is None:
+                data['current'] = entry['version']
+                data['versions'][entry['version']]['status'] = 'deployed'
+        self._update(make_current)
+
+    def register(self, model_path, source='training', metadata=None):
+        """
+        Copy a model file into the store as a new immutable version
+
+        Returns:
+            The version entry (status 'registered', not served yet)
+        """
+        model_path = Path(model_path)
+        sha = _sha256_file(model_path)
+
+        def add(data):
+            for entry in data['versions'].values():
+                if entry['sha256'] == sha:
+                    return entry
+            number = max((int(v[1:]) for v in data['versions']), default=0) + 1
+            version = f"v{number:04d}"
+            path = self.versions_dir / f"{version}.pt"
+            tmp_path = path.with_suffix(f'.pt.{os.getpid()}.tmp')
+            shutil.copy2(model_path, tmp_path)
+            os.replace(tmp_path, path)
+            artifact_index.record_write(str(path))
+
+            entry = {
+                'version': version,
+                'path': str(path),
+                'sha256': sha,
+                'source': source,
+                'created': datetime.now().isoformat(),
+                'status': 'registered',
+                'metadata': metadata or {},
+                'validation': None,
+            }
+            data['versions'][version] = entry
+            return entry
+
+        entry = self._update(add)
+        logger.info(f"Model registered: {entry['version']} from {model_path}")
+        return entry
+
+    def describe(self):
+        """Versions (newest first), current/previous pointers and last deployment"""
+        data = self._read()
+        return {
+            'current': data['current'],
+            'previous': data['previous'],
+            'serving': self._serving.version if self._serving else None,
+            'deployment': data.get('deployment'),
+            'versions': sorted(data['versions'].values(), key=lambda v: v['version'], reverse=True),
+        }
+
+    # ------------------------------------------------------------------
+    # Deployment
+    # ------------------------------------------------------------------
+
+    def deploy(self, version, background=True, force=False):
+        """
+        Load, warm up and validate a version, then make it current
+
+        Args:
+            version: Version to deploy
+            background: Return immediately and deploy in a thread
+            force: Deploy even if the golden-set validation fails (or the golden set is empty)
+
+        Returns:
+            The deployment record ('running' when started in the background)
+        """
+        data = self._read()
+        if version not in data['versions']:
+            raise ValueError(f"Unknown model version: {version}")
+        if self._deploy_thread and self._deploy_thread.is_alive():
+            raise RuntimeError("A deployment is already running")
+
+        self._set_deployment(version, 'running', step='loading')
+        if not background:
+            return self._deploy(version, force)
+        self._deploy_thread = threading.Thread(
+            target=self._deploy, args=(version, force), name='model-deploy', daemon=True
+        )
+        self._deploy_thread.start()
+        return self._read()['deployment']
+
+    def _set_deployment(self, version, status, **details):
+        def change(data):
+            data['deployment'] = {
+                'version': version,
+                'status': status,
+                'updated': datetime.now().isoformat(),
+                **details,
+            }
+            return data['deployment']
+        return self._update(change)
+
+    def _deploy(self, version, force):
+        try:
+            entry = self._read()['versions'][version]
+            started = time.time()
+            candidate = ServingModel(version, entry['path'], self.area_mode)
+
+            self._set_deployment(version, 'running', step='warming')
+            golden = self._golden_images()
+            candidate.warmup([path for path, _ in golden][:self.warmup_runs], self.warmup_runs)
+
+            self._set_deployment(version, 'running', step='validating')
+            validation = self._validate(candidate, golden)
+            validation['load_and_warmup_seconds'] = round(time.time() - started, 2)
+
+            def record(data):
+                data['versions'][version]['validation'] = validation
+            self._update(record)
+
+            if not validation['passed'] and not force:
+                self._update(lambda data: data['versions'][version].update(status='rejected'))
+                logger.warning(f"Model {version} rejected by golden-set validation: {validation}")
+                return self._set_deployment(version, 'rejected', validation=validation)
+
+            self._switch(version)
+            # The validated candidate is already warm: serve it right away
+            self._install(candidate)
+            logger.info(f"Model {version} deployed")
+            return self._set_deployment(version, 'deployed', validation=validation)
+
+        except Exception as e:
+            logger.error(f"Model deployment error: {str(e)}")
+            return self._set_deployment(version, 'error', error=str(e))
+
+    def _golden_images(self):
+        """[(image path, expected void rate or None)] from golden_dir (+ optional golden.json)"""
+        if not self.golden_dir.is_dir():
+            return []
+        expected = {}
+        manifest = self.golden_dir / 'golden.json'
+        if manifest.exists():
+            with open(manifest, 'r') as f:
+                expected = json.load(f)
+        images = sorted(p for p in self.golden_dir.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        return [
+            (str(p), (expected.get(p.name) or {}).get('void_rate')) for p in images
+        ]
+
+    def _validate(self, candidate, golden):
+        """
+        Compare the candidate's void rates with the golden set
+
+        Images without an expected value in golden.json are compared with
+        the model currently served. An empty golden set fails.
+        """
+        if not golden:
+            # Nothing to compare with is not a pass: only a forced deployment goes through
+            logger.warning(f"No golden images in {self.golden_dir}, deployment needs force (or seed_golden)")
+            return {'passed': False, 'skipped': True, 'reason': 'empty golden set',
+                    'images': 0, 'tolerances': self.tolerances}
+
+        reference = None
+        if any(value is None for _, value in golden):
+            reference = self.serving()
+
+        diffs, images = [], []
+        for path, expected in golden:
+            if expected is None:
+                expected = reference.void_rate(path)['void_rate']
+            actual = candidate.void_rate(path)['void_rate']
+            diff = abs(actual - expected)
+            diffs.append(diff)
+            images.append({
+                'image': Path(path).name,
+                'expected': round(expected, 3),
+                'actual': round(actual, 3),
+                'abs_diff': round(diff, 3),
+            })
+
+        max_diff = max(diffs)
+        mean_diff = sum(diffs) / len(diffs)
+        return {
+            'passed': max_diff <= self.tolerances['max_abs_diff'] and mean_diff <= self.tolerances['mean_abs_diff'],
+            'skipped': False,
+            'images': len(images),
+            'max_abs_diff': round(max_diff, 3),
+            'mean_abs_diff': round(mean_diff, 3),
+            'tolerances': self.tolerances,
+            'details': images,
+        }
+
+    def seed_golden(self, image_paths):
+        """
+        Add images to the golden set, with the void rates of the model currently served
+
+        Images already in the golden set keep their expected value.
+
+        Args:
+            image_paths: Image files to copy into golden_dir
+
+        Returns:
+            Dict with the number of images added and in the golden set
+        """
+        self.golden_dir.mkdir(parents=True, exist_ok=True)
+        manifest = self.golden_dir / 'golden.json'
+        known = {p.name for p in self.golden_dir.iterdir()}
+        reference = self.serving()
+
+        # Inference outside the registry lock, deployments are not held up
+        seeded = {}
+        for path in map(Path, image_paths):
+            if path.suffix.lower() not in IMAGE_EXTENSIONS or not path.is_file() or path.name in known:
+                continue
+            seeded[path.name] = (path, {
+                'void_rate': reference.void_rate(str(path))['void_rate'],
+                'version': reference.version,
+                'added': datetime.now().isoformat(),
+            })
+
+        with self._file_lock:
+            expected = {}
+            if manifest.exists():
+                with open(manifest, 'r') as f:
+                    expected = json.load(f)
+            added = 0
+            for name, (path, entry) in seeded.items():
+                target = self.golden_dir / name
+                if target.exists():
+                    continue
+                shutil.copy2(path, target)
+                expected[name] = entry
+                added += 1
+
+            tmp_path = manifest.with_suffix(f'.json.{os.getpid()}.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(expected, f, indent=2)
+            os.replace(tmp_path, manifest)
+
+        logger.info(f"Golden set seeded: {added} images added")
+        return {'added': added, 'images': len(self._golden_images())}
+
+    def _switch(self, version):
+        """Move the registry pointer (atomic rename) and the legacy model path"""
+        def change(data):
+            if data['current'] != version:
+                data['previous'] = data['current']
+                data['current'] = version
+            data['versions'][version]['status'] = 'deployed'
+            data['versions'][version]['deployed'] = datetime.now().isoformat()
+            return data['versions'][version]['path']
+        path = self._update(change)
+
+        # Scripts reading the legacy path see either the old or the new file,
+        # never half of one. A copy, not a hard link: anything writing to the
+        # legacy path in place must not alter the immutable version behind it
+        legacy = Path(LEGACY_MODEL_PATH)
+        legacy.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = legacy.with_suffix(f'.pt.{os.getpid()}.tmp')
+        shutil.copy2(path, tmp_path)
+        os.replace(tmp_path, legacy)
+        artifact_index.record_write(str(legacy))
+
+    def rollback(self):
+        """
+        Serve the previous version again
+
+        Returns:
+            The version now current
+        """
+        def change(data):
+            if not data['previous']:
+                raise RuntimeError("No previous model version to roll back to")
+            data['current'], data['previous'] = data['previous'], data['current']
+            return data['current']
+        version = self._update(change)
+        self._switch(version)
+
+        with self._lock:
+            if self._standby and self._standby.version == version:
+                self._serving, self._standby = self._standby, self._serving
+        self._set_deployment(version, 'rolled_back')
+        logger.info(f"Model rolled back to {version}")
+        return version
+
+    # ------------------------------------------------------------------
+    # Serving
+    # ------------------------------------------------------------------
+
+    def _install(self, model):
+        with self._lock:
+            if self._serving is not None and self._serving.version != model.version:
+                self._standby = self._serving
+            self._serving = model
+            if self._loading == model.version:
+                self._loading = None
+
+    def _load_current(self, version):
+        """Background load + warmup of the version another process deployed"""
+        try:
+            entry = self._read()['versions'][version]
+            model = ServingModel(version, entry['path'], self.area_mode)
+            model.warmup([path for path, _ in self._golden_images()][:self.warmup_runs], self.warmup_runs)
+            self._install(model)
+            logger.info(f"Now serving model {version}")
+        except Exception as e:
+            logger.error(f"Model load error for {version}: {str(e)}")
+            with self._lock:
+                self._loading = None
+
+    def serving(self):
+        """
+        The model to answer requests with
+
+        Never blocks on a new version: until it is loaded and warm, the
+        previous one keeps serving. Only the very first call loads synchronously.
+        """
+        now = time.monotonic()
+        if self._serving is not None and now - self._last_check < self.check_interval:
+            return self._serving
+        self._last_check = now
+
+        current = self._read()['current']
+        with self._lock:
+            serving = self._serving
+            if serving is not None and (current is None or serving.version == current):
+                return serving
+            if serving is not None:
+                if self._standby and self._standby.version == current:
+                    self._serving, self._standby = self._standby, serving
+                    return self._serving
+                if self._loading != current:
+                    self._loading = current
+                    threading.Thread(
+                        target=self._load_current, args=(current,), name='model-load', daemon=True
+                    ).start()
+                return serving
+
+        # Nothing loaded yet in this process
+        if current is not None:
+            entry = self._read()['versions'][current]
+            model = ServingModel(current, entry['path'], self.area_mode)
+        else:
+            path = LEGACY_MODEL_PATH if Path(LEGACY_MODEL_PATH).exists() else FALLBACK_MODEL
+            model = ServingModel(None, path, self.area_mode)
+        self._install(model)
+        return model
+
+
+_shared_registry = None
+_shared_lock = threading.Lock()
+
+
+def get_model_registry():
+    """Process-wide ModelRegistry (every route serves from the same loaded model)"""
+    global _shared_registry
+    with _shared_lock:
+        if _shared_registry is None:
+            _shared_registry = ModelRegistry()
+        return _shared_registry
@@ -0,0 +1,193 @@
+"""
+Prediction Ledger
+Append-only, crash-safe prediction log with a write-behind group-commit writer
+"""
+
+import atexit
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+import logging
+
+from utils.group_commit import FileLock
+
+logger = logging.getLogger(__name__)
+
+# Frame: magic (2 bytes) | payload length (uint32) | crc32 of payload (uint32) | payload (JSON, utf-8)
+FRAME_MAGIC = b'PL'
+FRAME_HEADER = struct.Struct('>2sII')
+
+
+def encode_frame(record):
+    """Serialize one record into a framed byte string"""
+    payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+    return FRAME_HEADER.pack(FRAME_MAGIC, len(payload), zlib.crc32(payload)) + payload
+
+
+def read_frames(path, start=0, end=None):
+    """
+    Iterate over the valid frames of a ledger file
+
+    Stops at the first torn or corrupt frame, which can only be the tail
+    left behind by a crash in the middle of a write.
+
+    Yields:
+        (offset_after_frame, record)
+    """
+    path = Path(path)
+    if not path.exists():
+        return
+    with open(path, 'rb') as f:
+        f.seek(start)
+        offset = start
+        while end is None or offset < end:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            magic, length, crc = FRAME_HEADER.unpack(header)
+            if magic != FRAME_MAGIC:
+                return
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            offset += FRAME_HEADER.size + length
+            yield offset, json.loads(payload)
+
+
+class PredictionLedger:
+    """
+    Append-only prediction ledger
+
+    append() only enqueues; a background thread drains the bounded queue and
+    commits records in groups, flushing when batch_size records are waiting
+    or flush_interval seconds have passed, with one write and one fsync per
+    group. Every process serving predictions may open the same ledger:
+    recovery and commits hold a lock file, so groups never interleave and
+    a tail is only cut off once no writer is appending to it.
+    """
+
+    def __init__(self, path, batch_size=256, flush_interval=0.5, max_queue=10000,
+                 enqueue_timeout=0.05, fsync=True):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.fsync = fsync
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._write_lock = FileLock(self.path.with_name(self.path.name + '.lock'))
+        self._listeners = []
+        self._closed = threading.Event()
+        self._committed_offset = self._recover()
+
+        self._thread = threading.Thread(target=self._run, name='prediction-ledger', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def committed_offset(self):
+        """Byte offset of the end of the last committed group"""
+        return self._committed_offset
+
+    def _recover(self):
+        """Find the end of the valid data and cut off a torn tail"""
+        with self._write_lock:
+            end = 0
+            for end, _ in read_frames(self.path):
+                pass
+            if self.path.exists() and self.path.stat().st_size > end:
+                logger.warning(f"Truncating torn ledger tail at offset {end}: {self.path}")
+                with open(self.path, 'r+b') as f:
+                    f.truncate(end)
+            return end
+
+    def add_commit_listener(self, listener):
+        """Call listener(records, end_offset) after every committed group"""
+        self._listeners.append(listener)
+
+    def append(self, record):
+        """
+        Queue a record for the background writer
+
+        Blocks at most enqueue_timeout when the queue is full, then falls back
+        to a synchronous commit so that no prediction is ever dropped.
+        """
+        try:
+            self._queue.put(record, timeout=self.enqueue_timeout)
+        except queue.Full:
+            logger.warning("Prediction ledger queue full, committing synchronously")
+            self._commit([record])
+
+    def flush(self, timeout=None):
+        """Wait until every queued record has been committed"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        """Commit what is left and stop the writer"""
+        if self._closed.is_set():
+            return
+        self.flush(timeout=10)
+        self._closed.set()
+        self._thread.join(timeout=5)
+
+    def read(self, start=0, end=None):
+        """
+        Iterate over committed records, yielding (offset_after_record, record)
+
+        Reads up to the end of the file by default, so groups committed by
+        other processes sharing the ledger are included.
+        """
+        return read_frames(self.path, start, end)
+
+    def _run(self):
+        while not self._closed.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._commit(batch)
+            except Exception as e:
+                logger.error(f"Prediction ledger commit error: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _commit(self, records):
+        data = b''.join(encode_frame(r) for r in records)
+        with self._write_lock:
+            with open(self.path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+                self._committed_offset = f.tell()
+
+        for listener in self._listeners:
+            try:
+                listener(records, self._committed_offset)
+            except Exception as e:
+                logger.error(f"Ledger listener error: {str(e)}")
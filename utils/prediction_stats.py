@@ -0,0 +1,492 @@
+"""
+Prediction Statistics
+Aggregates kept current from the prediction ledger and persisted in snapshots
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import date, timedelta
+from pathlib import Path
+import logging
+
+from utils.quantile_sketch import FixedHistogram, KLLSketch
+
+logger = logging.getLogger(__name__)
+
+
+class RunningAggregates:
+    """Count, sum, sum of squares, min and max of void rate, plus area totals"""
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.min = None
+        self.max = None
+        self.chip_area = 0
+        self.holes_area = 0
+
+    def add(self, record, offset=None):
+        void_rate = float(record.get('void_rate', 0) or 0)
+        self.count += 1
+        self.sum += void_rate
+        self.sumsq += void_rate * void_rate
+        self.min = void_rate if self.min is None else min(self.min, void_rate)
+        self.max = void_rate if self.max is None else max(self.max, void_rate)
+        self.chip_area += int(record.get('chip_area', 0) or 0)
+        self.holes_area += int(record.get('holes_area', 0) or 0)
+
+    def merge(self, other):
+        """Fold another RunningAggregates into this one"""
+        if other.count == 0:
+            return self
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.chip_area += other.chip_area
+        self.holes_area += other.holes_area
+        return self
+
+    def summary(self):
+        """Summary statistics in the /api/report/summary format"""
+        if self.count == 0:
+            return {
+                'total_images': 0,
+                'avg_void_rate': 0,
+                'min_void_rate': 0,
+                'max_void_rate': 0
+            }
+        mean = self.sum / self.count
+        variance = max(self.sumsq / self.count - mean * mean, 0.0)
+        return {
+            'total_images': self.count,
+            'avg_void_rate': mean,
+            'min_void_rate': self.min,
+            'max_void_rate': self.max,
+            'std_void_rate': math.sqrt(variance),
+            'total_chip_area': self.chip_area,
+            'total_holes_area': self.holes_area,
+        }
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    def load(self, data):
+        for key, value in data.items():
+            setattr(self, key, value)
+        return self
+
+
+# ISO timestamp prefix length of each rollup granularity
+ROLLUP_KEY_LENGTH = {'day': 10, 'hour': 13}
+# Suffixes turning a bucket key into its first and last ISO timestamp
+BUCKET_BOUNDS = {
+    'day': ('T00:00:00', 'T23:59:59.999999'),
+    'hour': (':00:00', ':59:59.999999'),
+}
+
+
+def inclusive_until(until):
+    """Upper bound of a range; a date without time ('2026-10-18') covers that whole day"""
+    if until and len(until) == ROLLUP_KEY_LENGTH['day']:
+        return until + BUCKET_BOUNDS['day'][1]
+    return until
+
+
+class TimeRollups:
+    """
+    Daily and hourly RunningAggregates, keyed by ISO timestamp prefix
+
+    Hourly buckets older than hourly_retention_days are dropped; daily
+    buckets are kept forever (one row per day).
+    """
+
+    def __init__(self, hourly_retention_days=120):
+        self.hourly_retention_days = hourly_retention_days
+        self.buckets = {granularity: {} for granularity in ROLLUP_KEY_LENGTH}
+
+    def add(self, record, offset=None):
+        timestamp = record.get('timestamp') or ''
+        if len(timestamp) < ROLLUP_KEY_LENGTH['hour']:
+            return
+        for granularity, length in ROLLUP_KEY_LENGTH.items():
+            key = timestamp[:length]
+            bucket = self.buckets[granularity].get(key)
+            if bucket is None:
+                bucket = self.buckets[granularity][key] = RunningAggregates()
+                if granularity == 'day':
+                    self._prune_hours(key)
+            bucket.add(record)
+
+    def _prune_hours(self, newest_day):
+        try:
+            cutoff = (date.fromisoformat(newest_day) - timedelta(days=self.hourly_retention_days)).isoformat()
+        except ValueError:
+            return
+        for key in [k for k in self.buckets['hour'] if k < cutoff]:
+            del self.buckets['hour'][key]
+
+    def rows(self, granularity, since=None, until=None):
+        """Rollup rows overlapping [since, until], oldest first"""
+        start_suffix, end_suffix = BUCKET_BOUNDS[granularity]
+        rows = []
+        for key in sorted(self.buckets[granularity]):
+            if since and key + end_suffix < since:
+                continue
+            if until and key + start_suffix > until:
+                continue
+            rows.append({'bucket': key, **self.buckets[granularity][key].summary()})
+        return rows
+
+    def covered(self, since=None, until=None):
+        """
+        Merge the buckets lying entirely inside [since, until]
+
+        Whole days are used where possible, whole hours on the partial days
+        at the edges of the range.
+
+        Returns:
+            (aggregates, merged_days, merged_hours, first_start, last_end)
+            where first_start / last_end bound the merged buckets (None if
+            nothing was merged); records outside them must be scanned.
+        """
+        merged = RunningAggregates()
+        merged_keys = {'day': set(), 'hour': set()}
+        first_start, last_end = None, None
+
+        for granularity in ('day', 'hour'):
+            start_suffix, end_suffix = BUCKET_BOUNDS[granularity]
+            for key, bucket in self.buckets[granularity].items():
+                if granularity == 'hour' and key[:ROLLUP_KEY_LENGTH['day']] in merged_keys['day']:
+                    continue
+                start, end = key + start_suffix, key + end_suffix
+                if (since and start < since) or (until and end > until):
+                    continue
+                merged.merge(bucket)
+                merged_keys[granularity].add(key)
+                first_start = start if first_start is None else min(first_start, start)
+                last_end = end if last_end is None else max(last_end, end)
+
+        return merged, merged_keys['day'], merged_keys['hour'], first_start, last_end
+
+    def to_dict(self):
+        return {
+            granularity: {key: agg.to_dict() for key, agg in buckets.items()}
+            for granularity, buckets in self.buckets.items()
+        }
+
+    def load(self, data):
+        self.buckets = {
+            granularity: {key: RunningAggregates().load(value) for key, value in data.get(granularity, {}).items()}
+            for granularity in ROLLUP_KEY_LENGTH
+        }
+        return self
+
+
+class TimeIndex:
+    """
+    Sparse timestamp index over the prediction ledger
+
+    Every stride records it stores the ledger offset together with the
+    highest timestamp seen before that offset. The running maximum is
+    non-decreasing, so bisect finds a safe starting offset even if
+    concurrent writers committed records slightly out of order.
+    """
+
+    def __init__(self, stride=256):
+        self.stride = stride
+        self.offsets = []
+        self.max_before = []
+        self.seen = 0
+        self.max_timestamp = ''
+
+    def add(self, record, offset=None):
+        if offset is None:
+            return
+        if self.seen % self.stride == 0:
+            self.offsets.append(offset)
+            self.max_before.append(self.max_timestamp)
+        self.seen += 1
+        self.max_timestamp = max(self.max_timestamp, record.get('timestamp') or '')
+
+    def seek(self, since):
+        """Ledger offset from which every record with timestamp >= since is found"""
+        position = bisect_left(self.max_before, since) - 1
+        return self.offsets[position] if position >= 0 else 0
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    def load(self, data):
+        for key, value in data.items():
+            setattr(self, key, value)
+        return self
+
+
+# Shift name -> start hour; each shift runs until the next one starts
+SHIFTS = {'morning': 6, 'afternoon': 14, 'night': 22}
+
+# Metric -> (record key, histogram bucket edges)
+DISTRIBUTION_METRICS = {
+    'void_rate': ('void_rate', [float(edge) for edge in range(101)]),
+    'chip_area': ('chip_area', [0] + [2 ** power for power in range(27)]),
+    'num_holes': ('num_holes', list(range(51))),
+}
+
+
+def shift_of(timestamp, shifts=SHIFTS):
+    """
+    (shift day, shift name) of an ISO timestamp
+
+    A shift that crosses midnight belongs to the day it started on.
+    """
+    hour = int(timestamp[11:13])
+    starts = sorted(shifts.items(), key=lambda item: item[1])
+    day = date.fromisoformat(timestamp[:10])
+    for name, start in reversed(starts):
+        if hour >= start:
+            return day.isoformat(), name
+    return (day - timedelta(days=1)).isoformat(), starts[-1][0]
+
+
+class MetricDistributions:
+    """KLL sketch and fixed histogram of every distribution metric"""
+
+    def __init__(self, k=200):
+        self.count = 0
+        self.sketches = {name: KLLSketch(k) for name in DISTRIBUTION_METRICS}
+        self.histograms = {name: FixedHistogram(edges) for name, (_, edges) in DISTRIBUTION_METRICS.items()}
+
+    def add(self, record):
+        self.count += 1
+        for name, (key, _) in DISTRIBUTION_METRICS.items():
+            value = record.get(key)
+            if value is None:
+                continue
+            self.sketches[name].add(value)
+            self.histograms[name].add(value)
+
+    def merge(self, other):
+        self.count += other.count
+        for name in DISTRIBUTION_METRICS:
+            self.sketches[name].merge(other.sketches[name])
+            self.histograms[name].merge(other.histograms[name])
+        return self
+
+    def describe(self, quantiles, histograms=True):
+        """Quantiles (and optionally histograms) of every metric"""
+        result = {'count': self.count}
+        for name, sketch in self.sketches.items():
+            values = sketch.quantiles(quantiles)
+            result[name] = {
+                'count': sketch.count,
+                'min': sketch.min,
+                'max': sketch.max,
+                **{f"p{round(q * 100, 1):g}": value for q, value in zip(quantiles, values)},
+            }
+            if histograms:
+                result[name]['histogram'] = self.histograms[name].to_dict()
+        return result
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sketches': {name: sketch.to_dict() for name, sketch in self.sketches.items()},
+            'histograms': {name: hist.counts for name, hist in self.histograms.items()},
+        }
+
+    def load(self, data):
+        self.count = data['count']
+        for name, sketch in self.sketches.items():
+            if name in data['sketches']:
+                sketch.load(data['sketches'][name])
+        for name, hist in self.histograms.items():
+            if name in data['histograms']:
+                hist.load({'edges': hist.edges, 'counts': data['histograms'][name]})
+        return self
+
+
+class ShiftDistributions:
+    """
+    Void rate, chip area and hole count distributions per shift
+
+    Each (day, shift) keeps its own mergeable sketches and histograms, so
+    percentiles over any range of shifts are answered by merging buckets
+    rather than scanning predictions. Shift buckets older than
+    retention_days are dropped; the all-time distributions are kept.
+    """
+
+    def __init__(self, shifts=SHIFTS, retention_days=90, k=200, shift_k=128):
+        self.shifts = dict(shifts)
+        self.retention_days = retention_days
+        self.shift_k = shift_k
+        self.overall = MetricDistributions(k)
+        self.buckets = {}
+
+    def add(self, record, offset=None):
+        self.overall.add(record)
+        timestamp = record.get('timestamp') or ''
+        try:
+            day, shift = shift_of(timestamp, self.shifts)
+        except ValueError:
+            return
+        key = f"{day}/{shift}"
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = MetricDistributions(self.shift_k)
+            self._prune(day)
+        bucket.add(record)
+
+    def _prune(self, newest_day):
+        cutoff = (date.fromisoformat(newest_day) - timedelta(days=self.retention_days)).isoformat()
+        for key in [k for k in self.buckets if k < cutoff]:
+            del self.buckets[key]
+
+    def select(self, since=None, until=None, shift=None):
+        """Shift buckets whose day lies in [since, until], oldest first"""
+        selected = []
+        for key in sorted(self.buckets, key=self._chronological):
+            day, name = key.split('/')
+            if (since and day < since[:10]) or (until and day > until[:10]):
+                continue
+            if shift and name != shift:
+                continue
+            selected.append((day, name, self.buckets[key]))
+        return selected
+
+    def _chronological(self, key):
+        day, name = key.split('/')
+        return day, self.shifts.get(name, 0)
+
+    def to_dict(self):
+        return {
+            'shifts': self.shifts,
+            'overall': self.overall.to_dict(),
+            'buckets': {key: bucket.to_dict() for key, bucket in self.buckets.items()},
+        }
+
+    def load(self, data):
+        self.overall.load(data['overall'])
+        if data.get('shifts') != self.shifts:
+            logger.warning("Shift definitions changed, discarding saved shift distributions")
+            return self
+        self.buckets = {
+            key: MetricDistributions(self.shift_k).load(value)
+            for key, value in data.get('buckets', {}).items()
+        }
+        return self
+
+
+class PredictionAnalytics:
+    """
+    Incrementally maintained views over the prediction ledger
+
+    Every aggregator receives each prediction exactly once through add().
+    The views follow the ledger by byte offset: refresh() only reads frames
+    appended since the last call, including frames committed by other
+    processes, so reading the views costs O(1) when nothing changed.
+    State is persisted in an atomically replaced snapshot together with the
+    ledger offset it covers, so a restart only replays the tail.
+    """
+
+    def __init__(self, ledger, snapshot_path, aggregators, legacy_file=None,
+                 snapshot_every=1000, snapshot_interval=60):
+        self.ledger = ledger
+        self.snapshot_path = Path(snapshot_path)
+        self.aggregators = aggregators
+        self.legacy_file = Path(legacy_file) if legacy_file else None
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval = snapshot_interval
+
+        self._lock = threading.RLock()
+        self._offset = 0
+        self._unsaved = 0
+        self._last_snapshot = time.monotonic()
+
+        if not self._load_snapshot():
+            self._fold_legacy()
+        self.refresh()
+        ledger.add_commit_listener(lambda records, end_offset: self.refresh())
+
+    @property
+    def offset(self):
+        """Ledger offset covered by the views (changes whenever data changes)"""
+        return self._offset
+
+    def refresh(self):
+        """Apply every ledger record appended since the last refresh"""
+        with self._lock:
+            try:
+                size = self.ledger.path.stat().st_size
+            except FileNotFoundError:
+                return
+            if size <= self._offset:
+                return
+
+            for end, record in self.ledger.read(start=self._offset):
+                self._apply(record, self._offset)
+                self._offset = end
+                self._unsaved += 1
+
+            if self._unsaved >= self.snapshot_every or (
+                self._unsaved and time.monotonic() - self._last_snapshot > self.snapshot_interval
+            ):
+                self.save_snapshot()
+
+    def save_snapshot(self):
+        """Persist the views atomically (temp file + rename)"""
+        with self._lock:
+            data = {
+                'ledger_offset': self._offset,
+                'saved_at': time.time(),
+                'aggregators': {name: agg.to_dict() for name, agg in self.aggregators.items()},
+            }
+            tmp_path = self.snapshot_path.with_suffix(f'{self.snapshot_path.suffix}.{os.getpid()}.tmp')
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.snapshot_path)
+                self._unsaved = 0
+                self._last_snapshot = time.monotonic()
+            except OSError as e:
+                logger.error(f"Analytics snapshot error: {str(e)}")
+
+    def _apply(self, record, offset=None):
+        for aggregator in self.aggregators.values():
+            aggregator.add(record, offset)
+
+    def _load_snapshot(self):
+        """Restore from the snapshot; False if it is missing or does not cover every view"""
+        if not self.snapshot_path.exists():
+            return False
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                data = json.load(f)
+            saved = data.get('aggregators', {})
+            if set(saved) != set(self.aggregators):
+                logger.info("Analytics views changed, rebuilding from the ledger")
+                return False
+            for name, aggregator in self.aggregators.items():
+                aggregator.load(saved[name])
+            self._offset = int(data['ledger_offset'])
+            return True
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable analytics snapshot: {e}")
+            return False
+
+    def _fold_legacy(self):
+        """Apply the pre-ledger JSONL predictions once, before the ledger"""
+        if not self.legacy_file or not self.legacy_file.exists():
+            return
+        with open(self.legacy_file, 'r') as f:
+            for line in f:
+                if line.strip():
+                    self._apply(json.loads(line))
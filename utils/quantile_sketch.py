@@ -0,0 +1,150 @@
+"""
+Quantile Sketches
+Mergeable streaming quantile sketches and fixed-bucket histograms
+"""
+
+import math
+import random
+from bisect import bisect_right
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class KLLSketch:
+    """
+    KLL streaming quantile sketch
+
+    Values are kept in levels of compactors; an item at level h stands for
+    2**h original values. When a level is full it is sorted and every other
+    item (random offset) is promoted to the level above. Memory stays
+    O(k log(n/k)) and the rank error is roughly 1.7/k, whatever the number
+    of values. Two sketches merge by concatenating their levels.
+    """
+
+    def __init__(self, k=200):
+        self.k = k
+        self.levels = [[]]
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._rng = random.Random()
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def add(self, value):
+        value = float(value)
+        self.levels[0].append(value)
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        if other.count == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items = sorted(self.levels[level])
+                # An odd item stays behind so that the total weight is preserved
+                kept = [items.pop()] if len(items) % 2 else []
+                offset = self._rng.randint(0, 1)
+                self.levels[level + 1].extend(items[offset::2])
+                self.levels[level] = kept
+            level += 1
+
+    def quantile(self, q):
+        """Estimated value at quantile q (0..1), None if the sketch is empty"""
+        return self.quantiles([q])[0]
+
+    def quantiles(self, qs):
+        """Estimated values at several quantiles with a single sort"""
+        if self.count == 0:
+            return [None for _ in qs]
+        weighted = sorted(
+            (value, 1 << level)
+            for level, items in enumerate(self.levels)
+            for value in items
+        )
+        total = sum(weight for _, weight in weighted)
+        results = []
+        for q in qs:
+            if q <= 0:
+                results.append(self.min)
+                continue
+            if q >= 1:
+                results.append(self.max)
+                continue
+            target = q * total
+            cumulative = 0
+            for value, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    results.append(value)
+                    break
+            else:
+                results.append(self.max)
+        return results
+
+    def to_dict(self):
+        return {'k': self.k, 'levels': self.levels, 'count': self.count, 'min': self.min, 'max': self.max}
+
+    def load(self, data):
+        self.k = data['k']
+        self.levels = [list(items) for items in data['levels']] or [[]]
+        self.count = data['count']
+        self.min = data['min']
+        self.max = data['max']
+        return self
+
+
+class FixedHistogram:
+    """
+    Histogram over fixed bucket edges
+
+    counts[0] holds values below edges[0], counts[i] values in
+    [edges[i-1], edges[i]) and counts[-1] values >= edges[-1]. Histograms
+    with the same edges merge by adding their counts.
+    """
+
+    def __init__(self, edges):
+        self.edges = list(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+
+    def add(self, value):
+        self.counts[bisect_right(self.edges, value)] += 1
+
+    def merge(self, other):
+        """Fold another histogram (same edges) into this one"""
+        if other.edges != self.edges:
+            raise ValueError("Cannot merge histograms with different bucket edges")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        return self
+
+    def to_dict(self):
+        return {'edges': self.edges, 'counts': self.counts}
+
+    def load(self, data):
+        if list(data['edges']) != self.edges:
+            logger.warning("Histogram bucket edges changed, discarding saved counts")
+            return self
+        self.counts = list(data['counts'])
+        return self
@@ -0,0 +1,171 @@
+"""
+Replay Buffer
+Fine-tune training sets: new validated labels plus a stratified replay sample of older data
+"""
+
+import hashlib
+import os
+import random
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+import logging
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+def label_stratum(label_path):
+    """Stratum of a YOLO label file: the sorted set of class ids it contains ('empty' if none)"""
+    classes = set()
+    try:
+        with open(label_path, 'r') as f:
+            for line in f:
+                parts = line.split()
+                if parts:
+                    classes.add(int(float(parts[0])))
+    except OSError:
+        pass
+    return '+'.join(str(c) for c in sorted(classes)) or 'empty'
+
+
+def stratified_sample(items, size, seed=0):
+    """
+    Draw `size` items keeping the share of every stratum
+
+    Args:
+        items: [(item, stratum)]
+        size: Number of items to draw (all items if there are fewer)
+        seed: Seed of the draw, so a dataset version always replays the same images
+
+    Returns:
+        (sampled items, {stratum: drawn count})
+    """
+    strata = defaultdict(list)
+    for item, stratum in items:
+        strata[stratum].append(item)
+    if size >= len(items):
+        return [item for item, _ in items], {k: len(v) for k, v in strata.items()}
+
+    # Largest remainder allocation, at least one image per stratum when possible
+    total = len(items)
+    quotas = {k: size * len(v) / total for k, v in strata.items()}
+    allocation = {k: min(len(strata[k]), int(q)) for k, q in quotas.items()}
+    if size >= len(strata):
+        for k in allocation:
+            allocation[k] = max(allocation[k], 1)
+    for k in sorted(quotas, key=lambda k: quotas[k] - int(quotas[k]), reverse=True):
+        if sum(allocation.values()) >= size:
+            break
+        if allocation[k] < len(strata[k]):
+            allocation[k] += 1
+    # Rare strata bumped to one may overshoot: take back from the largest
+    while sum(allocation.values()) > size:
+        allocation[max(allocation, key=allocation.get)] -= 1
+
+    rng = random.Random(seed)
+    sampled = []
+    for k in sorted(strata):
+        sampled += rng.sample(sorted(strata[k]), allocation[k])
+    return sampled, {k: v for k, v in allocation.items() if v}
+
+
+class FineTuneSetBuilder:
+    """
+    Writes the image list and data.yaml of a fine-tune run
+
+    New samples are the validated labels added to the dataset after
+    `since_version` (the dataset the serving model was trained on). The
+    replay sample is drawn from the base training set and the older
+    validated labels, stratified by the classes present in each image. No
+    file is copied: the list points at the images of the dataset snapshot
+    and of the base set, whose labels sit in the sibling labels/ folders.
+    """
+
+    def __init__(self, dataset_builder, root='training_data/finetune', keep_runs=5):
+        self.dataset_builder = dataset_builder
+        self.root = Path(root)
+        self.keep_runs = keep_runs
+
+    def build(self, dataset, since_version=None, replay_size=200):
+        """
+        Args:
+            dataset: Result of DatasetBuilder.build()
+            since_version: Dataset version the current model already learned (None = none)
+            replay_size: Number of older images to replay
+
+        Returns:
+            Dict with data_yaml, images (train list size), new, replay and per-stratum counts
+        """
+        with open(dataset['data_yaml'], 'r') as f:
+            data = yaml.safe_load(f) or {}
+        snapshot_images = Path(dataset['data_yaml']).parent / 'train' / 'images'
+
+        new, old = [], []
+        for sample in self.dataset_builder.samples().values():
+            path = snapshot_images / f"{sample['name']}{Path(sample['image']).suffix}"
+            label = self.dataset_builder.pool_labels / sample['label']
+            added_in = sample.get('added_in')
+            # Samples from before the tracking (no added_in) were already trained on
+            is_new = since_version is None or (added_in is not None and added_in > since_version)
+            (new if is_new else old).append((str(path.resolve()), label_stratum(label)))
+
+        if not new:
+            raise RuntimeError(f"No new validated labels since dataset {since_version}")
+
+        train = data.get('train')
+        base_dirs = [Path(p) for p in (train if isinstance(train, list) else [train]) if p]
+        for directory in base_dirs:
+            if directory.resolve() == snapshot_images.resolve():
+                continue
+            old += self._base_images(directory)
+
+        seed = int(hashlib.sha256(dataset['version'].encode('utf-8')).hexdigest()[:8], 16)
+        replay, strata = stratified_sample(old, replay_size, seed=seed)
+        images = [path for path, _ in new] + replay
+
+        run_dir = self.root / f"{dataset['version']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        run_dir.mkdir(parents=True, exist_ok=True)
+        list_path = run_dir / 'train.txt'
+        with open(list_path, 'w') as f:
+            f.write('\n'.join(images) + '\n')
+        data['train'] = str(list_path.resolve())
+        data_yaml = run_dir / 'data.yaml'
+        tmp_path = data_yaml.with_suffix(f'.yaml.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            yaml.dump(data, f)
+        os.replace(tmp_path, data_yaml)
+        self._prune()
+
+        logger.info(f"Fine-tune set {run_dir.name}: {len(new)} new + {len(replay)} replayed {strata}")
+        return {
+            'data_yaml': str(data_yaml),
+            'images': len(images),
+            'new': len(new),
+            'replay': len(replay),
+            'replay_pool': len(old),
+            'strata': strata,
+        }
+
+    @staticmethod
+    def _base_images(images_dir):
+        """[(image path, stratum)] of a YOLO images/ folder whose labels/ sibling has a label"""
+        labels_dir = images_dir.parent / 'labels'
+        if not images_dir.is_dir():
+            return []
+        items = []
+        for path in sorted(images_dir.iterdir()):
+            label = labels_dir / f"{path.stem}.txt"
+            if path.suffix.lower() in IMAGE_EXTENSIONS and label.exists():
+                items.append((str(path.resolve()), label_stratum(label)))
+        return items
+
+    def _prune(self):
+        runs = sorted(p for p in self.root.iterdir() if p.is_dir())
+        for stale in runs[:-self.keep_runs] if self.keep_runs else []:
+            for path in stale.iterdir():
+                path.unlink()
+            stale.rmdir()
@@ -5,111 +5,530 @@ Handles fine-tuning YOLO with new labeled data
 
 from ultralytics import YOLO
 from pathlib import Path
+import gc
 import json
 import os
+import threading
+import time
 import logging
 from datetime import datetime
 
+import torch
+
+from config import DISTILLATION_CONFIG, FINE_TUNE_CONFIG, TRAINING_CACHE
+from utils.artifact_index import artifact_index
+from utils.cpu_autotuner import training_images
+from utils.dataset_builder import DatasetBuilder
+from utils.distillation import DistillationSetBuilder, TeacherCache
+from utils.hparam_search import measure_latency
+from utils.image_cache import cached_trainer
+from utils.model_registry import get_model_registry
+from utils.replay_buffer import FineTuneSetBuilder
+from utils.storage_manager import get_storage_manager
+
 logger = logging.getLogger(__name__)
 
+# Seconds per training image measured by earlier fine-tunes, per freeze/imgsz
+THROUGHPUT_PATH = Path('training_data/finetune/throughput.json')
+# Validation metrics compared by the fine-tune and distillation evaluations
+EVAL_METRICS = ('metrics/mAP50(B)', 'metrics/mAP50-95(B)', 'metrics/mAP50(M)', 'metrics/mAP50-95(M)')
+
+
+class TrainingCancelled(Exception):
+    """Raised from the trainer callbacks to stop training at a batch boundary"""
+
+
 class RetrainingPipeline:
     def __init__(self, model_path='models/yolov8n-seg_trained.pt'):
         self.model_path = model_path
         self.training_history = []
         self.is_training = False
+        self._cancel = threading.Event()
     
     def prepare_training_data(self):
-        """Prepare data from labeled_data folder"""
+        """
+        Build the dataset version to train on from the validated labels
+        
+        Only labels whose image or masks changed since the previous build are
+        converted; the result is an immutable snapshot under training_data/versions.
+        
+        Returns:
+            Build result (version, data_yaml, sample counts) or None on error
+        """
         try:
-            labeled_data_dir = Path('labeled_data/labels')
-            training_images_dir = Path('training_data/images')
-            training_labels_dir = Path('training_data/labels')
+            dataset = self._dataset_builder().build()
             
-            # Create directories
-            training_images_dir.mkdir(parents=True, exist_ok=True)
-            training_labels_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Prepare data.yaml for YOLO
-            data_yaml = {
-                'path': str(Path('training_data').absolute()),
-                'train': 'images/train',
-                'val': 'images/val',
-                'nc': 2,
-                'names': {0: 'chip', 1: 'hole'}
-            }
-            
-            with open('training_data/data.yaml', 'w') as f:
-                import yaml
-                yaml.dump(data_yaml, f)
-            
-            logger.info("Training data prepared")
-            return True
+            logger.info(f"Training data prepared: {dataset['version']} ({dataset['samples']} validated samples)")
+            return dataset
         
         except Exception as e:
             logger.error(f"Data preparation error: {str(e)}")
-            return False
+            return None
+    
+    @staticmethod
+    def _dataset_builder():
+        storage = get_storage_manager()
+        return DatasetBuilder(storage.label_store, root='training_data', image_dirs=['uploads'])
     
-    def retrain(self, num_epochs=10, learning_rate=0.001, progress_callback=None):
+    def retrain(self, num_epochs=10, learning_rate=0.001, progress_callback=None, batch_size=4,
+                mode='full', fine_tune=None, distill=None):
         """
         Retrain YOLO model
+        
+        progress_callback(epoch, total_epochs, telemetry) is called from the
+        trainer at the end of every epoch (losses) and again once the epoch
+        is validated (metrics). Raises TrainingCancelled if cancel() was
+        called; the trainer then stops at the next batch.
+        
+        mode='finetune' trains with the backbone frozen on the labels added
+        since the serving model's dataset plus a stratified replay sample,
+        for as many epochs as fit in the time budget; num_epochs and
+        learning_rate are then taken from fine_tune, which overrides
+        config.FINE_TUNE_CONFIG. The candidate is evaluated against the
+        serving model and only deployed without a mAP regression.
+        
+        mode='distill' trains the serving nano model (the student) on the
+        dataset plus the unlabeled images, pseudo-labeled by a larger
+        teacher whose predictions are cached on disk; distill overrides
+        config.DISTILLATION_CONFIG. The student is evaluated against the
+        serving model and the teacher (accuracy and CPU latency) and
+        deployed under the same regression gate.
         """
+        model = None
         try:
+            self._cancel.clear()
             self.is_training = True
+            if mode not in ('full', 'finetune', 'distill'):
+                raise ValueError(f"Unknown training mode: {mode}")
+            
+            # Validated labels since the last retrain, on top of the base set
+            dataset = self.prepare_training_data()
+            data_yaml = dataset['data_yaml'] if dataset else 'data.yaml'
+            train_args = {'epochs': num_epochs, 'lr0': learning_rate, 'imgsz': 320, 'patience': 5}
+            plan = None
+            if mode == 'finetune':
+                if dataset is None:
+                    raise RuntimeError("Fine-tuning needs the validated label dataset")
+                plan = self._plan_fine_tune(dataset, fine_tune)
+                data_yaml = plan['data_yaml']
+                train_args = {
+                    'epochs': plan['epochs'],
+                    'lr0': plan['learning_rate'],
+                    'imgsz': plan['imgsz'],
+                    'freeze': plan['freeze'],
+                    'warmup_epochs': 0,
+                    'patience': plan['epochs'],
+                }
+                if plan['time_hours']:
+                    train_args['time'] = plan['time_hours']
+            elif mode == 'distill':
+                if dataset is None:
+                    raise RuntimeError("Distillation needs the validated label dataset")
+                plan = self._plan_distillation(dataset, distill)
+                data_yaml = plan['data_yaml']
+                train_args = {
+                    'epochs': plan['epochs'],
+                    'lr0': plan['learning_rate'],
+                    'imgsz': plan['imgsz'],
+                    'patience': 5,
+                }
+            train_args.update(self._loader_args(dataset, mode))
+            if self._cancel.is_set():
+                raise TrainingCancelled()
             
             # Load base model
             model = YOLO(self.model_path)
+            # A time-limited run is stopped by ultralytics itself
+            time_budget = plan.get('time_budget_seconds') if plan and not plan.get('time_hours') else None
+            self._add_callbacks(model, progress_callback, time_budget, plan)
             
-            logger.info(f"Starting retraining: {num_epochs} epochs, lr={learning_rate}")
+            logger.info(f"Starting retraining ({mode}): {train_args}")
             
             # Fine-tune
             results = model.train(
-                data='data.yaml',
-                epochs=num_epochs,
-                lr0=learning_rate,
+                data=data_yaml,
                 device='cpu',
-                imgsz=320,
-                batch=4,
-                patience=5,
+                batch=batch_size,
                 save=True,
-                verbose=False
+                verbose=False,
+                **train_args
             )
             
-            # Update progress
-            if progress_callback:
-                for i in range(num_epochs):
-                    progress_callback(i + 1, num_epochs)
-            
             # Save new model
             new_model_path = f"models/yolov8n-seg_retrained_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pt"
             model.save(new_model_path)
+            artifact_index.record_write(new_model_path)
+            
+            evaluation = None
+            if plan:
+                if mode == 'finetune':
+                    plan['seconds_per_image'] = self._record_throughput(plan)
+                evaluation = self.evaluate(new_model_path, data_yaml, plan)
             
-            # Update main model
-            model.save(self.model_path)
+            # Register it and deploy it through the golden-set check; serving
+            # processes pick it up without a restart (never overwritten in place)
+            registry = get_model_registry()
+            version = registry.register(new_model_path, source='retrain' if mode == 'full' else mode, metadata={
+                'dataset_version': dataset['version'] if dataset else None,
+                'epochs': plan['epochs_run'] if plan else num_epochs,
+                'learning_rate': train_args['lr0'],
+                'mode': mode,
+                'teacher': plan['teacher'] if mode == 'distill' else None,
+            })
+            if evaluation and evaluation['regression']:
+                logger.warning(f"Model {version['version']} not deployed: mAP regression {evaluation['deltas']}")
+                deployment = {'status': 'skipped_regression'}
+            else:
+                deployment = registry.deploy(version['version'], background=False)
             
             # Record in history
             history_entry = {
                 'timestamp': datetime.now().isoformat(),
-                'epochs': num_epochs,
-                'learning_rate': learning_rate,
+                'mode': mode,
+                'epochs': plan['epochs_run'] if plan else num_epochs,
+                'learning_rate': train_args['lr0'],
+                'batch_size': batch_size,
                 'model_path': new_model_path,
+                'dataset_version': dataset['version'] if dataset else None,
+                'model_version': version['version'],
+                'deployment': deployment['status'],
                 'results': str(results)
             }
+            if mode == 'finetune':
+                history_entry['fine_tune'] = {k: plan[k] for k in (
+                    'freeze', 'new', 'replay', 'strata', 'since_version', 'time_budget_seconds',
+                    'train_seconds', 'seconds_per_image')}
+            elif mode == 'distill':
+                history_entry['distillation'] = {k: plan[k] for k in (
+                    'teacher', 'conf', 'unlabeled_images', 'pseudo_labeled', 'pseudo_objects',
+                    'teacher_predicted', 'teacher_cached', 'train_seconds')}
+            if plan:
+                history_entry['evaluation'] = evaluation
             self.training_history.append(history_entry)
             
             logger.info(f"Retraining completed: {new_model_path}")
-            self.is_training = False
             
             return history_entry
         
+        except TrainingCancelled:
+            logger.info("Retraining cancelled")
+            raise
+        
         except Exception as e:
+            # The trainer may wrap our exception; a cancelled run is still a cancel
+            if self._cancel.is_set():
+                logger.info(f"Retraining cancelled ({str(e)})")
+                raise TrainingCancelled() from e
             logger.error(f"Retraining error: {str(e)}")
-            self.is_training = False
             raise
+        
+        finally:
+            self.is_training = False
+            self._release(model)
+    
+    @staticmethod
+    def _loader_args(dataset, mode):
+        """Dataloader workers and the trainer reading images from the per-version cache"""
+        args = {'workers': TRAINING_CACHE['loader_workers']}
+        if TRAINING_CACHE['enabled']:
+            name = dataset['version'] if dataset else 'base'
+            if mode != 'full':
+                name += f'-{mode}'
+            args['trainer'] = cached_trainer(name, TRAINING_CACHE['root'], TRAINING_CACHE['keep'])
+        return args
+    
+    def _plan_fine_tune(self, dataset, overrides):
+        """
+        Build the fine-tune set and size the run to the time budget
+        
+        Epochs come from the seconds per image measured by previous
+        fine-tunes. Without a measurement the run is given the budget as
+        ultralytics' time limit, which re-plans the epochs (and rescales
+        the learning-rate schedule) from the duration of the first ones,
+        instead of cutting a 30-epoch schedule short while the rate is high.
+        """
+        options = dict(FINE_TUNE_CONFIG, **(overrides or {}))
+        registry = get_model_registry()
+        current = registry.describe()
+        since_version = None
+        for entry in current['versions']:
+            if entry['version'] == current['current']:
+                since_version = (entry.get('metadata') or {}).get('dataset_version')
+        
+        fine_tune_set = FineTuneSetBuilder(self._dataset_builder()).build(
+            dataset, since_version=since_version, replay_size=int(options['replay_size'])
+        )
+        
+        budget = float(options['time_budget_minutes']) * 60
+        min_epochs = int(options['min_epochs'])
+        epochs = max(min_epochs, int(options['max_epochs']))
+        seconds_per_image = self._load_throughput(options).get('seconds_per_image')
+        time_hours = None
+        if seconds_per_image:
+            fitting = int(budget / (seconds_per_image * fine_tune_set['images']))
+            epochs = max(min_epochs, min(epochs, fitting))
+        else:
+            time_hours = budget / 3600
+        
+        return dict(
+            fine_tune_set,
+            kind='finetune',
+            since_version=since_version,
+            epochs=epochs,
+            epochs_run=0,
+            train_seconds=0,
+            learning_rate=float(options['learning_rate']),
+            imgsz=int(options['imgsz']),
+            freeze=int(options['freeze']),
+            max_map_drop=float(options['max_map_drop']),
+            time_budget_seconds=budget,
+            time_hours=time_hours,
+            throughput_key=f"freeze{int(options['freeze'])}_imgsz{int(options['imgsz'])}",
+        )
+    
+    def _plan_distillation(self, dataset, overrides):
+        """
+        Build the distillation set from the cached teacher predictions
+        
+        The teacher only runs on images missing from its cache, so every
+        run after the first costs the student epochs alone.
+        """
+        options = dict(DISTILLATION_CONFIG, **(overrides or {}))
+        teacher = str(options['teacher'])
+        if not Path(teacher).exists():
+            raise RuntimeError(f"Teacher model not found: {teacher} (train it with distill_model.py --train-teacher)")
+        
+        teacher_cache = TeacherCache(options['cache_root'], teacher, options['teacher_imgsz'])
+        distill_set = DistillationSetBuilder(self._dataset_builder(), teacher_cache).build(
+            dataset, options['unlabeled_dirs'], conf=float(options['conf']), should_stop=self._cancel.is_set
+        )
+        
+        return dict(
+            distill_set,
+            kind='distill',
+            teacher=teacher,
+            teacher_imgsz=int(options['teacher_imgsz']),
+            conf=float(options['conf']),
+            epochs=int(options['epochs']),
+            epochs_run=0,
+            train_seconds=0,
+            learning_rate=float(options['learning_rate']),
+            imgsz=int(options['imgsz']),
+            max_map_drop=float(options['max_map_drop']),
+            latency_images=int(options['latency_images']),
+        )
+    
+    def _load_throughput(self, options):
+        """Seconds per training image of earlier fine-tunes with the same freeze/imgsz"""
+        key = f"freeze{int(options['freeze'])}_imgsz{int(options['imgsz'])}"
+        try:
+            with open(THROUGHPUT_PATH, 'r') as f:
+                return json.load(f).get(key, {})
+        except (OSError, ValueError):
+            return {}
+    
+    def _record_throughput(self, plan):
+        """Remember the measured seconds per image (epoch time / images) for the next plan"""
+        if not plan.get('epochs_run'):
+            return None
+        seconds_per_image = plan['train_seconds'] / plan['epochs_run'] / plan['images']
+        try:
+            with open(THROUGHPUT_PATH, 'r') as f:
+                throughput = json.load(f)
+        except (OSError, ValueError):
+            throughput = {}
+        throughput[plan['throughput_key']] = {
+            'seconds_per_image': round(seconds_per_image, 5),
+            'updated': datetime.now().isoformat(),
+        }
+        THROUGHPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = THROUGHPUT_PATH.with_suffix(f'.json.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(throughput, f, indent=2)
+        os.replace(tmp_path, THROUGHPUT_PATH)
+        return round(seconds_per_image, 5)
+    
+    def evaluate(self, candidate_path, data_yaml, plan):
+        """
+        Validate the candidate and the serving model on the same val split
+        
+        A regression is a mAP50-95 drop (boxes or masks) larger than
+        max_map_drop. A distillation plan also validates the teacher and
+        measures the CPU latency of the three models, for the accuracy and
+        latency trade-off. The report is written to reports/<kind>_<time>.json.
+        
+        Returns:
+            The report (metrics of the models, deltas, regression flag)
+        """
+        models = {'baseline': (self.model_path, plan['imgsz']), 'candidate': (candidate_path, plan['imgsz'])}
+        if plan.get('teacher'):
+            models['teacher'] = (plan['teacher'], plan['teacher_imgsz'])
+        
+        metrics = {}
+        for name, (path, imgsz) in models.items():
+            model = YOLO(path)
+            try:
+                results = model.val(data=data_yaml, imgsz=imgsz, device='cpu',
+                                    plots=False, verbose=False)
+                values = getattr(results, 'results_dict', {}) or {}
+                metrics[name] = {k: round(float(values[k]), 5) for k in EVAL_METRICS if k in values}
+            finally:
+                self._release(model)
+        
+        deltas = {
+            k: round(metrics['candidate'][k] - metrics['baseline'][k], 5)
+            for k in metrics['candidate'] if k in metrics['baseline']
+        }
+        regression = any(
+            deltas.get(k, 0) < -plan['max_map_drop']
+            for k in ('metrics/mAP50-95(B)', 'metrics/mAP50-95(M)')
+        )
+        report = {
+            'timestamp': datetime.now().isoformat(),
+            'candidate': candidate_path,
+            'baseline': self.model_path,
+            'data_yaml': data_yaml,
+            'metrics': metrics,
+            'deltas': deltas,
+            'max_map_drop': plan['max_map_drop'],
+            'regression': regression,
+            'train_seconds': plan['train_seconds'],
+            'epochs': plan['epochs_run'],
+        }
+        if plan['kind'] == 'finetune':
+            report['images'] = {'new': plan['new'], 'replay': plan['replay'], 'strata': plan['strata']}
+        else:
+            report['pseudo_labels'] = {k: plan[k] for k in (
+                'conf', 'unlabeled_images', 'pseudo_labeled', 'pseudo_objects', 'teacher_predicted', 'teacher_cached')}
+            report['tradeoff'] = self._tradeoff(models, metrics, data_yaml, plan['latency_images'])
+        
+        reports_dir = Path('reports')
+        reports_dir.mkdir(exist_ok=True)
+        report_path = reports_dir / f"{plan['kind']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        report['report_path'] = str(report_path)
+        
+        logger.info(f"{plan['kind']} evaluation: {deltas} (regression={regression})")
+        return report
+    
+    @staticmethod
+    def _tradeoff(models, metrics, data_yaml, latency_images):
+        """
+        mAP50-95 and median CPU latency of teacher, serving model and student
+        
+        gap_closed is the share of the teacher/serving model mask mAP gap
+        the student recovered; speedup is the teacher latency over the student's.
+        """
+        images = training_images(data_yaml, 'val')[:latency_images]
+        rows = {}
+        for name, label in {'teacher': 'teacher', 'baseline': 'baseline', 'candidate': 'student'}.items():
+            path, imgsz = models[name]
+            rows[label] = {
+                'weights': path,
+                'imgsz': imgsz,
+                'mAP50-95(B)': metrics[name].get('metrics/mAP50-95(B)'),
+                'mAP50-95(M)': metrics[name].get('metrics/mAP50-95(M)'),
+                'latency_ms': measure_latency(path, images, imgsz),
+            }
+        
+        teacher, baseline, student = rows['teacher'], rows['baseline'], rows['student']
+        gap_closed = speedup = None
+        if None not in (teacher['mAP50-95(M)'], baseline['mAP50-95(M)'], student['mAP50-95(M)']):
+            gap = teacher['mAP50-95(M)'] - baseline['mAP50-95(M)']
+            if gap > 0:
+                gap_closed = round((student['mAP50-95(M)'] - baseline['mAP50-95(M)']) / gap, 3)
+        if teacher['latency_ms'] and student['latency_ms']:
+            speedup = round(teacher['latency_ms'] / student['latency_ms'], 2)
+        return {'models': rows, 'gap_closed': gap_closed, 'speedup': speedup}
+    
+    def _add_callbacks(self, model, progress_callback, time_budget=None, plan=None):
+        """
+        Report real epoch telemetry and check for cancellation at every batch
+        
+        With a time budget (seconds) the run stops after the last epoch
+        that is expected to end within it.
+        """
+        clock = {'started': time.time()}
+        
+        def on_train_start(trainer):
+            clock['started'] = time.time()
+            if progress_callback:
+                progress_callback(0, trainer.epochs, {'phase': 'training'})
+        
+        def check_budget(trainer):
+            elapsed = time.time() - clock['started']
+            epochs_done = trainer.epoch + 1
+            if plan is not None:
+                plan['epochs_run'] = epochs_done
+                plan['train_seconds'] = round(elapsed, 1)
+            if time_budget and elapsed + elapsed / epochs_done > time_budget and epochs_done < trainer.epochs:
+                logger.info(f"Time budget reached after {epochs_done} epochs ({elapsed:.0f}s)")
+                trainer.stop = True
+        
+        def check_cancel(trainer):
+            if self._cancel.is_set():
+                trainer.stop = True
+                raise TrainingCancelled()
+        
+        def report(phase):
+            def callback(trainer):
+                if progress_callback:
+                    progress_callback(
+                        trainer.epoch + 1, trainer.epochs,
+                        self._telemetry(trainer, clock['started'], phase)
+                    )
+            return callback
+        
+        model.add_callback('on_train_start', on_train_start)
+        model.add_callback('on_train_batch_start', check_cancel)
+        model.add_callback('on_val_batch_start', check_cancel)
+        model.add_callback('on_train_epoch_end', report('validating'))
+        model.add_callback('on_fit_epoch_end', report('validated'))
+        model.add_callback('on_fit_epoch_end', check_budget)
+    
+    @staticmethod
+    def _telemetry(trainer, started, phase):
+        """Losses, validation metrics, learning rates and ETA of the current epoch"""
+        epoch = trainer.epoch + 1
+        elapsed = time.time() - started
+        
+        losses = {}
+        if getattr(trainer, 'tloss', None) is not None:
+            losses = trainer.label_loss_items(trainer.tloss, prefix='train')
+        
+        telemetry = {
+            'phase': phase,
+            'losses': {k: round(float(v), 5) for k, v in losses.items()},
+            'lr': {k: float(v) for k, v in (getattr(trainer, 'lr', None) or {}).items()},
+            'elapsed_seconds': round(elapsed, 1),
+            'eta_seconds': round(elapsed / epoch * (trainer.epochs - epoch), 1),
+        }
+        # Validation metrics only exist once the epoch has been validated
+        if phase == 'validated':
+            telemetry['metrics'] = {k: round(float(v), 5) for k, v in (trainer.metrics or {}).items()}
+        return telemetry
+    
+    @staticmethod
+    def _release(model):
+        """Drop the trainer, its dataloader workers and cached tensors"""
+        if model is None:
+            return
+        trainer = getattr(model, 'trainer', None)
+        if trainer is not None:
+            for loader in (getattr(trainer, 'train_loader', None), getattr(trainer, 'test_loader', None)):
+                shutdown = getattr(getattr(loader, 'iterator', None), '_shutdown_workers', None)
+                if shutdown:
+                    shutdown()
+            model.trainer = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
     
     def cancel(self):
-        """Cancel ongoing training"""
-        self.is_training = False
-        logger.info("Training cancelled")
+        """Ask the running training to stop at its next batch"""
+        self._cancel.set()
+        logger.info("Training cancellation requested")
     
     def get_history(self):
         """Get training history"""
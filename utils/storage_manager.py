@@ -3,75 +3,224 @@ Storage Manager
 Handles labeled data and predictions storage
 """
 
+import atexit
 import json
 import os
+import threading
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 import logging
 
+from utils.artifact_index import artifact_index
+from utils.label_store import SQLiteLabelStore
+from utils.prediction_ledger import PredictionLedger
+from utils.prediction_stats import (
+    MetricDistributions, PredictionAnalytics, RunningAggregates, ShiftDistributions, TimeIndex, TimeRollups,
+    inclusive_until
+)
+from utils.columnar_cache import ColumnarPredictionCache
+from utils.event_bus import event_bus
+from utils.group_commit import GroupCommitWriter
+
 logger = logging.getLogger(__name__)
 
+# Records from concurrent writers can land in the ledger slightly out of
+# timestamp order (at most one group-commit interval); range scans read
+# this far past the upper bound before stopping.
+ORDER_SLACK = timedelta(seconds=60)
+
 class StorageManager:
     def __init__(self, base_path='labeled_data'):
         self.base_path = Path(base_path)
         self.base_path.mkdir(exist_ok=True)
+        # Legacy JSONL predictions (read-only), new predictions go to the ledger
         self.predictions_file = self.base_path / 'predictions.jsonl'
+        self.ledger = PredictionLedger(self.base_path / 'predictions.ledger')
+        self.ledger.add_commit_listener(
+            lambda records, offset: artifact_index.record_write(self.ledger.path)
+        )
+        # Views kept current from the ledger (served without rescanning history)
+        self.analytics = PredictionAnalytics(
+            self.ledger,
+            snapshot_path=self.base_path / 'predictions_stats.json',
+            aggregators={
+                'totals': RunningAggregates(),
+                'rollups': TimeRollups(),
+                'time_index': TimeIndex(),
+                'distributions': ShiftDistributions()
+            },
+            legacy_file=self.predictions_file
+        )
+        # Column-oriented copy of the predictions (Parquet export, vectorized queries)
+        self.columns = ColumnarPredictionCache(
+            self.ledger,
+            directory=self.base_path / 'columnar',
+            legacy_file=self.predictions_file
+        )
+        # Registered last, so the views above are current when the event goes out
+        self.ledger.add_commit_listener(self._publish_predictions)
+        atexit.register(self.close)
+        # Legacy one-JSON-file-per-label directory, migrated once into SQLite
         self.labels_dir = self.base_path / 'labels'
-        self.labels_dir.mkdir(exist_ok=True)
+        self.labels_db = self.base_path / 'labels.db'
+        self.label_store = SQLiteLabelStore(self.labels_db)
+        self.label_store.migrate_from_json(self.labels_dir)
+        # Concurrent label saves are inserted together, one transaction per
+        # group (SQLite serializes the worker processes itself)
+        self.label_writer = GroupCommitWriter(self._commit_labels, name='label-writer')
+    
+    def close(self):
+        """Commit queued predictions and labels and persist the analytics snapshot"""
+        self.label_writer.close()
+        self.ledger.close()
+        self.analytics.refresh()
+        self.analytics.save_snapshot()
+    
+    def _publish_predictions(self, records, end_offset):
+        """Push the new running summary to the event stream after each committed group"""
+        event_bus.publish('predictions', {
+            'committed': len(records),
+            'summary': self.analytics.aggregators['totals'].summary(),
+            'latest': records[-1]
+        })
+    
+    def get_prediction_summary(self, since=None, until=None):
+        """
+        Summary statistics of the predictions in [since, until]
+        
+        Without bounds this is the running totals. With bounds, whole days
+        and hours come from the rollups and only the records at the edges
+        of the range are read from the ledger.
+        """
+        until = inclusive_until(until)
+        self.analytics.refresh()
+        if not since and not until:
+            return self.analytics.aggregators['totals'].summary()
+        
+        rollups = self.analytics.aggregators['rollups']
+        aggregates, days, hours, first_start, last_end = rollups.covered(since, until)
+        
+        if first_start is None:
+            windows = [(since, until)]
+        else:
+            windows = [(since, first_start), (last_end, until)]
+        
+        for window_since, window_until in windows:
+            for prediction in self.iter_predictions(since=window_since, until=window_until):
+                timestamp = prediction.get('timestamp', '')
+                if timestamp[:10] in days or timestamp[:13] in hours:
+                    continue
+                if (since and timestamp < since) or (until and timestamp > until):
+                    continue
+                aggregates.add(prediction)
+        
+        return aggregates.summary()
+    
+    def get_prediction_trend(self, granularity='day', since=None, until=None):
+        """Per-day or per-hour rollup rows overlapping [since, until]"""
+        self.analytics.refresh()
+        return self.analytics.aggregators['rollups'].rows(granularity, since, inclusive_until(until))
+    
+    def get_prediction_distribution(self, since=None, until=None, shift=None,
+                                    quantiles=(0.5, 0.95, 0.99), histograms=True):
+        """
+        Quantiles and histograms of void rate, chip area and hole count
+        
+        Answered by merging the per-shift sketches of the shifts whose day
+        lies in [since, until]; without bounds or shift filter the all-time
+        distributions are used.
+        
+        Returns:
+            dict with 'overall', 'by_shift' (merged per shift name) and
+            'shifts' (one row per day and shift)
+        """
+        self.analytics.refresh()
+        distributions = self.analytics.aggregators['distributions']
+        
+        rows = []
+        by_shift = {}
+        for day, name, bucket in distributions.select(since, until, shift):
+            rows.append({'day': day, 'shift': name, **bucket.describe(quantiles, histograms=False)})
+            by_shift.setdefault(name, MetricDistributions(distributions.shift_k)).merge(bucket)
+        
+        if since or until or shift:
+            overall = MetricDistributions()
+            for merged in by_shift.values():
+                overall.merge(merged)
+        else:
+            overall = distributions.overall
+        
+        return {
+            'overall': overall.describe(quantiles, histograms),
+            'by_shift': {name: merged.describe(quantiles, histograms=False) for name, merged in by_shift.items()},
+            'shifts': rows,
+        }
     
     def save_labels(self, image_id, masks, timestamp):
         """Save labeled data"""
         try:
-            label_id = str(uuid.uuid4())
-            
-            label_data = {
-                'label_id': label_id,
-                'image_id': image_id,
-                'masks': masks,
-                'timestamp': timestamp
-            }
-            
-            # Save to file
-            label_file = self.labels_dir / f"{label_id}.json"
-            with open(label_file, 'w') as f:
-                json.dump(label_data, f, indent=2)
+            return self.save_labels_batch([
+                {'image_id': image_id, 'masks': masks, 'timestamp': timestamp}
+            ])[0]
+        
+        except Exception as e:
+            logger.error(f"Save labels error: {str(e)}")
+            raise
+    
+    def save_labels_batch(self, items):
+        """Save several labels in one transaction, returns their label ids"""
+        try:
+            labels = [
+                {
+                    'label_id': str(uuid.uuid4()),
+                    'image_id': item.get('image_id'),
+                    'masks': item.get('masks', []),
+                    'timestamp': item.get('timestamp') or datetime.now().isoformat()
+                }
+                for item in items
+            ]
+            label_ids = self.label_writer.write(labels)
             
-            logger.info(f"Labels saved: {label_id}")
-            return label_id
+            logger.info(f"Labels saved: {len(labels)}")
+            return label_ids
         
         except Exception as e:
             logger.error(f"Save labels error: {str(e)}")
             raise
     
+    def _commit_labels(self, labels):
+        """Writer thread: insert a group of labels in one transaction"""
+        self.label_store.insert_many(labels)
+        artifact_index.record_write(self.labels_db)
+        return [label['label_id'] for label in labels]
+    
     def get_all_labels(self):
         """Get all labeled data"""
         try:
-            labels = []
-            for label_file in self.labels_dir.glob('*.json'):
-                with open(label_file, 'r') as f:
-                    labels.append(json.load(f))
-            return labels
+            return list(self.label_store.iter_all())
         
         except Exception as e:
             logger.error(f"Get labels error: {str(e)}")
             return []
     
+    def list_labels(self, cursor=None, limit=100, image_id=None, since=None, until=None):
+        """Get one page of labels (newest first) and the cursor of the next page"""
+        return self.label_store.query(
+            cursor=cursor, limit=limit, image_id=image_id, since=since, until=inclusive_until(until)
+        )
+    
     def get_label(self, label_id):
         """Get specific label"""
         try:
-            label_file = self.labels_dir / f"{label_id}.json"
-            if label_file.exists():
-                with open(label_file, 'r') as f:
-                    return json.load(f)
-            return None
+            return self.label_store.get(label_id)
         
         except Exception as e:
             logger.error(f"Get label error: {str(e)}")
             return None
     
-    def save_prediction(self, image_id, void_rate, chip_area, holes_area, confidence):
-        """Save prediction result"""
+    def save_prediction(self, image_id, void_rate, chip_area, holes_area, confidence, **extra):
+        """Queue a prediction result for the write-behind ledger"""
         try:
             prediction = {
                 'image_id': image_id,
@@ -79,29 +228,81 @@ class StorageManager:
                 'chip_area': chip_area,
                 'holes_area': holes_area,
                 'confidence': confidence,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': datetime.now().isoformat(),
+                **extra
             }
             
-            # Append to JSONL file
-            with open(self.predictions_file, 'a') as f:
-                f.write(json.dumps(prediction) + '\n')
-            
-            logger.info(f"Prediction saved: {image_id}")
+            self.ledger.append(prediction)
+            logger.info(f"Prediction queued: {image_id}")
         
         except Exception as e:
             logger.error(f"Save prediction error: {str(e)}")
     
+    def iter_predictions(self, since=None, until=None):
+        """
+        Iterate over predictions, oldest first, one record at a time
+        
+        Args:
+            since / until: optional ISO timestamp bounds (inclusive; a date-only
+                until covers that whole day)
+        """
+        until = inclusive_until(until)
+        # Legacy JSONL file written before the ledger existed
+        if self.predictions_file.exists():
+            with open(self.predictions_file, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        prediction = json.loads(line)
+                        if self._in_range(prediction, since, until):
+                            yield prediction
+        
+        # Ledger: seek with the time index, stop once safely past the upper bound
+        start = self.analytics.aggregators['time_index'].seek(since) if since else 0
+        stop_after = None
+        if until:
+            try:
+                stop_after = (datetime.fromisoformat(until) + ORDER_SLACK).isoformat()
+            except ValueError:
+                stop_after = None
+        
+        for _, prediction in self.ledger.read(start=start):
+            if stop_after and prediction.get('timestamp', '') > stop_after:
+                break
+            if self._in_range(prediction, since, until):
+                yield prediction
+    
+    @staticmethod
+    def _in_range(prediction, since, until):
+        timestamp = prediction.get('timestamp', '')
+        if since and timestamp < since:
+            return False
+        if until and timestamp > until:
+            return False
+        return True
+    
     def get_all_predictions(self):
         """Get all predictions"""
         try:
-            predictions = []
-            if self.predictions_file.exists():
-                with open(self.predictions_file, 'r') as f:
-                    for line in f:
-                        if line.strip():
-                            predictions.append(json.loads(line))
-            return predictions
+            return list(self.iter_predictions())
         
         except Exception as e:
             logger.error(f"Get predictions error: {str(e)}")
             return []
+
+
+_shared_storage = None
+_shared_lock = threading.Lock()
+
+
+def get_storage_manager():
+    """
+    Process-wide StorageManager
+
+    The prediction ledger has a single background writer per file, so all
+    routes must share one instance instead of creating their own.
+    """
+    global _shared_storage
+    with _shared_lock:
+        if _shared_storage is None:
+            _shared_storage = StorageManager()
+        return _shared_storage
@@ -0,0 +1,311 @@
+"""
+Training Jobs
+Persisted retraining jobs, run in a separate resource-limited process
+"""
+
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL,
+    pid INTEGER,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+"""
+
+ACTIVE_STATUSES = ('queued', 'training', 'cancelling')
+
+# Project root, working directory of the training process
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def idle_state():
+    """Training status reported when no job ever ran"""
+    return {
+        'job_id': None,
+        'is_training': False,
+        'progress': 0,
+        'status': 'idle',
+        'started_at': None,
+        'current_epoch': 0,
+        'total_epochs': 0,
+        'phase': None,
+        'losses': {},
+        'metrics': {},
+        'lr': {},
+        'elapsed_seconds': 0,
+        'eta_seconds': None,
+        'logs': [],
+    }
+
+
+class TrainingJobStore:
+    """
+    Training jobs in a small SQLite database shared by every worker process
+
+    The training process writes its status into the job row; any Flask
+    worker reads it from there, so the status no longer depends on which
+    process started the job.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_dict(row):
+        return {
+            'job_id': row['job_id'],
+            'status': row['status'],
+            'params': json.loads(row['params']),
+            'state': json.loads(row['state']),
+            'pid': row['pid'],
+            'cancel_requested': bool(row['cancel_requested']),
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+
+    def create(self, params):
+        """
+        Queue a new job
+
+        Returns:
+            The job, or None if another job is still active
+        """
+        job_id = uuid.uuid4().hex
+        state = idle_state()
+        state.update({
+            'job_id': job_id,
+            'is_training': True,
+            'status': 'queued',
+            'total_epochs': params.get('num_epochs', 0),
+        })
+        conn = self._connection()
+        with conn:
+            # BEGIN IMMEDIATE: the active check and the insert are atomic across processes
+            conn.execute('BEGIN IMMEDIATE')
+            placeholders = ','.join('?' * len(ACTIVE_STATUSES))
+            active = conn.execute(
+                f'SELECT 1 FROM jobs WHERE status IN ({placeholders}) LIMIT 1', ACTIVE_STATUSES
+            ).fetchone()
+            if active:
+                return None
+            conn.execute(
+                'INSERT INTO jobs (job_id, status, params, state, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, 'queued', json.dumps(params), json.dumps(state), datetime.now().isoformat(), time.time())
+            )
+        return self.get(job_id)
+
+    def update(self, job_id, state=None, pid=None):
+        """Store the job's status dict (its 'status' key becomes the job status) and/or pid"""
+        sets, params = ['updated_at = ?'], [time.time()]
+        if state is not None:
+            sets += ['state = ?', 'status = ?']
+            params += [json.dumps(state), state['status']]
+        if pid is not None:
+            sets.append('pid = ?')
+            params.append(pid)
+        conn = self._connection()
+        with conn:
+            conn.execute(f"UPDATE jobs SET {', '.join(sets)} WHERE job_id = ?", params + [job_id])
+
+    def request_cancel(self, job_id):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE job_id = ?', (time.time(), job_id)
+            )
+
+    def cancel_requested(self, job_id):
+        row = self._connection().execute(
+            'SELECT cancel_requested FROM jobs WHERE job_id = ?', (job_id,)
+        ).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def get(self, job_id):
+        row = self._connection().execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def latest(self):
+        """Most recently created job (None if none ever ran)"""
+        row = self._connection().execute('SELECT * FROM jobs ORDER BY seq DESC LIMIT 1').fetchone()
+        return self._to_dict(row) if row else None
+
+    def active(self):
+        placeholders = ','.join('?' * len(ACTIVE_STATUSES))
+        rows = self._connection().execute(
+            f'SELECT * FROM jobs WHERE status IN ({placeholders}) ORDER BY seq', ACTIVE_STATUSES
+        ).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    def history(self, limit=50):
+        """Finished jobs, newest first"""
+        placeholders = ','.join('?' * len(ACTIVE_STATUSES))
+        rows = self._connection().execute(
+            f'SELECT * FROM jobs WHERE status NOT IN ({placeholders}) ORDER BY seq DESC LIMIT ?',
+            ACTIVE_STATUSES + (limit,)
+        ).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    def version(self):
+        """(latest job sequence, its last update) - changes on every status write"""
+        row = self._connection().execute(
+            'SELECT seq, updated_at FROM jobs ORDER BY seq DESC LIMIT 1'
+        ).fetchone()
+        return (row['seq'], row['updated_at']) if row else (0, 0)
+
+
+def resolve_resources(resources):
+    """
+    CPU set, thread count and nice level of the training process
+
+    With cpus=None the training gets every available CPU except the first
+    reserved_inference_cpus (as long as one is left); threads defaults to
+    one per CPU granted.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        available = sorted(os.sched_getaffinity(0))
+    else:
+        available = list(range(os.cpu_count() or 1))
+
+    cpus = resources.get('cpus')
+    if cpus is None:
+        reserved = resources.get('reserved_inference_cpus', 0)
+        cpus = available[reserved:] if len(available) > reserved else available
+    else:
+        cpus = [cpu for cpu in cpus if cpu in available] or available
+
+    threads = resources.get('threads') or len(cpus)
+    return {'cpus': cpus, 'threads': int(threads), 'nice': int(resources.get('nice', 0))}
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class TrainingLauncher:
+    """Starts jobs in `python -m utils.training_worker` and tracks them through the store"""
+
+    def __init__(self, store, resources):
+        self.store = store
+        self.resources = resources
+
+    def start(self, params):
+        """
+        Launch a training process
+
+        Returns:
+            The job, or None if another job is active
+        """
+        self.reconcile()
+        job = self.store.create(params)
+        if job is None:
+            return None
+
+        limits = resolve_resources(self.resources)
+        env = os.environ.copy()
+        # Read by the math libraries when they load, before torch is imported
+        for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+            env[name] = str(limits['threads'])
+
+        command = [
+            sys.executable, '-m', 'utils.training_worker',
+            '--job-id', job['job_id'],
+            '--db', str(self.store.db_path.resolve()),
+            '--threads', str(limits['threads']),
+            '--cpus', ','.join(str(cpu) for cpu in limits['cpus']),
+            '--nice', str(limits['nice']),
+        ]
+        try:
+            process = subprocess.Popen(command, cwd=str(PROJECT_DIR), env=env)
+        except OSError as e:
+            state = dict(job['state'], status='error', is_training=False,
+                         logs=[{'type': 'error', 'message': f"Could not start training process: {e}"}])
+            self.store.update(job['job_id'], state=state)
+            raise
+
+        self.store.update(job['job_id'], pid=process.pid)
+        threading.Thread(
+            target=self._reap, args=(process, job['job_id']), name='training-reaper', daemon=True
+        ).start()
+        logger.info(f"Training job {job['job_id']} started in process {process.pid} with {limits}")
+        return self.store.get(job['job_id'])
+
+    def _reap(self, process, job_id):
+        """Wait for the process and fail the job if it died without reporting"""
+        code = process.wait()
+        job = self.store.get(job_id)
+        if job and job['status'] in ACTIVE_STATUSES:
+            self._fail(job, f"Training process exited with code {code}")
+
+    def _fail(self, job, message):
+        state = dict(job['state'], status='error', is_training=False, eta_seconds=None)
+        state['logs'] = state.get('logs', []) + [{'type': 'error', 'message': message}]
+        self.store.update(job['job_id'], state=state)
+        logger.error(f"Training job {job['job_id']}: {message}")
+
+    def cancel(self, job_id):
+        """Ask the job to stop; the training process stops at its next batch"""
+        job = self.store.get(job_id)
+        if job is None or job['status'] not in ACTIVE_STATUSES:
+            return False
+        self.store.request_cancel(job_id)
+
+        state = dict(job['state'], status='cancelling')
+        state['logs'] = state.get('logs', []) + [
+            {'type': 'info', 'message': 'Cancellation requested, stopping at the next batch'}
+        ]
+        self.store.update(job_id, state=state)
+        if job['pid'] and _alive(job['pid']):
+            try:
+                os.kill(job['pid'], signal.SIGTERM)
+            except OSError as e:
+                logger.warning(f"Could not signal training process {job['pid']}: {e}")
+        return True
+
+    def reconcile(self):
+        """Fail active jobs whose process is gone (e.g. the node restarted)"""
+        for job in self.store.active():
+            if job['pid'] and not _alive(job['pid']):
+                self._fail(job, 'Training process is no longer running')
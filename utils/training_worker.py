@@ -0,0 +1,159 @@
+"""
+Training Worker
+Entry point of the retraining process: python -m utils.training_worker --job-id ... --db ...
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Log lines kept in the training status
+MAX_LOGS = 50
+# Seconds between two checks of the job's cancel flag
+CANCEL_POLL_INTERVAL = 1.0
+
+
+def apply_limits(threads, cpus, nice):
+    """Lower the priority, pin the CPUs and cap the torch threads of this process"""
+    if nice:
+        os.nice(nice)
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+
+class JobReporter:
+    """Writes the training status of one job into the job store"""
+
+    def __init__(self, store, job_id, total_epochs):
+        self.store = store
+        self.job_id = job_id
+        self.cancelling = False
+        self.state = dict(store.get(job_id)['state'])
+        self.state.update({
+            'status': 'training',
+            'is_training': True,
+            'started_at': datetime.now().isoformat(),
+            'total_epochs': total_epochs,
+            'phase': 'preparing',
+            'logs': [],
+        })
+
+    def log(self, message, log_type='info'):
+        self.state['logs'] = (self.state['logs'] + [{'type': log_type, 'message': message}])[-MAX_LOGS:]
+
+    def write(self, **changes):
+        self.state.update(changes)
+        if self.cancelling and self.state['status'] == 'training':
+            self.state['status'] = 'cancelling'
+        self.store.update(self.job_id, state=self.state)
+
+    def progress(self, epoch, total_epochs, telemetry=None):
+        """progress_callback of RetrainingPipeline.retrain"""
+        changes = {
+            'current_epoch': epoch,
+            'total_epochs': total_epochs,
+            'progress': int((epoch / total_epochs) * 100),
+        }
+        if telemetry:
+            changes.update(telemetry)
+            if telemetry['phase'] == 'validated':
+                losses = ', '.join(f"{k.split('/')[-1]}={v:.4f}" for k, v in telemetry['losses'].items())
+                self.log(f"Epoch {epoch}/{total_epochs}: {losses}")
+        self.write(**changes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run one retraining job')
+    parser.add_argument('--job-id', required=True)
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--cpus', default='')
+    parser.add_argument('--nice', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [training] %(levelname)s %(message)s')
+
+    cpus = [int(cpu) for cpu in args.cpus.split(',') if cpu]
+    apply_limits(args.threads, cpus, args.nice)
+
+    from utils.training_jobs import TrainingJobStore
+    from utils.retrain_pipeline import RetrainingPipeline, TrainingCancelled
+
+    store = TrainingJobStore(args.db)
+    job = store.get(args.job_id)
+    if job is None:
+        logger.error(f"Unknown training job {args.job_id}")
+        return 1
+
+    params = job['params']
+    reporter = JobReporter(store, args.job_id, params['num_epochs'])
+    reporter.log(
+        f"Training started ({params.get('mode', 'full')}): {params['num_epochs']} epochs, lr={params['learning_rate']} "
+        f"(pid {os.getpid()}, {args.threads} threads, cpus {args.cpus or 'all'}, nice {args.nice})"
+    )
+    reporter.write()
+
+    pipeline = RetrainingPipeline()
+    finished = threading.Event()
+
+    def request_cancel(*_):
+        if not reporter.cancelling:
+            reporter.cancelling = True
+            pipeline.cancel()
+
+    def watch_cancel():
+        while not finished.wait(CANCEL_POLL_INTERVAL):
+            if store.cancel_requested(args.job_id):
+                request_cancel()
+                return
+
+    signal.signal(signal.SIGTERM, request_cancel)
+    threading.Thread(target=watch_cancel, name='cancel-watch', daemon=True).start()
+
+    try:
+        result = pipeline.retrain(
+            num_epochs=params['num_epochs'],
+            learning_rate=params['learning_rate'],
+            batch_size=params.get('batch_size', 4),
+            progress_callback=reporter.progress,
+            mode=params.get('mode', 'full'),
+            fine_tune=params.get('fine_tune'),
+            distill=params.get('distill')
+        )
+        reporter.log(f"Training completed: {result['model_path']} ({result['deployment']})", 'success')
+        if result.get('evaluation'):
+            reporter.log(f"Evaluation vs serving model: {result['evaluation']['deltas']}",
+                         'error' if result['evaluation']['regression'] else 'info')
+        reporter.cancelling = False
+        reporter.write(status='completed', is_training=False, progress=100, eta_seconds=0, result=result)
+        return 0
+
+    except TrainingCancelled:
+        reporter.log(f"Training cancelled after epoch {reporter.state['current_epoch']}")
+        reporter.cancelling = False
+        reporter.write(status='cancelled', is_training=False, eta_seconds=None)
+        return 0
+
+    except Exception as e:
+        logger.error(f"Retraining error: {str(e)}")
+        reporter.log(f"Training failed: {str(e)}", 'error')
+        reporter.cancelling = False
+        reporter.write(status='error', is_training=False, eta_seconds=None)
+        return 1
+
+    finally:
+        finished.set()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
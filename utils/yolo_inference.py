@@ -13,9 +13,11 @@ import logging
 logger = logging.getLogger(__name__)
 
 class YOLOInference:
-    def __init__(self, model_path):
-        """Initialize YOLO model"""
-        if not os.path.exists(model_path):
+    def __init__(self, model_path, model=None):
+        """Initialize YOLO model (or wrap an already loaded one)"""
+        if model is not None:
+            self.model = model
+        elif not os.path.exists(model_path):
             logger.warning(f"Model not found at {model_path}, using default YOLOv8n-seg")
             self.model = YOLO('yolov8n-seg.pt')
         else:
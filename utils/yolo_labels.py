@@ -0,0 +1,70 @@
+"""
+YOLO Labels
+Conversion of masks and detections to normalized YOLO-seg polygon lines
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Class ids of data.yaml (names: ['chip', 'hole-JsHt'])
+CLASS_NAMES = ['chip', 'hole-JsHt']
+CLASS_IDS = {'chip': 0, 'chips': 0, 'hole': 1, 'holes': 1, 'hole-JsHt': 1}
+
+
+def class_id(item):
+    """Class id of a mask/detection dict from its class, class_id or label (None if unknown)"""
+    value = item.get('class', item.get('class_id', item.get('label')))
+    if isinstance(value, int) and 0 <= value < len(CLASS_NAMES):
+        return value
+    return CLASS_IDS.get(str(value).strip())
+
+
+def _points(polygon):
+    """[[x, y], ...] or a flat [x1, y1, x2, y2, ...] list as (x, y) tuples"""
+    if polygon and not isinstance(polygon[0], (list, tuple)):
+        if len(polygon) % 2:
+            raise ValueError("odd number of coordinates")
+        polygon = list(zip(polygon[0::2], polygon[1::2]))
+    return [(float(x), float(y)) for x, y in polygon]
+
+
+def polygon_lines(items, image_size):
+    """
+    YOLO-seg label lines ('class x1 y1 x2 y2 ...') for masks or detections
+
+    Each item needs a class and a 'polygon', 'points' or 'mask' of at least
+    3 points, in pixels or already normalized. Items without one (e.g. masks
+    holding only an area and a count) are skipped.
+
+    Args:
+        items: List of mask/detection dicts
+        image_size: (width, height) of the image, for pixel coordinates
+
+    Returns:
+        List of label lines (empty if no item has a polygon)
+    """
+    width, height = image_size
+    lines = []
+    for item in items or []:
+        if not isinstance(item, dict):
+            continue
+        cls = class_id(item)
+        polygon = item.get('polygon') or item.get('points') or item.get('mask')
+        if cls is None or not isinstance(polygon, list):
+            continue
+        try:
+            points = _points(polygon)
+        except (TypeError, ValueError):
+            continue
+        if len(points) < 3:
+            continue
+
+        # masks.xy polygons are in pixels; normalized ones are left as they are
+        if any(x > 1.0 or y > 1.0 for x, y in points):
+            points = [(x / width, y / height) for x, y in points]
+        coords = ' '.join(
+            f"{min(max(x, 0.0), 1.0):.6f} {min(max(y, 0.0), 1.0):.6f}" for x, y in points
+        )
+        lines.append(f"{cls} {coords}")
+    return lines
@@ -14,6 +14,8 @@ from datetime import datetime
 from typing import Dict, List, Tuple
 import torch
 
+from utils.mask_area import MaskAreaEngine
+
 PROJECT_DIR = Path(__file__).parent
 MODELS_DIR = PROJECT_DIR / "models"
 RESULTS_DIR = PROJECT_DIR / "void_rate_results"
@@ -24,16 +26,18 @@ RESULTS_DIR.mkdir(exist_ok=True)
 class VoidRateCalculator:
     """Classe pour calculer le taux de vides"""
     
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, area_mode: str = "mask"):
         """
         Initialiser le calculateur
         
         Args:
             model_path: Chemin vers le modèle YOLOv11 .pt
+            area_mode: Calcul des aires - 'mask' (défaut), 'polygon' ou 'retina'
         """
         self.device = 0 if torch.cuda.is_available() else "cpu"
         self.model = YOLO(model_path, task="segment")
         self.model_path = model_path
+        self.area_engine = MaskAreaEngine(area_mode)
     
     def predict_masks(self, image_path: str, conf_threshold: float = 0.5):
         """
@@ -51,6 +55,7 @@ class VoidRateCalculator:
             conf=conf_threshold,
             device=self.device,
             verbose=False,
+            **self.area_engine.predict_kwargs(),
         )
         return results[0] if results else None
     
@@ -99,8 +104,10 @@ class VoidRateCalculator:
                 'yolo_results': [result] if result else None
             }
         
-        image = cv2.imread(image_path)
-        h, w = image.shape[:2]
+        h, w = result.orig_shape[:2]
+        
+        # Aires en pixels de l'image originale (letterbox compensé)
+        areas = self.area_engine.areas(result)
         
         # Séparation des classes
         chip_area = 0
@@ -109,10 +116,8 @@ class VoidRateCalculator:
         num_holes = 0
         
         # Classes: 0 = chip, 1 = hole
-        for cls, conf, mask in zip(result.boxes.cls, result.boxes.conf, result.masks.data):
+        for cls, mask_area in zip(result.boxes.cls, areas):
             cls = int(cls.item())
-            mask_np = mask.cpu().numpy().astype(np.uint8) * 255
-            mask_area = self.calculate_mask_area(mask_np)
             
             if cls == 0:  # chip
                 chip_area += mask_area
@@ -130,11 +135,12 @@ class VoidRateCalculator:
         result_dict = {
             'image': str(image_path),
             'void_rate': float(void_rate),
-            'hole_area_pixels': int(holes_area),
-            'chip_area_pixels': int(chip_area),
+            'hole_area_pixels': int(round(holes_area)),
+            'chip_area_pixels': int(round(chip_area)),
             'num_holes': int(num_holes),
             'num_chips': int(num_chips),
             'image_resolution': f"{w}x{h}",
+            'area_mode': self.area_engine.mode,
             'confidence_threshold': conf_threshold,
             'yolo_results': [result]  # Include YOLO results for mask generation
         }
@@ -143,8 +149,8 @@ class VoidRateCalculator:
             print(f"\n{'=' * 60}")
             print(f"Image: {Path(image_path).name}")
             print(f"{'=' * 60}")
-            print(f"Aire du composant (chip): {chip_area:,} pixels")
-            print(f"Aire des trous (holes): {holes_area:,} pixels")
+            print(f"Aire du composant (chip): {chip_area:,.0f} pixels")
+            print(f"Aire des trous (holes): {holes_area:,.0f} pixels")
             print(f"Nombre de chips détectés: {num_chips}")
             print(f"Nombre de holes détectés: {num_holes}")
             print(f"TAUX DE VIDES: {void_rate:.2f}%")